@@ -1,20 +1,23 @@
 from __future__ import annotations
 
-from typing import Callable, FrozenSet, List, Optional, Set, Type, TypeVar, Union, TYPE_CHECKING, final
+import dataclasses
+import time
+from dataclasses import dataclass
+from typing import Callable, FrozenSet, Generator, Generic, List, Optional, Set, Type, TypeVar, Union, TYPE_CHECKING, final
 
-from colorama import Fore, Style
-from matplotlib import pyplot
-from tqdm import tqdm
 if TYPE_CHECKING:
+    from tqdm import tqdm
     from typing_extensions import Self
 
 from .costs import BaseCostComparison
 from ..bases import BaseIndividual
+from ...utils import prepare_pyplot, progress_bar
 if TYPE_CHECKING:
     from .solutions import SingleObjectiveSolution
 
 
 __all__ = (
+    "GeneticAlgorithmEvent",
     "SingleObjectiveIndividual",
 )
 
@@ -25,6 +28,31 @@ else:
     _ST = TypeVar("_ST")
 
 
+_IT = TypeVar("_IT", bound="SingleObjectiveIndividual")
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class GeneticAlgorithmEvent(Generic[_IT]):
+    """A progress report of `SingleObjectiveIndividual.genetic_algorithm_iter`
+
+    `result` is the best individual after `generation` completed generations (0 for the initial
+    population), `elapsed` seconds after the algorithm started. `improved` tells whether it
+    improved during that generation. `interrupted` marks the last event of an algorithm stopped
+    by a KeyboardInterrupt during the next generation, whose improvements so far it includes.
+    """
+
+    generation: int
+    elapsed: float
+    improved: bool
+    result: _IT
+    interrupted: bool = False
+
+    @property
+    def solution(self) -> SingleObjectiveSolution[_IT]:
+        """The decoded best solution so far"""
+        return self.result.decode()
+
+
 class SingleObjectiveIndividual(BaseIndividual[_ST], BaseCostComparison):
     """Base class for an individual encoded from a solution to a single-objective optimization problem"""
 
@@ -96,6 +124,29 @@ class SingleObjectiveIndividual(BaseIndividual[_ST], BaseCostComparison):
         """
         return
 
+    @classmethod
+    def after_algorithm_hook(
+        cls,
+        *,
+        result: Self,
+        population: Set[Self],
+        verbose: bool,
+    ) -> None:
+        """A classmethod to be called once the algorithm finishes or is interrupted
+
+        The default implementation does nothing.
+
+        Parameters
+        -----
+        result:
+            The final best individual
+        population:
+            The final population
+        verbose:
+            The verbose mode
+        """
+        return
+
     @classmethod
     def selection(cls, *, population: FrozenSet[Self], size: int) -> Set[Self]:
         """Perform natural selection
@@ -119,7 +170,7 @@ class SingleObjectiveIndividual(BaseIndividual[_ST], BaseCostComparison):
 
     @final
     @classmethod
-    def genetic_algorithm(
+    def genetic_algorithm_iter(
         cls,
         *,
         generations_count: int,
@@ -127,9 +178,14 @@ class SingleObjectiveIndividual(BaseIndividual[_ST], BaseCostComparison):
         population_expansion_limit: int,
         solution_cls: Type[_ST],
         verbose: bool,
-        on_interrupt: Optional[Callable[[Self], Self]] = None,
-    ) -> Self:
-        """Perform genetic algorithm to find a solution with the lowest cost
+        every_generation: bool = False,
+    ) -> Generator[GeneticAlgorithmEvent[Self], None, None]:
+        """Perform genetic algorithm, yielding an event each time the best individual improves
+
+        The first event reports the best individual of the initial population. Closing the
+        generator (e.g. breaking out of a loop over it) stops the algorithm cleanly,
+        `after_algorithm_hook` is called however the generator finishes. A KeyboardInterrupt
+        during a generation ends the iteration with an `interrupted` event.
 
         Parameters
         -----
@@ -141,18 +197,19 @@ class SingleObjectiveIndividual(BaseIndividual[_ST], BaseCostComparison):
             The solution class
         verbose:
             The verbose mode
-        on_interrupt:
-            A function to invoke when the algorithm is interrupted (when handling the
-            KeyboardInterrupt exception). The function takes the current result as the
-            only argument and should return the result of the algorithm.
+        every_generation:
+            Also yield an event after each generation without improvement
 
         Returns
         -----
-        The individual with the lowest cost
+        An iterator over the progress events
         """
+        started = time.perf_counter()
         iterations: Union[range, tqdm[int]] = range(generations_count)
         if verbose:
-            iterations = tqdm(iterations, ascii=" █")
+            from colorama import Fore, Style
+
+            iterations = progress_bar(iterations, ascii=" █")
 
         population = cls.initial(solution_cls=solution_cls, size=population_size, verbose=verbose)
         filtered = tuple(filter(lambda i: i.feasible(), population))
@@ -168,18 +225,21 @@ class SingleObjectiveIndividual(BaseIndividual[_ST], BaseCostComparison):
             raise ValueError(message)
 
         last_improved = 0
-        progress: List[float] = []
-        progress.append(result.cost)
 
         def updater(individual: Self) -> None:
             nonlocal result
             if individual.feasible():
                 result = min(result, individual)
 
-        for iteration in iterations:
-            try:
+        generation = 0
+        reported = result
+        try:
+            yield GeneticAlgorithmEvent(generation=0, elapsed=time.perf_counter() - started, improved=True, result=result)
+
+            for iteration in iterations:
+                generation = iteration
                 current_result = result
-                if isinstance(iterations, tqdm):
+                if not isinstance(iterations, range):
                     prefix = Fore.GREEN if result.feasible() else Fore.RED
                     suffix = Style.RESET_ALL
                     display = f"GA ({prefix}{result.cost:.2f}{suffix})"
@@ -244,20 +304,91 @@ class SingleObjectiveIndividual(BaseIndividual[_ST], BaseCostComparison):
                 if current_result != result:
                     last_improved = iteration
 
-                progress.append(result.cost)
+                generation = iteration + 1
+                if every_generation or current_result != result:
+                    reported = result
+                    yield GeneticAlgorithmEvent(generation=generation, elapsed=time.perf_counter() - started, improved=current_result != result, result=result)
 
-            except KeyboardInterrupt:
-                print(f"Algorithm stopped at iteration #{iteration + 1}")
-                if on_interrupt is not None:
-                    result = on_interrupt(result)
+        except KeyboardInterrupt:
+            # The offspring and the hooks of the interrupted generation may have improved the result
+            yield GeneticAlgorithmEvent(generation=generation, elapsed=time.perf_counter() - started, improved=reported != result, result=result, interrupted=True)
 
-                return result
+        finally:
+            cls.after_algorithm_hook(result=result, population=population, verbose=verbose)
+
+    @final
+    @classmethod
+    def genetic_algorithm(
+        cls,
+        *,
+        generations_count: int,
+        population_size: int,
+        population_expansion_limit: int,
+        solution_cls: Type[_ST],
+        verbose: bool,
+        on_interrupt: Optional[Callable[[Self], Self]] = None,
+    ) -> Self:
+        """Perform genetic algorithm to find a solution with the lowest cost
+
+        This runs `genetic_algorithm_iter` to completion.
+
+        Parameters
+        -----
+        generations_count:
+            The number of generations to run
+        population_size:
+            The size of the population
+        solution_cls:
+            The solution class
+        verbose:
+            The verbose mode
+        on_interrupt:
+            A function to invoke when the algorithm is interrupted (when handling the
+            KeyboardInterrupt exception). The function takes the current result as the
+            only argument and should return the result of the algorithm.
+
+        Returns
+        -----
+        The individual with the lowest cost
+        """
+        events = cls.genetic_algorithm_iter(
+            generations_count=generations_count,
+            population_size=population_size,
+            population_expansion_limit=population_expansion_limit,
+            solution_cls=solution_cls,
+            verbose=verbose,
+            every_generation=True,
+        )
+
+        event = next(events)
+        progress: List[float] = [event.result.cost]
+        try:
+            for event in events:
+                if event.interrupted:
+                    break
+
+                progress.append(event.result.cost)
+
+        except KeyboardInterrupt:
+            # Interrupted between two generations, the last event holds the current result
+            event = dataclasses.replace(event, interrupted=True)
+
+        events.close()
+        if event.interrupted:
+            print(f"Algorithm stopped at iteration #{event.generation + 1}")
+            if on_interrupt is not None:
+                return on_interrupt(event.result)
+
+            return event.result
 
         if verbose:
+            prepare_pyplot()
+            from matplotlib import pyplot
+
             pyplot.plot(progress)
             pyplot.xlabel("Generations")
             pyplot.ylabel("Cost")
             pyplot.show()
             pyplot.close()
 
-        return result
+        return event.result
@@ -9,13 +9,31 @@
 #include "jaccard_distance.hpp"
 #include "lru_cache.hpp"
 #include "maximum_flow.hpp"
+#include "nearest_neighbors.hpp"
 #include "smallest_circle.hpp"
 #include "tsp_solver.hpp"
 #include "weighted_random.hpp"
 
 namespace py = pybind11;
 
-typedef lru_cache<py::object, py::object> py_lru_cache;
+/** Hash and compare keys the way a dict does, `py::object` itself compares by identity */
+struct py_hash
+{
+    std::size_t operator()(const py::object &value) const
+    {
+        return py::hash(value);
+    }
+};
+
+struct py_equal
+{
+    bool operator()(const py::object &first, const py::object &second) const
+    {
+        return first.equal(second);
+    }
+};
+
+typedef lru_cache<py::object, py::object, py_hash, py_equal> py_lru_cache;
 
 PYBIND11_MODULE(cpp_utils, m)
 {
@@ -41,9 +59,51 @@ PYBIND11_MODULE(cpp_utils, m)
         .def_readonly("hit", &py_lru_cache::hit)
         .def_readonly("miss", &py_lru_cache::miss)
         .def_readonly("cached", &py_lru_cache::cached)
-        .def(py::init<unsigned>(), py::arg("capacity"))
+        .def_readonly("rejected", &py_lru_cache::rejected)
+        .def_readonly("ghost_hit", &py_lru_cache::ghost_hit)
+        .def_readonly("bytes", &py_lru_cache::bytes)
+        .def_property(
+            "memory",
+            [](py_lru_cache &self)
+            {
+                return self.memory;
+            },
+            &py_lru_cache::resize)
+        .def_property_readonly(
+            "policy",
+            [](py_lru_cache &self)
+            {
+                return cache_policy_name(self.policy());
+            })
+        .def(
+            py::init(
+                [](unsigned capacity, std::size_t memory, const std::optional<py::function> &sizeof_, const std::string &policy, const std::optional<py::function> &on_evict)
+                {
+                    auto cache = std::make_unique<py_lru_cache>(capacity, parse_cache_policy(policy));
+                    if (on_evict.has_value())
+                    {
+                        cache->on_evict = [on_evict](const py::object &key, const py::object &value)
+                        {
+                            (*on_evict)(key, value);
+                        };
+                    }
+
+                    auto getsizeof = py::module_::import("sys").attr("getsizeof");
+                    cache->sizer = [getsizeof, sizeof_](const py::object &key, const py::object &value)
+                    {
+                        auto size = sizeof_.has_value() ? (*sizeof_)(key, value) : getsizeof(key) + getsizeof(value);
+                        return py::cast<std::size_t>(size) + 3 * sizeof(py::object) + py_lru_cache::entry_overhead;
+                    };
+                    cache->resize(memory);
+                    return cache;
+                }),
+            py::arg("capacity"), py::kw_only(), py::arg("memory") = 0, py::arg("sizeof") = std::nullopt, py::arg("policy") = "lru", py::arg("on_evict") = std::nullopt)
         .def("get", &py_lru_cache::get, py::arg("key"))
+        .def("get_many", &py_lru_cache::get_many, py::arg("keys"))
+        .def("peek", &py_lru_cache::peek, py::arg("key"))
         .def("set", &py_lru_cache::set, py::arg("key"), py::arg("value"))
+        .def("set_many", &py_lru_cache::set_many, py::arg("items"))
+        .def("trace", &py_lru_cache::trace, py::arg("path"))
         .def("to_json", &py_lru_cache::to_json)
         .def(
             "items",
@@ -75,7 +135,7 @@ PYBIND11_MODULE(cpp_utils, m)
             "__contains__",
             [](py_lru_cache &self, const py::object &key)
             {
-                return self.get(key).has_value();
+                return self.contains(key);
             },
             py::arg("key"))
         .def(
@@ -91,6 +151,10 @@ PYBIND11_MODULE(cpp_utils, m)
                 return py::make_key_iterator(self.map_cbegin(), self.map_cend());
             });
 
+    m.def(
+        "k_nearest_neighbors", &k_nearest_neighbors,
+        py::arg("points"), py::kw_only(), py::arg("k"),
+        py::call_guard<py::gil_scoped_release>());
     m.def(
         "maximum_flow", &maximum_flow,
         py::kw_only(), py::arg("size"), py::arg("capacities"), py::arg("neighbors"), py::arg("source"), py::arg("sink"),
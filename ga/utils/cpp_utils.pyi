@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-from typing import AbstractSet, Generic, Hashable, Iterator, List, Optional, Sequence, Set, Tuple, TypeVar
+from typing import AbstractSet, Callable, Generic, Hashable, Iterator, List, Optional, Sequence, Set, Tuple, TypeVar
 
-from .py_utils import LRUCacheInfo
+from .py_utils import CachePolicy, LRUCacheInfo
 
 
 __all__ = (
@@ -11,6 +11,7 @@ __all__ = (
     "flows_with_demands",
     "jaccard_distance",
     "LRUCache",
+    "k_nearest_neighbors",
     "maximum_flow",
     "smallest_circle",
     "tsp_solver",
@@ -52,10 +53,20 @@ class LRUCache(Generic[KT, VT]):
     hit: int
     miss: int
     cached: int
-
-    def __init__(self, capacity: int) -> None: ...
+    rejected: int
+    ghost_hit: int
+    bytes: int
+    memory: int
+    @property
+    def policy(self) -> CachePolicy: ...
+
+    def __init__(self, capacity: int, *, memory: int = 0, sizeof: Optional[Callable[[KT, VT], int]] = None, policy: CachePolicy = "lru", on_evict: Optional[Callable[[KT, VT], None]] = None) -> None: ...
     def get(self, key: KT) -> Optional[VT]: ...
+    def get_many(self, keys: Sequence[KT]) -> List[Optional[VT]]: ...
+    def peek(self, key: KT) -> Optional[VT]: ...
     def set(self, key: KT, value: VT) -> None: ...
+    def set_many(self, items: Sequence[Tuple[KT, VT]]) -> None: ...
+    def trace(self, path: Optional[str]) -> None: ...
     def to_json(self) -> LRUCacheInfo: ...
     def items(self) -> Iterator[Tuple[KT, VT]]: ...
     def __getitem__(self, key: KT) -> VT: ...
@@ -65,6 +76,9 @@ class LRUCache(Generic[KT, VT]):
     def __iter__(self) -> Iterator[KT]: ...
 
 
+def k_nearest_neighbors(points: Sequence[Tuple[float, float]], *, k: int) -> List[List[int]]: ...
+
+
 def maximum_flow(
     *,
     size: int,
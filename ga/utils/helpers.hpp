@@ -41,14 +41,15 @@ public:
     }
 };
 
+/** Measures wall-clock time with a steady clock, so that time spent waiting for other threads counts */
 class Timer
 {
 private:
     const double _limit;
-    const double _start;
+    const std::chrono::steady_clock::time_point _start;
 
 public:
-    Timer(const double seconds_limit) : _limit(seconds_limit), _start((double)std::clock() / (double)CLOCKS_PER_SEC) {}
+    Timer(const double seconds_limit) : _limit(seconds_limit), _start(std::chrono::steady_clock::now()) {}
 
     bool timeup() const
     {
@@ -57,7 +58,7 @@ public:
 
     double elapsed() const
     {
-        return (double)std::clock() / (double)CLOCKS_PER_SEC - _start;
+        return std::chrono::duration<double>(std::chrono::steady_clock::now() - _start).count();
     }
 };
 
@@ -1,11 +1,22 @@
 #pragma once
 
+#include <algorithm>
+#include <chrono>
+#include <cstddef>
+#include <cstdint>
+#include <cstdio>
+#include <cstring>
+#include <functional>
 #include <list>
 #include <map>
+#include <memory>
 #include <optional>
+#include <set>
+#include <stdexcept>
 #include <string>
 #include <type_traits>
 #include <unordered_map>
+#include <vector>
 
 namespace std
 {
@@ -21,25 +32,631 @@ namespace std
     };
 };
 
+/** Approximate heap and inline bytes held by a value, the overloads are declared first so that they can call each other */
+template <typename T>
+std::size_t approximate_size(const T &value);
+
+template <typename T1, typename T2>
+std::size_t approximate_size(const std::pair<T1, T2> &value);
+
+template <typename T>
+std::size_t approximate_size(const std::optional<T> &value);
+
+template <typename T>
+std::size_t approximate_size(const std::vector<T> &value);
+
+template <typename T>
+std::size_t approximate_size(const std::set<T> &value);
+
 template <typename K, typename V>
+std::size_t approximate_size(const std::map<K, V> &value);
+
+template <typename T>
+std::size_t approximate_size(const T &value)
+{
+    return sizeof(value);
+}
+
+template <typename T1, typename T2>
+std::size_t approximate_size(const std::pair<T1, T2> &value)
+{
+    return approximate_size(value.first) + approximate_size(value.second) + sizeof(value) - sizeof(T1) - sizeof(T2);
+}
+
+template <typename T>
+std::size_t approximate_size(const std::optional<T> &value)
+{
+    return value.has_value() ? approximate_size(*value) + sizeof(value) - sizeof(T) : sizeof(value);
+}
+
+template <typename T>
+std::size_t approximate_size(const std::vector<T> &value)
+{
+    auto result = sizeof(value) + (value.capacity() - value.size()) * sizeof(T);
+    for (const auto &element : value)
+    {
+        result += approximate_size(element);
+    }
+
+    return result;
+}
+
+template <typename T>
+std::size_t approximate_size(const std::set<T> &value)
+{
+    // Each red-black tree node holds 3 pointers and a color besides the element
+    auto result = sizeof(value) + value.size() * 4 * sizeof(void *);
+    for (const auto &element : value)
+    {
+        result += approximate_size(element);
+    }
+
+    return result;
+}
+
+template <typename K, typename V>
+std::size_t approximate_size(const std::map<K, V> &value)
+{
+    auto result = sizeof(value) + value.size() * 4 * sizeof(void *);
+    for (const auto &element : value)
+    {
+        result += approximate_size(element);
+    }
+
+    return result;
+}
+
+/** Hash of a value for the frequency sketch, with overloads for the containers lacking `std::hash` */
+template <typename T>
+std::size_t hash_value(const T &value);
+
+template <typename T1, typename T2>
+std::size_t hash_value(const std::pair<T1, T2> &value);
+
+template <typename T>
+std::size_t hash_value(const std::optional<T> &value);
+
+template <typename T>
+std::size_t hash_value(const std::vector<T> &value);
+
+template <typename T>
+std::size_t hash_value(const std::set<T> &value);
+
+inline std::size_t __hash_combine(std::size_t seed, std::size_t hash)
+{
+    return seed ^ (hash + 0x9e3779b97f4a7c15ULL + (seed << 6) + (seed >> 2));
+}
+
+template <typename T>
+std::size_t hash_value(const T &value)
+{
+    return std::hash<T>()(value);
+}
+
+template <typename T1, typename T2>
+std::size_t hash_value(const std::pair<T1, T2> &value)
+{
+    return __hash_combine(hash_value(value.first), hash_value(value.second));
+}
+
+template <typename T>
+std::size_t hash_value(const std::optional<T> &value)
+{
+    return value.has_value() ? __hash_combine(1, hash_value(*value)) : 0;
+}
+
+template <typename T>
+std::size_t hash_value(const std::vector<T> &value)
+{
+    std::size_t seed = value.size();
+    for (const auto &element : value)
+    {
+        seed = __hash_combine(seed, hash_value(element));
+    }
+
+    return seed;
+}
+
+template <typename T>
+std::size_t hash_value(const std::set<T> &value)
+{
+    std::size_t seed = value.size();
+    for (const auto &element : value)
+    {
+        seed = __hash_combine(seed, hash_value(element));
+    }
+
+    return seed;
+}
+
+/**
+ * Eviction policies of `lru_cache`:
+ * - lru: evict the least recently used entry
+ * - clock: a hit only sets a reference bit, referenced entries get a second chance before eviction
+ * - slru: entries hit while probationary are protected, only probationary entries are evicted
+ *   while the protected segment stays within its share
+ * - tinylfu: evict in LRU order, but only admit a new entry if it was requested more often than
+ *   the entry it would evict, according to a count-min sketch of recent request frequencies
+ */
+enum class cache_policy
+{
+    lru,
+    clock,
+    slru,
+    tinylfu,
+};
+
+cache_policy parse_cache_policy(const std::string &name)
+{
+    if (name == "lru")
+    {
+        return cache_policy::lru;
+    }
+    if (name == "clock")
+    {
+        return cache_policy::clock;
+    }
+    if (name == "slru")
+    {
+        return cache_policy::slru;
+    }
+    if (name == "tinylfu")
+    {
+        return cache_policy::tinylfu;
+    }
+
+    throw std::invalid_argument("Unknown cache policy \"" + name + "\"");
+}
+
+std::string cache_policy_name(cache_policy policy)
+{
+    switch (policy)
+    {
+    case cache_policy::clock:
+        return "clock";
+    case cache_policy::slru:
+        return "slru";
+    case cache_policy::tinylfu:
+        return "tinylfu";
+    default:
+        return "lru";
+    }
+}
+
+/** Count-min sketch of 4-bit request counters, halved periodically so that old requests fade */
+class frequency_sketch
+{
+private:
+    static constexpr unsigned _depth = 4;
+    static constexpr std::uint64_t _seeds[_depth] = {0xc3a5c85c97cb3127ULL, 0xb492b66fbe98f273ULL, 0x9ae16a3b2f90404fULL, 0xcbf29ce484222325ULL};
+
+    std::vector<std::uint8_t> _counters;
+    std::size_t _mask = 0, _additions = 0;
+
+    std::size_t _index(std::size_t hash, unsigned row) const
+    {
+        // splitmix64 finalizer, so that rows are independent even for identity hashes of small integers
+        std::uint64_t x = hash + _seeds[row];
+        x = (x ^ (x >> 30)) * 0xbf58476d1ce4e5b9ULL;
+        x = (x ^ (x >> 27)) * 0x94d049bb133111ebULL;
+        x ^= x >> 31;
+        return row * (_mask + 1) + (x & _mask);
+    }
+
+public:
+    void reset(std::size_t entries)
+    {
+        std::size_t width = 64;
+        while (width < 4 * entries && width < (1u << 18))
+        {
+            width <<= 1;
+        }
+
+        _counters.assign(_depth * width, 0);
+        _mask = width - 1;
+        _additions = 0;
+    }
+
+    void add(std::size_t hash)
+    {
+        for (unsigned row = 0; row < _depth; row++)
+        {
+            auto &counter = _counters[_index(hash, row)];
+            counter = std::min<std::uint8_t>(counter + 1, 15);
+        }
+
+        if (++_additions >= 10 * (_mask + 1))
+        {
+            for (auto &counter : _counters)
+            {
+                counter >>= 1;
+            }
+
+            _additions /= 2;
+        }
+    }
+
+    unsigned frequency(std::size_t hash) const
+    {
+        unsigned result = 15;
+        for (unsigned row = 0; row < _depth; row++)
+        {
+            result = std::min<unsigned>(result, _counters[_index(hash, row)]);
+        }
+
+        return result;
+    }
+};
+
+/**
+ * Binary log of the requests to a cache, replayed by `scripts/cache-simulator.py`.
+ *
+ * The file starts with the magic bytes "GATRACE1", followed by 12-byte little-endian records of
+ * a 64-bit key hash and a 32-bit value: 0xFFFFFFFF for a lookup, otherwise an insertion with the
+ * microseconds elapsed since the lookup of the same key missed (0 if it was not looked up).
+ */
+class cache_trace
+{
+private:
+    std::FILE *_file;
+    std::unordered_map<std::uint64_t, std::chrono::steady_clock::time_point> _pending;
+
+    void _write(std::uint64_t key, std::uint32_t value)
+    {
+        char record[12];
+        std::memcpy(record, &key, 8);
+        std::memcpy(record + 8, &value, 4);
+        std::fwrite(record, 1, 12, _file);
+    }
+
+public:
+    static constexpr std::uint32_t lookup = 0xFFFFFFFF;
+
+    cache_trace(const std::string &path) : _file(std::fopen(path.c_str(), "wb"))
+    {
+        if (_file == nullptr)
+        {
+            throw std::runtime_error("Cannot open cache trace \"" + path + "\"");
+        }
+
+        std::fwrite("GATRACE1", 1, 8, _file);
+    }
+
+    cache_trace(const cache_trace &) = delete;
+    cache_trace &operator=(const cache_trace &) = delete;
+
+    ~cache_trace()
+    {
+        std::fclose(_file);
+    }
+
+    void get(std::uint64_t key, bool hit)
+    {
+        _write(key, lookup);
+        if (!hit)
+        {
+            if (_pending.size() > 100000) // lookups that were never followed by an insertion
+            {
+                _pending.clear();
+            }
+
+            _pending[key] = std::chrono::steady_clock::now();
+        }
+    }
+
+    void set(std::uint64_t key)
+    {
+        std::uint32_t cost = 0;
+        auto iter = _pending.find(key);
+        if (iter != _pending.end())
+        {
+            auto elapsed = std::chrono::duration_cast<std::chrono::microseconds>(std::chrono::steady_clock::now() - iter->second).count();
+            cost = std::min<std::int64_t>(std::max<std::int64_t>(elapsed, 1), lookup - 1);
+            _pending.erase(iter);
+        }
+
+        _write(key, cost);
+    }
+};
+
+/** Least recently used cache by default, hashed when `Hash` is given or `std::hash<K>` exists and ordered otherwise */
+template <typename K, typename V, typename Hash = std::hash<K>, typename KeyEqual = std::equal_to<K>>
 class lru_cache
 {
 private:
-    std::list<std::pair<K, V>> _items_list;
+    static constexpr bool _hashed = std::is_hashable<K>::value || !std::is_same<Hash, std::hash<K>>::value;
+
+    typedef typename std::list<std::pair<K, V>>::iterator list_iterator;
+
+    struct entry
+    {
+        list_iterator position;
+        std::size_t size;
+        bool referenced, protected_;
+    };
+
     typedef typename std::conditional<
-        std::is_hashable<K>::value,
-        std::unordered_map<K, typename std::list<std::pair<K, V>>::iterator>,
-        std::map<K, typename std::list<std::pair<K, V>>::iterator>>::type map_t;
+        _hashed,
+        std::unordered_map<K, entry, Hash, KeyEqual>,
+        std::map<K, entry>>::type map_t;
 
+    typedef typename std::list<std::pair<K, std::size_t>>::iterator ghost_iterator;
+    typedef typename std::conditional<
+        _hashed,
+        std::unordered_map<K, ghost_iterator, Hash, KeyEqual>,
+        std::map<K, ghost_iterator>>::type ghost_map_t;
+
+    // Most recent entries first. Under SLRU, the protected segment precedes `_boundary`, the
+    // probationary segment starts at `_boundary`.
+    std::list<std::pair<K, V>> _items_list;
     map_t _items_map;
+    list_iterator _boundary = _items_list.end();
+    std::size_t _protected_count = 0, _protected_bytes = 0;
+
+    cache_policy _policy;
+    frequency_sketch _sketch;
+    std::unique_ptr<cache_trace> _trace;
+
+    // Keys of the entries evicted most recently, up to `ghost_fraction` of the memory budget: a miss
+    // on one of them would have been a hit with that much more memory
+    std::list<std::pair<K, std::size_t>> _ghost_list;
+    ghost_map_t _ghost_map;
+    std::size_t _ghost_bytes = 0;
+
+    static std::size_t _hash(const K &key)
+    {
+        if constexpr (_hashed)
+        {
+            return Hash()(key);
+        }
+        else
+        {
+            return hash_value(key);
+        }
+    }
+
+    void _forget_ghost(typename ghost_map_t::iterator ghost_iter)
+    {
+        _ghost_bytes -= ghost_iter->second->second;
+        _ghost_list.erase(ghost_iter->second);
+        _ghost_map.erase(ghost_iter);
+    }
+
+    bool _over_budget(std::size_t extra_count, std::size_t extra_bytes) const
+    {
+        return _items_map.size() + extra_count > capacity || (memory > 0 && bytes + extra_bytes > memory);
+    }
+
+    /** The entry to evict next, CLOCK clears the reference bits it passes */
+    typename map_t::iterator _victim()
+    {
+        auto map_iter = _items_map.find(std::prev(_items_list.end())->first);
+        if (_policy == cache_policy::clock)
+        {
+            while (map_iter->second.referenced)
+            {
+                map_iter->second.referenced = false;
+                _items_list.splice(_items_list.begin(), _items_list, map_iter->second.position);
+                map_iter = _items_map.find(std::prev(_items_list.end())->first);
+            }
+        }
+
+        return map_iter;
+    }
+
+    void _erase(typename map_t::iterator map_iter)
+    {
+        auto &info = map_iter->second;
+        bytes -= info.size;
+        if (info.protected_)
+        {
+            _protected_count--;
+            _protected_bytes -= info.size;
+        }
+
+        if (info.position == _boundary)
+        {
+            _boundary++;
+        }
+
+        _items_list.erase(info.position);
+        _items_map.erase(map_iter);
+    }
+
+    void _evict()
+    {
+        while (!_items_map.empty() && _over_budget(0, 0))
+        {
+            auto map_iter = _victim();
+            if (memory > 0)
+            {
+                _ghost_list.emplace_front(map_iter->first, map_iter->second.size);
+                _ghost_map[map_iter->first] = _ghost_list.begin();
+                _ghost_bytes += map_iter->second.size;
+            }
+
+            if (on_evict)
+            {
+                auto evicted = *map_iter->second.position;
+                _erase(map_iter);
+                on_evict(evicted.first, evicted.second);
+            }
+            else
+            {
+                _erase(map_iter);
+            }
+        }
+
+        while (_ghost_bytes > memory / ghost_fraction)
+        {
+            _forget_ghost(_ghost_map.find(std::prev(_ghost_list.end())->first));
+        }
+    }
+
+    /** Move the protected entries beyond the protected share to the front of the probationary segment */
+    void _demote()
+    {
+        while (_protected_count > 0 && (_protected_count > protected_share * capacity || (memory > 0 && _protected_bytes > protected_share * memory)))
+        {
+            _boundary--;
+            auto &info = _items_map.find(_boundary->first)->second;
+            info.protected_ = false;
+            _protected_count--;
+            _protected_bytes -= info.size;
+        }
+    }
+
+    void _promote(entry &info)
+    {
+        switch (_policy)
+        {
+        case cache_policy::clock:
+            info.referenced = true;
+            break;
+
+        case cache_policy::slru:
+            if (info.position == _boundary)
+            {
+                _boundary++;
+            }
+
+            _items_list.splice(_items_list.begin(), _items_list, info.position);
+            if (!info.protected_)
+            {
+                info.protected_ = true;
+                _protected_count++;
+                _protected_bytes += info.size;
+                _demote();
+            }
+
+            break;
+
+        default:
+            _items_list.splice(_items_list.begin(), _items_list, info.position);
+        }
+    }
+
+    std::optional<V> _get(const K &key)
+    {
+        if (_policy == cache_policy::tinylfu)
+        {
+            _sketch.add(_hash(key));
+        }
+
+        auto map_iter = _items_map.find(key);
+        if (_trace)
+        {
+            _trace->get(_hash(key), map_iter != _items_map.end());
+        }
+
+        if (map_iter == _items_map.end())
+        {
+            miss++;
+            if (!_ghost_map.empty() && _ghost_map.count(key))
+            {
+                ghost_hit++;
+            }
+
+            return std::nullopt;
+        }
+
+        hit++;
+        _promote(map_iter->second);
+        return map_iter->second.position->second;
+    }
+
+    void _set(const K &key, const V &value)
+    {
+        cached++;
+        if (_trace)
+        {
+            _trace->set(_hash(key));
+        }
+
+        auto size = sizer(key, value);
+        auto map_iter = _items_map.find(key);
+        if (map_iter != _items_map.end())
+        {
+            // Already in cache
+            auto &info = map_iter->second;
+            bytes += size - info.size;
+            if (info.protected_)
+            {
+                _protected_bytes += size - info.size;
+            }
+
+            info.size = size;
+            info.position->second = value;
+            _promote(info);
+            _evict();
+            return;
+        }
+
+        if (!_ghost_map.empty())
+        {
+            auto ghost_iter = _ghost_map.find(key);
+            if (ghost_iter != _ghost_map.end())
+            {
+                _forget_ghost(ghost_iter);
+            }
+        }
+
+        if (_policy == cache_policy::tinylfu)
+        {
+            auto hash = _hash(key);
+            _sketch.add(hash);
+            if (!_items_map.empty() && _over_budget(1, size) && _sketch.frequency(hash) <= _sketch.frequency(_hash(_victim()->first)))
+            {
+                rejected++;
+                return;
+            }
+        }
+
+        bytes += size;
+        auto position = _items_list.emplace(_policy == cache_policy::slru ? _boundary : _items_list.begin(), key, value);
+        if (_policy == cache_policy::slru)
+        {
+            _boundary = position;
+        }
+
+        _items_map.emplace(key, entry{position, size, false, false});
+        _evict();
+    }
 
 public:
+    static const unsigned ghost_fraction = 8;
+
+    /** Bytes of the list and map nodes of an entry besides its key and value */
+    static constexpr std::size_t entry_overhead = 4 * sizeof(void *) + sizeof(entry);
+
+    /** Share of the capacity and memory budget reserved for the protected segment of SLRU */
+    static constexpr double protected_share = 0.8;
+
+    /** Approximate bytes of an entry, the key is stored in both the list and the map */
+    std::function<std::size_t(const K &, const V &)> sizer = [](const K &key, const V &value)
+    {
+        return 2 * approximate_size(key) + approximate_size(value) + entry_overhead;
+    };
+
+    /** Called with each evicted entry after its removal, it must not modify this cache */
+    std::function<void(const K &, const V &)> on_evict;
+
     unsigned capacity,
         hit = 0,
         miss = 0,
-        cached = 0;
+        cached = 0,
+        rejected = 0,
+        ghost_hit = 0;
+    std::size_t memory = 0, // byte budget, 0 for no budget
+        bytes = 0;
+
+    lru_cache(unsigned capacity, cache_policy policy = cache_policy::lru) : _policy(policy), capacity(capacity)
+    {
+        _sketch.reset(_policy == cache_policy::tinylfu ? capacity : 0);
+    }
 
-    lru_cache(unsigned capacity) : capacity(capacity) {}
+    lru_cache(const lru_cache &) = delete;
+    lru_cache &operator=(const lru_cache &) = delete;
 
     typename map_t::const_iterator map_cbegin()
     {
@@ -63,48 +680,79 @@ public:
 
     std::optional<V> get(const K &key)
     {
-        // Fetch iterator
+        return _get(key);
+    }
+
+    std::vector<std::optional<V>> get_many(const std::vector<K> &keys)
+    {
+        std::vector<std::optional<V>> result;
+        result.reserve(keys.size());
+        for (const auto &key : keys)
+        {
+            result.push_back(_get(key));
+        }
+
+        return result;
+    }
+
+    /** Look up `key` without promoting it or counting a hit or miss */
+    std::optional<V> peek(const K &key) const
+    {
         auto map_iter = _items_map.find(key);
         if (map_iter == _items_map.end())
         {
-            miss++;
             return std::nullopt;
         }
 
-        hit++;
-
-        // Move to front
-        auto list_iter = map_iter->second;
-        auto kv_pair = *list_iter;
-        _items_list.erase(list_iter);
-        _items_list.push_front(kv_pair);
-        _items_map[key] = _items_list.begin();
+        return map_iter->second.position->second;
+    }
 
-        return kv_pair.second;
+    /** Whether `key` is cached, without promoting it or counting a hit or miss */
+    bool contains(const K &key) const
+    {
+        return _items_map.count(key) > 0;
     }
 
     void set(const K &key, const V &value)
     {
-        cached++;
+        _set(key, value);
+    }
 
-        auto map_iter = _items_map.find(key);
-        if (map_iter != _items_map.end())
+    void set_many(const std::vector<std::pair<K, V>> &items)
+    {
+        for (const auto &[key, value] : items)
         {
-            // Already in cache
-            auto list_iter = map_iter->second;
-            _items_list.erase(list_iter);
+            _set(key, value);
         }
+    }
 
-        _items_list.push_front(std::make_pair(key, value));
-        _items_map[key] = _items_list.begin();
+    /** Start logging the requests to a `cache_trace` at `path`, or stop if it is empty */
+    void trace(const std::optional<std::string> &path)
+    {
+        _trace.reset();
+        if (path.has_value())
+        {
+            _trace = std::make_unique<cache_trace>(*path);
+        }
+    }
+
+    /** Change the byte budget, evicting entries if it shrinks */
+    void resize(std::size_t memory)
+    {
+        this->memory = memory;
+        if (memory == 0)
+        {
+            _ghost_list.clear();
+            _ghost_map.clear();
+            _ghost_bytes = 0;
+        }
 
-        while (_items_map.size() > capacity)
+        if (_policy == cache_policy::slru)
         {
-            auto last = _items_list.end();
-            last--;
-            _items_map.erase(last->first);
-            _items_list.pop_back();
+            _demote();
         }
+
+        _evict();
     }
 
     unsigned size()
@@ -112,21 +760,42 @@ public:
         return _items_map.size();
     }
 
+    cache_policy policy() const
+    {
+        return _policy;
+    }
+
     void clear()
     {
-        hit = miss = cached = 0;
+        hit = miss = cached = rejected = ghost_hit = 0;
+        bytes = _ghost_bytes = _protected_count = _protected_bytes = 0;
         _items_list.clear();
         _items_map.clear();
+        _boundary = _items_list.end();
+        _ghost_list.clear();
+        _ghost_map.clear();
+        _sketch.reset(_policy == cache_policy::tinylfu ? capacity : 0);
     }
 
-    std::map<std::string, unsigned> to_json()
+    /** Clear the cache and switch to another eviction policy */
+    void clear(cache_policy policy)
     {
-        std::map<std::string, unsigned> json;
+        _policy = policy;
+        clear();
+    }
+
+    std::map<std::string, std::size_t> to_json()
+    {
+        std::map<std::string, std::size_t> json;
         json["capacity"] = capacity;
+        json["memory"] = memory;
+        json["bytes"] = bytes;
         json["hit"] = hit;
         json["miss"] = miss;
         json["cached"] = cached;
+        json["rejected"] = rejected;
+        json["ghost_hit"] = ghost_hit;
 
         return json;
     }
-};
\ No newline at end of file
+};
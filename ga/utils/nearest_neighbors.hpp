@@ -0,0 +1,100 @@
+#pragma once
+
+#include <algorithm>
+#include <cmath>
+#include <queue>
+#include <vector>
+
+#include "helpers.hpp"
+
+std::vector<std::vector<unsigned>> k_nearest_neighbors(const std::vector<std::pair<double, double>> &points, const unsigned k)
+{
+    unsigned n = points.size();
+    std::vector<std::vector<unsigned>> result(n);
+    if (n < 2 || k == 0)
+    {
+        return result;
+    }
+
+    unsigned limit = std::min(k, n - 1);
+
+    // Uniform grid with about 2 points per cell
+    double min_x = points[0].first, max_x = points[0].first, min_y = points[0].second, max_y = points[0].second;
+    for (auto &[x, y] : points)
+    {
+        min_x = std::min(min_x, x);
+        max_x = std::max(max_x, x);
+        min_y = std::min(min_y, y);
+        max_y = std::max(max_y, y);
+    }
+
+    unsigned side = std::max(1u, (unsigned)std::ceil(std::sqrt(n / 2.0)));
+    double cell_w = std::max((max_x - min_x) / side, 1.0e-9),
+           cell_h = std::max((max_y - min_y) / side, 1.0e-9),
+           cell_min = std::min(cell_w, cell_h);
+
+    auto cell_of = [&](const std::pair<double, double> &point)
+    {
+        unsigned cx = std::min(side - 1, (unsigned)((point.first - min_x) / cell_w)),
+                 cy = std::min(side - 1, (unsigned)((point.second - min_y) / cell_h));
+        return std::make_pair(cx, cy);
+    };
+
+    std::vector<std::vector<unsigned>> cells(side * side);
+    for (unsigned i = 0; i < n; i++)
+    {
+        auto [cx, cy] = cell_of(points[i]);
+        cells[cx * side + cy].push_back(i);
+    }
+
+    for (unsigned i = 0; i < n; i++)
+    {
+        auto [cx, cy] = cell_of(points[i]);
+
+        // Max-heap of the best candidates so far
+        std::priority_queue<std::pair<double, unsigned>> heap;
+        for (unsigned ring = 0; ring < side; ring++)
+        {
+            // Points in this ring and beyond are at least (ring - 1) cells away
+            if (ring > 0 && heap.size() == limit && (ring - 1) * cell_min >= std::sqrt(heap.top().first))
+            {
+                break;
+            }
+
+            int lx = (int)cx - (int)ring, hx = (int)cx + (int)ring,
+                ly = (int)cy - (int)ring, hy = (int)cy + (int)ring;
+            for (int x = std::max(lx, 0); x <= std::min(hx, (int)side - 1); x++)
+            {
+                for (int y = std::max(ly, 0); y <= std::min(hy, (int)side - 1); y++)
+                {
+                    if (x != lx && x != hx && y != ly && y != hy)
+                    {
+                        continue; // Inner cells were visited in previous rings
+                    }
+
+                    for (auto j : cells[x * side + y])
+                    {
+                        if (j != i)
+                        {
+                            double dx = points[i].first - points[j].first, dy = points[i].second - points[j].second;
+                            heap.emplace(dx * dx + dy * dy, j);
+                            if (heap.size() > limit)
+                            {
+                                heap.pop();
+                            }
+                        }
+                    }
+                }
+            }
+        }
+
+        result[i].resize(heap.size());
+        for (unsigned index = heap.size(); index > 0; index--)
+        {
+            result[i][index - 1] = heap.top().second;
+            heap.pop();
+        }
+    }
+
+    return result;
+}
@@ -1,22 +1,59 @@
 from __future__ import annotations
 
+import contextlib
+import json
 import math
-from typing import Any, Final, Iterable, Iterator, Optional, Sequence, Set, TypeVar, TypedDict, Union, TYPE_CHECKING, overload
-
-import tqdm
+import os
+import queue
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+from array import array
+from typing import Any, BinaryIO, Callable, ClassVar, Dict, Final, Iterable, Iterator, List, Literal, Mapping, Optional, Sequence, Set, TextIO, Tuple, TypeVar, TypedDict, Union, TYPE_CHECKING, overload
 
 from .cpp_utils import weighted_random
+if TYPE_CHECKING:
+    from tqdm import tqdm
+
+
+__all__ = (
+    "CachePolicy",
+    "LogFormat",
+    "LRUCacheInfo",
+    "isclose",
+    "parse_size",
+    "positive_max",
+    "prepare_pyplot",
+    "progress_bar",
+    "read_log",
+    "resident_memory",
+    "value",
+    "weighted_random_choice",
+    "weird_round",
+    "LogSink",
+    "MemoryBudget",
+    "SizeMonitoredSet",
+    "TelemetryServer",
+)
+_T = TypeVar("_T")
 
 
-__all__ = ("LRUCacheInfo", "isclose", "positive_max", "value", "weighted_random_choice", "weird_round", "SizeMonitoredSet")
-_T = TypeVar("_T")
+CachePolicy = Literal["lru", "clock", "slru", "tinylfu"]
+LogFormat = Literal["csv", "jsonl", "binary"]
 
 
 class LRUCacheInfo(TypedDict):
-    max_size: Optional[int]
+    capacity: int
+    memory: int
+    bytes: int
     hit: int
     miss: int
     cached: int
+    rejected: int
+    ghost_hit: int
 
 
 @overload
@@ -74,6 +111,16 @@ def isclose(first: Any, second: Any, /) -> bool:
         return abs(first - second) < 0.0001
 
 
+def parse_size(size: str, /) -> int:
+    """Parse a byte count with an optional binary suffix, e.g. `512M` or `4G`"""
+    units = {"K": 2 ** 10, "M": 2 ** 20, "G": 2 ** 30, "T": 2 ** 40}
+    size = size.strip().upper().removesuffix("B")
+    if size[-1:] in units:
+        return int(float(size[:-1]) * units[size[-1]])
+
+    return int(size)
+
+
 def positive_max(*values: Union[float, Iterable[float]]) -> float:
     result = 0.0
     for value in values:
@@ -85,6 +132,69 @@ def positive_max(*values: Union[float, Iterable[float]]) -> float:
     return result
 
 
+def prepare_pyplot() -> None:
+    """Prepare matplotlib before the first import of `matplotlib.pyplot`
+
+    Without a display (and without an explicit `MPLBACKEND`), the non-interactive
+    Agg backend is forced so that pyplot never attempts to load a GUI toolkit.
+    matplotlib itself is only imported when plotting is actually requested.
+    """
+    if "matplotlib.pyplot" in sys.modules or "MPLBACKEND" in os.environ:
+        return
+
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+        import matplotlib
+        matplotlib.use("Agg")
+
+
+def progress_bar(iterable: Iterable[_T], /, **kwargs: Any) -> tqdm[_T]:
+    """Wrap `iterable` in a tqdm progress bar, importing tqdm on first use"""
+    from tqdm import tqdm
+    return tqdm(iterable, **kwargs)
+
+
+def read_log(path: str, /) -> Tuple[Dict[str, List[float]], List[Tuple[int, str]]]:
+    """Read a log written by `LogSink` in the binary format
+
+    Returns the columns, and the notes along with the number of records written before each.
+    """
+    columns: Dict[str, List[float]] = {}
+    notes: List[Tuple[int, str]] = []
+    rows_count = 0
+    with open(path, "rb") as file:
+        if file.read(len(LogSink.BINARY_MAGIC)) != LogSink.BINARY_MAGIC:
+            raise ValueError(f"{path} is not a binary log")
+
+        while len(size := file.read(4)) == 4:
+            header = json.loads(file.read(struct.unpack("<I", size)[0]))
+            rows = header["rows"]
+            for name in header["columns"]:
+                values = array("d")
+                values.frombytes(file.read(8 * rows))
+                if sys.byteorder == "big":
+                    values.byteswap()
+
+                columns.setdefault(name, [math.nan] * rows_count).extend(values)
+
+            notes.extend((rows_count + row, note) for row, note in header["notes"])
+            rows_count += rows
+            for column in columns.values():
+                column.extend([math.nan] * (rows_count - len(column)))
+
+    return columns, notes
+
+
+def resident_memory() -> int:
+    """The resident set size of this process in bytes, or the peak one where it is not available"""
+    try:
+        with open("/proc/self/statm", encoding="utf-8") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
 def value(__x: _T, /) -> _T:
     return __x
 
@@ -98,6 +208,212 @@ def weird_round(number: float, precision: int, /) -> float:
     return math.ceil(number * factor) / factor
 
 
+class LogSink:
+    """Write generation records to a file from a background thread
+
+    Records are queued, at most `buffer` of them, and written as CSV, JSON lines or a compact
+    binary columnar format: after a magic string, blocks of up to `block` records, each made of
+    a length-prefixed JSON header (column names, row count, notes) followed by every column as
+    little-endian doubles, see `read_log`. `write` only blocks when the writer falls that far
+    behind. Notes are free-form messages between records.
+    """
+
+    BINARY_MAGIC: ClassVar[bytes] = b"GALOG001"
+    __slots__ = (
+        "path",
+        "format",
+        "block",
+        "__queue",
+        "__thread",
+        "__error",
+    )
+    if TYPE_CHECKING:
+        path: Final[str]
+        format: Final[LogFormat]
+        block: Final[int]
+        __queue: Final[queue.Queue[Optional[Tuple[bool, Any]]]]
+        __thread: Final[threading.Thread]
+        __error: Optional[BaseException]
+
+    def __init__(self, path: str, /, *, format: LogFormat = "csv", buffer: int = 1024, block: int = 256) -> None:
+        self.path = path
+        self.format = format
+        self.block = block
+        self.__queue = queue.Queue(buffer)
+        self.__error = None
+        self.__thread = threading.Thread(target=self.__run, name="log-sink", daemon=True)
+        self.__thread.start()
+
+    def write(self, record: Mapping[str, float], /) -> None:
+        """Queue a record, the columns of the first record are used for the whole file in CSV"""
+        self.__raise()
+        self.__queue.put((False, dict(record)))
+
+    def note(self, message: str, /) -> None:
+        self.__raise()
+        self.__queue.put((True, message))
+
+    def close(self) -> None:
+        """Write the queued records and close the file"""
+        self.__queue.put(None)
+        self.__thread.join()
+        self.__raise()
+
+    def __raise(self) -> None:
+        if self.__error is not None:
+            raise self.__error
+
+    def __run(self) -> None:
+        items = iter(self.__queue.get, None)
+        try:
+            if self.format == "binary":
+                with open(self.path, "wb") as binary:
+                    self.__write_binary(binary, items)
+            else:
+                with open(self.path, "w", encoding="utf-8") as text:
+                    if self.format == "csv":
+                        self.__write_csv(text, items)
+                    else:
+                        self.__write_jsonl(text, items)
+
+        except BaseException as e:
+            self.__error = e
+            for _ in items:  # unblock the producers until closed
+                pass
+
+    @staticmethod
+    def __write_csv(file: TextIO, items: Iterator[Tuple[bool, Any]]) -> None:
+        columns: Optional[List[str]] = None
+        for is_note, item in items:
+            if is_note:
+                file.write(f"\"{item}\"\n")
+                continue
+
+            if columns is None:
+                columns = list(item)
+                file.write(",".join(columns))
+                file.write("\n")
+
+            file.write(",".join(str(item.get(column, "")) for column in columns))
+            file.write("\n")
+
+    @staticmethod
+    def __write_jsonl(file: TextIO, items: Iterator[Tuple[bool, Any]]) -> None:
+        for is_note, item in items:
+            json.dump({"note": item} if is_note else item, file)
+            file.write("\n")
+
+    def __write_binary(self, file: BinaryIO, items: Iterator[Tuple[bool, Any]]) -> None:
+        rows: List[Mapping[str, float]] = []
+        notes: List[Tuple[int, str]] = []
+
+        def flush() -> None:
+            columns = list(rows[0]) if len(rows) > 0 else []
+            header = json.dumps({"columns": columns, "rows": len(rows), "notes": notes}).encode("utf-8")
+            file.write(struct.pack("<I", len(header)))
+            file.write(header)
+            for column in columns:
+                values = array("d", (row.get(column, math.nan) for row in rows))
+                if sys.byteorder == "big":
+                    values.byteswap()
+
+                file.write(values.tobytes())
+
+            rows.clear()
+            notes.clear()
+
+        file.write(self.BINARY_MAGIC)
+        for is_note, item in items:
+            if is_note:
+                notes.append((len(rows), item))
+            else:
+                rows.append(item)
+                if len(rows) == self.block:
+                    flush()
+
+        if len(rows) > 0 or len(notes) > 0:
+            flush()
+
+
+class MemoryBudget:
+    """Share a byte budget between several caches
+
+    Each cache remembers the keys it evicted recently, a miss on such a key (a ghost hit) would
+    have been a hit with a little more memory. `rebalance` moves a step of the budget from the
+    cache with the fewest ghost hits per allocated byte to the one with the most, the rates are
+    smoothed exponentially since ghost hits tend to come in bursts.
+    """
+
+    __slots__ = (
+        "memory",
+        "step",
+        "minimum",
+        "smoothing",
+        "__caches",
+        "__allocations",
+        "__ghost_hits",
+        "__rates",
+    )
+    if TYPE_CHECKING:
+        memory: Final[int]
+        step: float
+        minimum: float
+        smoothing: float
+        __caches: Final[Dict[str, Tuple[Callable[[], LRUCacheInfo], Callable[[int], None]]]]
+        __allocations: Final[Dict[str, int]]
+        __ghost_hits: Final[Dict[str, int]]
+        __rates: Final[Dict[str, float]]
+
+    def __init__(self, memory: int, *, step: float = 0.05, minimum: float = 0.05, smoothing: float = 0.9) -> None:
+        self.memory = memory
+        self.step = step
+        self.minimum = minimum
+        self.smoothing = smoothing
+        self.__caches = {}
+        self.__allocations = {}
+        self.__ghost_hits = {}
+        self.__rates = {}
+
+    def register(self, name: str, *, info: Callable[[], LRUCacheInfo], resize: Callable[[int], None]) -> None:
+        """Add a cache to the budget, the budget is then split evenly between all caches"""
+        self.__caches[name] = info, resize
+        self.__ghost_hits[name] = info()["ghost_hit"]
+        self.__rates[name] = 0.0
+        for cache in self.__caches:
+            self.__resize(cache, self.memory // len(self.__caches))
+
+    def __resize(self, name: str, memory: int) -> None:
+        self.__allocations[name] = memory
+        self.__caches[name][1](memory)
+
+    def rebalance(self) -> None:
+        """Move a step of the budget towards the cache with the highest marginal hit rate"""
+        rates = self.__rates
+        for name, (info, _) in self.__caches.items():
+            ghost_hit = info()["ghost_hit"]
+            if ghost_hit < self.__ghost_hits[name]:  # the cache was cleared
+                self.__ghost_hits[name] = 0
+
+            rate = (ghost_hit - self.__ghost_hits[name]) / max(self.__allocations[name], 1)
+            rates[name] = self.smoothing * rates[name] + (1 - self.smoothing) * rate
+            self.__ghost_hits[name] = ghost_hit
+
+        minimum = int(self.minimum * self.memory)
+        donors = [name for name, allocation in self.__allocations.items() if allocation > minimum]
+        if len(rates) < 2 or len(donors) == 0:
+            return
+
+        receiver = max(rates, key=rates.__getitem__)
+        donor = min(donors, key=rates.__getitem__)
+        if rates[receiver] > rates[donor]:
+            moved = min(int(self.step * self.memory), self.__allocations[donor] - minimum)
+            self.__resize(donor, self.__allocations[donor] - moved)
+            self.__resize(receiver, self.__allocations[receiver] + moved)
+
+    def to_json(self) -> Dict[str, int]:
+        return dict(self.__allocations)
+
+
 class SizeMonitoredSet(Iterable[_T]):
 
     __slots__ = (
@@ -120,7 +436,7 @@ class SizeMonitoredSet(Iterable[_T]):
         if initial is None:
             initial = set()
 
-        displayer = tqdm.tqdm(range(max_size), ascii=" █", colour=color)
+        displayer = progress_bar(range(max_size), ascii=" █", colour=color)
         displayer.set_description_str(description)
 
         self.__progress = 0
@@ -145,3 +461,162 @@ class SizeMonitoredSet(Iterable[_T]):
 
     def __len__(self) -> int:
         return len(self.__set)
+
+
+class TelemetryServer:
+    """Publish events as JSON lines to every client of a local socket
+
+    `address` is either `unix:<path>` or `[host:]port`, on localhost by default (port 0 picks a
+    free port, `address` then holds the actual one). Events are serialized and sent by a
+    background thread, `publish` never blocks: an event is dropped when `buffer` events are
+    already queued, or for a client that has `client_buffer` bytes left to read. `dropped`
+    counts the dropped events.
+    """
+
+    __slots__ = (
+        "address",
+        "client_buffer",
+        "clients",
+        "dropped",
+        "__queue",
+        "__listener",
+        "__thread",
+        "__lock",
+        "__deadline",
+    )
+    if TYPE_CHECKING:
+        address: Final[str]
+        client_buffer: Final[int]
+        clients: int
+        dropped: int
+        __queue: Final[queue.Queue[Mapping[str, Any]]]
+        __listener: Final[socket.socket]
+        __thread: Final[threading.Thread]
+        __lock: Final[threading.Lock]
+        __deadline: Optional[float]
+
+    def __init__(self, address: str, /, *, buffer: int = 1024, client_buffer: int = 1 << 20) -> None:
+        self.__listener = self.__socket(address)
+        if address.startswith("unix:"):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(address.removeprefix("unix:"))
+
+            self.__listener.bind(address.removeprefix("unix:"))
+        else:
+            self.__listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.__listener.bind(self.__tcp_address(address))
+            host, port = self.__listener.getsockname()[:2]
+            address = f"{host}:{port}"
+
+        self.address = address
+
+        self.__listener.listen()
+        self.__listener.setblocking(False)
+        self.client_buffer = client_buffer
+        self.clients = 0
+        self.dropped = 0
+        self.__queue = queue.Queue(buffer)
+        self.__lock = threading.Lock()
+        self.__deadline = None
+        self.__thread = threading.Thread(target=self.__run, name="telemetry", daemon=True)
+        self.__thread.start()
+
+    @staticmethod
+    def __socket(address: str) -> socket.socket:
+        return socket.socket(socket.AF_UNIX if address.startswith("unix:") else socket.AF_INET, socket.SOCK_STREAM)
+
+    @staticmethod
+    def __tcp_address(address: str) -> Tuple[str, int]:
+        host, _, port = address.rpartition(":")
+        return host or "127.0.0.1", int(port)
+
+    @classmethod
+    def connect(cls, address: str, /) -> socket.socket:
+        """Connect a client to the server listening on `address`"""
+        client = cls.__socket(address)
+        client.connect(address.removeprefix("unix:") if address.startswith("unix:") else cls.__tcp_address(address))
+        return client
+
+    def publish(self, event: Mapping[str, Any], /) -> bool:
+        """Queue an event, return whether it was queued or dropped"""
+        try:
+            self.__queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.__drop()
+            return False
+
+    def close(self, *, timeout: float = 5.0) -> None:
+        """Send the queued events and disconnect all clients, giving up on the unsent ones after `timeout` seconds"""
+        self.__deadline = time.monotonic() + timeout
+        self.__thread.join()
+
+    def __drop(self) -> None:
+        # Events are dropped by both the publishing thread and the background one
+        with self.__lock:
+            self.dropped += 1
+
+    def __run(self) -> None:
+        selector = selectors.DefaultSelector()
+        selector.register(self.__listener, selectors.EVENT_READ)
+        pending: Dict[socket.socket, bytearray] = {}
+
+        def disconnect(client: socket.socket) -> None:
+            selector.unregister(client)
+            client.close()
+            del pending[client]
+
+        try:
+            while True:
+                deadline = self.__deadline
+                for key, _ in selector.select(timeout=0.05):
+                    if key.fileobj is self.__listener:
+                        with contextlib.suppress(BlockingIOError):
+                            client, _ = self.__listener.accept()
+                            client.setblocking(False)
+                            selector.register(client, selectors.EVENT_READ)
+                            pending[client] = bytearray()
+
+                    else:
+                        # Clients never send anything, a readable client has disconnected
+                        assert isinstance(key.fileobj, socket.socket)
+                        try:
+                            if len(key.fileobj.recv(4096)) == 0:
+                                disconnect(key.fileobj)
+                        except BlockingIOError:
+                            pass
+                        except OSError:
+                            disconnect(key.fileobj)
+
+                while not self.__queue.empty():
+                    line = json.dumps(self.__queue.get_nowait()).encode("utf-8") + b"\n"
+                    for buffer in pending.values():
+                        if len(buffer) + len(line) > self.client_buffer:
+                            self.__drop()
+                        else:
+                            buffer += line
+
+                for client, buffer in list(pending.items()):
+                    if len(buffer) > 0:
+                        try:
+                            del buffer[:client.send(buffer)]
+                        except BlockingIOError:
+                            pass
+                        except OSError:
+                            disconnect(client)
+
+                self.clients = len(pending)
+
+                # Once closed, keep sending until every queued event reached the clients or the deadline passes
+                if deadline is not None and ((self.__queue.empty() and not any(pending.values())) or time.monotonic() >= deadline):
+                    break
+
+        finally:
+            for client in list(pending):
+                disconnect(client)
+
+            selector.close()
+            self.__listener.close()
+            if self.address.startswith("unix:"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(self.address.removeprefix("unix:"))
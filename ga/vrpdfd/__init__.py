@@ -1,6 +1,9 @@
+from .compiled import *
 from .config import *
 from .errors import *
 from .individuals import *
+from .population import *
+from .serialization import *
 from .solutions import *
 from .types import *
-from .utils import path_cache_info, setup_path_cache
+from .utils import local_search_cache_info, local_search_info, path_cache_info, resize_local_search_cache, resize_path_cache, setup_local_search_cache, setup_path_cache, trace_path_cache
@@ -0,0 +1,214 @@
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from dataclasses import dataclass
+from os import path
+from typing import Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing_extensions import Buffer
+
+
+__all__ = (
+    "COMPILED_VERSION",
+    "CompiledProblem",
+    "compiled_path",
+    "read_compiled",
+    "write_compiled",
+)
+
+
+COMPILED_MAGIC = b"VRPDFD\x00\x00"
+COMPILED_VERSION = 1
+
+# magic, version, customers count (including the depot), trucks count, drones count, time limit,
+# truck (speed, capacity, cost coefficient, time limit), drone (speed, capacity, cost coefficient, time limit),
+# neighbors limit, sortie limit, sorties count, total length of sortie paths
+_HEADER = struct.Struct("<8sIIIId dIdd dIdd IIQQ")
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def compiled_path(problem: str, /, directory: Optional[str] = None) -> str:
+    """Return the location of the compiled file of a problem, `problems/vrpdfd/compiled` by default"""
+    if directory is None:
+        directory = path.join("problems", "vrpdfd", "compiled")
+
+    return path.join(directory, f"{problem}.bin")
+
+
+@dataclass(frozen=True, kw_only=True, slots=True)
+class CompiledProblem:
+    """A compiled problem, whose arrays are views into a read-only memory-mapped file
+
+    Processes mapping the same file share its pages through the OS page cache.
+    """
+
+    buffer: mmap.mmap
+    trucks_count: int
+    drones_count: int
+    time_limit: float
+    truck_speed: float
+    truck_capacity: int
+    truck_cost_coefficient: float
+    truck_time_limit: float
+    drone_speed: float
+    drone_capacity: int
+    drone_cost_coefficient: float
+    drone_time_limit: float
+    neighbors_limit: int
+    sortie_limit: int
+
+    x: memoryview
+    y: memoryview
+    low: memoryview
+    high: memoryview
+    w: memoryview
+    distances: memoryview
+    neighbor_lengths: memoryview
+    neighbors: memoryview
+    sortie_distances: memoryview
+    sortie_offsets: memoryview
+    sortie_paths: memoryview
+
+
+def read_compiled(file_path: str, /) -> Optional[CompiledProblem]:
+    """Memory-map a compiled problem
+
+    Returns
+    -----
+    The compiled problem, or None if the file was written by another version of the format
+    """
+    with open(file_path, "rb") as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < _HEADER.size:
+        raise ValueError(f"Truncated compiled file {file_path!r}")
+
+    (
+        magic, version, customers_count, trucks_count, drones_count, time_limit,
+        truck_speed, truck_capacity, truck_cost_coefficient, truck_time_limit,
+        drone_speed, drone_capacity, drone_cost_coefficient, drone_time_limit,
+        neighbors_limit, sortie_limit, sorties_count, sortie_paths_length,
+    ) = _HEADER.unpack_from(buffer)
+    if magic != COMPILED_MAGIC:
+        raise ValueError(f"{file_path!r} is not a compiled VRPDFD problem")
+
+    if version != COMPILED_VERSION:
+        return None
+
+    view = memoryview(buffer)
+    offset = _HEADER.size
+
+    def section(code: str, count: int) -> memoryview:
+        nonlocal offset
+        start = _align(offset)
+        offset = start + struct.calcsize(code) * count
+        if offset > len(buffer):
+            raise ValueError(f"Truncated compiled file {file_path!r}")
+
+        return view[start:offset].cast(code)  # type: ignore[call-overload]
+
+    x = section("d", customers_count)
+    y = section("d", customers_count)
+    low = section("i", customers_count)
+    high = section("i", customers_count)
+    w = section("i", customers_count)
+    distances = section("d", customers_count * customers_count)
+    neighbor_lengths = section("I", customers_count)
+    neighbors = section("I", sum(neighbor_lengths))
+    sortie_distances = section("d", sorties_count)
+    sortie_offsets = section("Q", sorties_count + 1)
+    sortie_paths = section("I", sortie_paths_length)
+
+    return CompiledProblem(
+        buffer=buffer,
+        trucks_count=trucks_count,
+        drones_count=drones_count,
+        time_limit=time_limit,
+        truck_speed=truck_speed,
+        truck_capacity=truck_capacity,
+        truck_cost_coefficient=truck_cost_coefficient,
+        truck_time_limit=truck_time_limit,
+        drone_speed=drone_speed,
+        drone_capacity=drone_capacity,
+        drone_cost_coefficient=drone_cost_coefficient,
+        drone_time_limit=drone_time_limit,
+        neighbors_limit=neighbors_limit,
+        sortie_limit=sortie_limit,
+        x=x,
+        y=y,
+        low=low,
+        high=high,
+        w=w,
+        distances=distances,
+        neighbor_lengths=neighbor_lengths,
+        neighbors=neighbors,
+        sortie_distances=sortie_distances,
+        sortie_offsets=sortie_offsets,
+        sortie_paths=sortie_paths,
+    )
+
+
+def write_compiled(
+    file_path: str,
+    /,
+    *,
+    trucks_count: int,
+    drones_count: int,
+    time_limit: float,
+    truck_speed: float,
+    truck_capacity: int,
+    truck_cost_coefficient: float,
+    truck_time_limit: float,
+    drone_speed: float,
+    drone_capacity: int,
+    drone_cost_coefficient: float,
+    drone_time_limit: float,
+    neighbors_limit: int,
+    sortie_limit: int,
+    x: Buffer,
+    y: Buffer,
+    low: Buffer,
+    high: Buffer,
+    w: Buffer,
+    distances: Buffer,
+    neighbor_lengths: Buffer,
+    neighbors: Buffer,
+    sortie_distances: Buffer,
+    sortie_offsets: Buffer,
+    sortie_paths: Buffer,
+) -> None:
+    """Write a compiled problem to `file_path`
+
+    The file is written to a temporary location first and then moved into place, so that
+    concurrent readers never observe a partially written file.
+    """
+    sections = [
+        memoryview(section).cast("B")
+        for section in (x, y, low, high, w, distances, neighbor_lengths, neighbors, sortie_distances, sortie_offsets, sortie_paths)
+    ]
+    header = _HEADER.pack(
+        COMPILED_MAGIC, COMPILED_VERSION, len(sections[0]) // 8, trucks_count, drones_count, time_limit,
+        truck_speed, truck_capacity, truck_cost_coefficient, truck_time_limit,
+        drone_speed, drone_capacity, drone_cost_coefficient, drone_time_limit,
+        neighbors_limit, sortie_limit, len(sections[8]) // 8, len(sections[10]) // 4,
+    )
+
+    directory = path.dirname(file_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    temporary = f"{file_path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        offset = file.write(header)
+        for section in sections:
+            padding = _align(offset) - offset
+            offset += file.write(b"\x00" * padding)
+            offset += file.write(section)
+
+    os.replace(temporary, file_path)
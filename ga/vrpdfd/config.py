@@ -1,17 +1,27 @@
 from __future__ import annotations
 
 import csv
-import io
-import itertools
 import json
+from array import array
 from dataclasses import dataclass
-from math import sqrt
 from os import path
-from typing import AbstractSet, ClassVar, Dict, Final, List, Optional, Tuple, TYPE_CHECKING, final
+from typing import AbstractSet, ClassVar, Dict, Final, List, Literal, Optional, Tuple, Union, TYPE_CHECKING, final
 
+from .compiled import CompiledProblem, compiled_path, read_compiled, write_compiled
 from .errors import ConfigImportException
-from .utils import path_order, setup
-from ..utils import weird_round
+from .utils import (
+    DistanceMatrix,
+    export_neighbors,
+    export_sorties,
+    import_neighbors,
+    import_sorties,
+    path_order,
+    setup,
+    setup_neighbors,
+    setup_sorties,
+    setup_trade_limits,
+)
+from ..utils import LogSink, TelemetryServer
 
 
 __all__ = (
@@ -19,6 +29,10 @@ __all__ = (
 )
 
 
+_PARAMS_PATH = path.join("problems", "vrpdfd", "params.csv")
+_COEFFICIENTS_PATH = path.join("problems", "vrpdfd", "coefficients.json")
+
+
 @dataclass(frozen=True, kw_only=True, slots=True)
 class Customer:
     x: float
@@ -50,6 +64,12 @@ class ProblemConfig:
         "customers",
         "customers_by_profit",
         "distances",
+        "distance_view",
+        "compiled",
+        "sortie_limit",
+        "neighbors_limit",
+        "truck_trade_limit",
+        "drone_trade_limit",
 
         # Constraints
         "truck",
@@ -61,17 +81,33 @@ class ProblemConfig:
         "reset_after",
         "stuck_penalty_increase_rate",
         "local_search_batch",
+        "local_search_evaluations",
+        "local_search_queue",
+        "local_search_time_limit",
+        "local_search_workers",
         "logger",
+        "telemetry",
     )
     __cache__: ClassVar[Dict[str, ProblemConfig]] = {}
+    __active__: ClassVar[Optional[ProblemConfig]] = None
+    __params__: ClassVar[Optional[Dict[str, List[str]]]] = None
     context: ClassVar[str] = "None"
+    distance_storage: ClassVar[Literal["double", "float", "lazy"]] = "double"
+    use_compiled: ClassVar[bool] = True
+    compiled_directory: ClassVar[Optional[str]] = None
     if TYPE_CHECKING:
         problem: Final[str]
         trucks_count: Final[int]
         drones_count: Final[int]
         customers: Final[Tuple[Customer, ...]]
         customers_by_profit: Final[Tuple[int, ...]]
-        distances: Final[Tuple[Tuple[float, ...], ...]]
+        distances: Final[DistanceMatrix]
+        distance_view: Final[Union[memoryview, DistanceMatrix]]
+        compiled: Final[Optional[CompiledProblem]]
+        sortie_limit: int
+        neighbors_limit: int
+        truck_trade_limit: int
+        drone_trade_limit: int
 
         # Constraints
         truck: Final[Vehicle]
@@ -83,87 +119,131 @@ class ProblemConfig:
         reset_after: Optional[int]
         stuck_penalty_increase_rate: Optional[float]
         local_search_batch: Optional[int]
-        logger: Optional[io.TextIOWrapper]
+        local_search_evaluations: Optional[int]
+        local_search_queue: Optional[int]
+        local_search_time_limit: Optional[float]
+        local_search_workers: Optional[int]
+        logger: Optional[LogSink]
+        telemetry: Optional[TelemetryServer]
 
     def __init__(self, problem: str, /) -> None:
         self.problem = problem = problem.removesuffix(".csv")
+        self.sortie_limit = 0
+        self.neighbors_limit = 0
+        self.truck_trade_limit = 4
+        self.drone_trade_limit = 4
         self.mutation_rate = None
         self.reset_after = None
         self.stuck_penalty_increase_rate = None
         self.local_search_batch = None
+        self.local_search_evaluations = None
+        self.local_search_queue = None
+        self.local_search_time_limit = None
+        self.local_search_workers = None
         self.logger = None
+        self.telemetry = None
         try:
-            config_path = "problems/vrpdfd/params.csv"
-            with open(config_path, "r", encoding="utf-8", newline="") as file:
-                header = True  # Skip header
-                for row in csv.reader(file):
-                    if header:
-                        header = False
-                        continue
-
-                    if row[2] == problem:
-                        trucks_count, drones_count, time_limit, truck_capacity, drone_capacity, drone_speed, truck_speed, drone_duration = map(float, row[6:])
-                        assert (
-                            trucks_count.is_integer()
-                            and drones_count.is_integer()
-                            and truck_capacity.is_integer()
-                            and drone_capacity.is_integer()
-                        )
-
-                        self.trucks_count = int(trucks_count)
-                        self.drones_count = int(drones_count)
-                        self.time_limit = time_limit
-
-                        with open("problems/vrpdfd/coefficients.json", "r", encoding="utf-8") as coefficients_file:
-                            data = json.load(coefficients_file)
-                            truck_coefficient = data["truck_cost_over_time"] / truck_speed
-                            drone_coefficient = data["drone_cost_over_time"] / drone_speed
-
-                        self.truck = Vehicle(speed=truck_speed, capacity=int(truck_capacity), cost_coefficient=truck_coefficient, time_limit=10 ** 9)
-                        self.drone = Vehicle(speed=drone_speed, capacity=int(drone_capacity), cost_coefficient=drone_coefficient, time_limit=drone_duration)
-
-                        break
-
-            file_path = path.join("problems", "vrpdfd", f"{problem}.csv")
-            with open(file_path, "r", encoding="utf-8", newline="") as file:
-                header = True  # Skip header
-                customers = [Customer(x=0.0, y=0.0, low=0, high=0, w=0)]
-                for row in csv.reader(file):
-                    if header:
-                        header = False
-                        continue
-
-                    _, x, y, low, high, w = map(float, row)
-                    assert low.is_integer() and high.is_integer() and w.is_integer()
-                    customers.append(Customer(x=x, y=y, low=int(low), high=int(high), w=int(w)))
-
-                customers_count = len(customers)
-                self.customers = tuple(customers)
-                self.customers_by_profit = tuple(sorted(range(1, customers_count), key=lambda i: customers[i].w, reverse=True))
-
-                distances = [[0.0] * (customers_count) for _ in range(customers_count)]
-                for f, s in itertools.combinations(range(customers_count), 2):
-                    distances[f][s] = distances[s][f] = weird_round(sqrt((customers[f].x - customers[s].x) ** 2 + (customers[f].y - customers[s].y) ** 2), 2)
-
-                self.distances = tuple(map(tuple, distances))
-
-                setup(
-                    [customer.low for customer in customers],
-                    [customer.high for customer in customers],
-                    [customer.w for customer in customers],
-                    [customer.x for customer in customers],
-                    [customer.y for customer in customers],
-                    self.time_limit * self.truck.speed,
-                    self.drone.time_limit * self.drone.speed,
-                    self.truck.capacity,
-                    self.drone.capacity,
-                    self.truck.cost_coefficient,
-                    self.drone.cost_coefficient,
-                )
+            compiled = None
+            file_path = compiled_path(problem, directory=self.compiled_directory)
+            if self.use_compiled and self.__is_fresh(file_path):
+                compiled = read_compiled(file_path)
+
+            self.compiled = compiled
+            data = self.__read_csv(problem) if compiled is None else self.__read_compiled(compiled)
+            self.trucks_count, self.drones_count, self.time_limit, self.truck, self.drone, self.customers = data
+
+            self.distances = DistanceMatrix(
+                [customer.location for customer in self.customers],
+                storage=self.distance_storage,
+                data=None if compiled is None else compiled.distances,
+            )
+            # Indexing a memoryview is several times faster than going through pybind11, lazy
+            # matrices have no buffer to view
+            self.distance_view = self.distances if self.distances.storage == "lazy" else memoryview(self.distances)
+            self.customers_by_profit = tuple(sorted(range(1, len(self.customers)), key=lambda i: self.customers[i].w, reverse=True))
+            self.activate()
 
         except BaseException as error:
             raise ConfigImportException(error) from error
 
+    def __is_fresh(self, file_path: str, /) -> bool:
+        try:
+            modified = path.getmtime(file_path)
+        except OSError:
+            return False
+
+        sources = (_PARAMS_PATH, _COEFFICIENTS_PATH, path.join("problems", "vrpdfd", f"{self.problem}.csv"))
+        return all(path.getmtime(source) <= modified for source in sources)
+
+    @classmethod
+    def __load_params(cls) -> Dict[str, List[str]]:
+        if cls.__params__ is None:
+            params: Dict[str, List[str]] = {}
+            with open(_PARAMS_PATH, "r", encoding="utf-8", newline="") as file:
+                reader = csv.reader(file)
+                next(reader)  # Skip header
+                for row in reader:
+                    params[row[2]] = row
+
+            cls.__params__ = params
+
+        return cls.__params__
+
+    @classmethod
+    def __read_csv(cls, problem: str, /) -> Tuple[int, int, float, Vehicle, Vehicle, Tuple[Customer, ...]]:
+        row = cls.__load_params()[problem]
+        trucks_count, drones_count, time_limit, truck_capacity, drone_capacity, drone_speed, truck_speed, drone_duration = map(float, row[6:])
+        assert (
+            trucks_count.is_integer()
+            and drones_count.is_integer()
+            and truck_capacity.is_integer()
+            and drone_capacity.is_integer()
+        )
+
+        with open(_COEFFICIENTS_PATH, "r", encoding="utf-8") as coefficients_file:
+            data = json.load(coefficients_file)
+            truck_coefficient = data["truck_cost_over_time"] / truck_speed
+            drone_coefficient = data["drone_cost_over_time"] / drone_speed
+
+        truck = Vehicle(speed=truck_speed, capacity=int(truck_capacity), cost_coefficient=truck_coefficient, time_limit=10 ** 9)
+        drone = Vehicle(speed=drone_speed, capacity=int(drone_capacity), cost_coefficient=drone_coefficient, time_limit=drone_duration)
+
+        file_path = path.join("problems", "vrpdfd", f"{problem}.csv")
+        with open(file_path, "r", encoding="utf-8", newline="") as file:
+            header = True  # Skip header
+            customers = [Customer(x=0.0, y=0.0, low=0, high=0, w=0)]
+            for row in csv.reader(file):
+                if header:
+                    header = False
+                    continue
+
+                _, x, y, low, high, w = map(float, row)
+                assert low.is_integer() and high.is_integer() and w.is_integer()
+                customers.append(Customer(x=x, y=y, low=int(low), high=int(high), w=int(w)))
+
+        return int(trucks_count), int(drones_count), time_limit, truck, drone, tuple(customers)
+
+    @staticmethod
+    def __read_compiled(compiled: CompiledProblem, /) -> Tuple[int, int, float, Vehicle, Vehicle, Tuple[Customer, ...]]:
+        truck = Vehicle(
+            speed=compiled.truck_speed,
+            capacity=compiled.truck_capacity,
+            cost_coefficient=compiled.truck_cost_coefficient,
+            time_limit=compiled.truck_time_limit,
+        )
+        drone = Vehicle(
+            speed=compiled.drone_speed,
+            capacity=compiled.drone_capacity,
+            cost_coefficient=compiled.drone_cost_coefficient,
+            time_limit=compiled.drone_time_limit,
+        )
+        customers = tuple(
+            Customer(x=x, y=y, low=low, high=high, w=w)
+            for x, y, low, high, w in zip(compiled.x, compiled.y, compiled.low, compiled.high, compiled.w)
+        )
+
+        return compiled.trucks_count, compiled.drones_count, compiled.time_limit, truck, drone, customers
+
     @property
     def customers_count(self) -> int:
         """Return the number of customers excluding the deport"""
@@ -181,11 +261,159 @@ class ProblemConfig:
             cls.__cache__[problem] = config = cls(problem)
             return config
 
+    def activate(self) -> None:
+        """Load this problem into the native extension, if it is not loaded yet
+
+        The native extension can only hold one problem at a time, so switching between
+        cached configurations must load the data again.
+        """
+        if ProblemConfig.__active__ is self:
+            return
+
+        setup(
+            [customer.low for customer in self.customers],
+            [customer.high for customer in self.customers],
+            [customer.w for customer in self.customers],
+            [customer.x for customer in self.customers],
+            [customer.y for customer in self.customers],
+            self.time_limit * self.truck.speed,
+            self.drone.time_limit * self.drone.speed,
+            self.truck.capacity,
+            self.drone.capacity,
+            self.truck.cost_coefficient,
+            self.drone.cost_coefficient,
+            distances=self.distances,
+            time_limit=self.time_limit,
+            truck_speed=self.truck.speed,
+            drone_speed=self.drone.speed,
+            drone_time_limit=self.drone.time_limit,
+        )
+        ProblemConfig.__active__ = self
+        setup_trade_limits(self.truck_trade_limit, self.drone_trade_limit)
+
+        if self.neighbors_limit > 0:
+            self.__load_neighbors()
+
+        if self.sortie_limit > 0:
+            self.__load_sorties()
+
+    def __load_neighbors(self) -> None:
+        compiled = self.compiled
+        if compiled is not None and compiled.neighbors_limit == self.neighbors_limit > 0:
+            import_neighbors(self.neighbors_limit, compiled.neighbor_lengths, compiled.neighbors)
+        else:
+            setup_neighbors(self.neighbors_limit)
+
+    def __load_sorties(self) -> int:
+        compiled = self.compiled
+        if compiled is not None and compiled.sortie_limit == self.sortie_limit > 0:
+            return import_sorties(self.sortie_limit, compiled.sortie_distances, compiled.sortie_offsets, compiled.sortie_paths)
+
+        return setup_sorties(self.sortie_limit)
+
     def path_order(self, path: AbstractSet[int]) -> Tuple[float, List[int]]:
         return path_order(path)
 
+    def setup_neighbors(self, limit: int, /) -> None:
+        """Compute the `limit` nearest customers of each customer (and of the depot)
+
+        A positive limit enables the granular variants of the mutation and local search
+        neighborhoods, which only consider spatially close customers. A limit of 0 disables
+        them.
+        """
+        self.activate()
+        self.neighbors_limit = limit
+        self.__load_neighbors()
+
+    def setup_sorties(self, limit: int, /) -> int:
+        """Enumerate all feasible drone sorties serving at most `limit` customers
+
+        Each sortie is stored with its optimal tour, so that `path_order` can answer
+        for these paths without invoking the TSP solver. A limit of 0 clears the catalogue.
+
+        Returns
+        -----
+        The number of sorties in the catalogue
+        """
+        self.activate()
+        self.sortie_limit = limit
+        return self.__load_sorties()
+
+    def setup_trade_limits(self, truck: int, drone: int, /) -> None:
+        """Set the number of truck-only and drone-only customers that local search may trade
+
+        Local search tries every subset of the traded customers, so each extra customer
+        doubles the work of this neighborhood. The limits may not exceed 30 in total.
+        """
+        self.activate()
+        setup_trade_limits(truck, drone)
+        self.truck_trade_limit = truck
+        self.drone_trade_limit = drone
+
+    def compile(self, file_path: Optional[str] = None, /) -> str:
+        """Write this problem and its derived data to a compiled file
+
+        The file holds the distance matrix and, for the current `neighbors_limit` and
+        `sortie_limit`, the neighbor lists and the sortie catalogue. Later instances of
+        this problem memory-map the file instead of parsing the CSV sources, as long as
+        it is newer than them.
+
+        Parameters
+        -----
+        file_path:
+            The destination, defaults to `<problem>.bin` in `compiled_directory` (`problems/vrpdfd/compiled`)
+
+        Returns
+        -----
+        The path of the compiled file
+        """
+        if file_path is None:
+            file_path = compiled_path(self.problem, directory=self.compiled_directory)
+
+        self.activate()
+        customers_count = len(self.customers)
+        if self.neighbors_limit > 0:
+            neighbor_lengths, neighbors = export_neighbors()
+        else:
+            neighbor_lengths, neighbors = bytes(4 * customers_count), b""
+
+        distances = self.distances
+        if distances.storage != "double":
+            distances = DistanceMatrix([customer.location for customer in self.customers])
+
+        sortie_distances, sortie_offsets, sortie_paths = export_sorties()
+        write_compiled(
+            file_path,
+            trucks_count=self.trucks_count,
+            drones_count=self.drones_count,
+            time_limit=self.time_limit,
+            truck_speed=self.truck.speed,
+            truck_capacity=self.truck.capacity,
+            truck_cost_coefficient=self.truck.cost_coefficient,
+            truck_time_limit=self.truck.time_limit,
+            drone_speed=self.drone.speed,
+            drone_capacity=self.drone.capacity,
+            drone_cost_coefficient=self.drone.cost_coefficient,
+            drone_time_limit=self.drone.time_limit,
+            neighbors_limit=self.neighbors_limit,
+            sortie_limit=self.sortie_limit,
+            x=array("d", (customer.x for customer in self.customers)),
+            y=array("d", (customer.y for customer in self.customers)),
+            low=array("i", (customer.low for customer in self.customers)),
+            high=array("i", (customer.high for customer in self.customers)),
+            w=array("i", (customer.w for customer in self.customers)),
+            distances=distances,
+            neighbor_lengths=neighbor_lengths,
+            neighbors=neighbors,
+            sortie_distances=sortie_distances,
+            sortie_offsets=sortie_offsets,
+            sortie_paths=sortie_paths,
+        )
+        return file_path
+
     @classmethod
     def quick_setup(cls, problem: str, /) -> ProblemConfig:
         config = cls.get_config(problem)
+        config.activate()
         ProblemConfig.context = problem
         return config
@@ -1,14 +1,23 @@
 from __future__ import annotations
 
+import functools
 import itertools
+import os
 import random
-from collections import deque
+import struct
+import sys
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
 from math import ceil
 from typing import (
+    Any,
     Callable,
     ClassVar,
+    Dict,
     Final,
     FrozenSet,
+    Iterable,
     List,
     Optional,
     Sequence,
@@ -21,15 +30,31 @@ from typing import (
     overload,
 )
 
-from tqdm import tqdm
+import numpy
+
 if TYPE_CHECKING:
     from typing_extensions import Self
 
 from .config import ProblemConfig
 from .errors import PopulationInitializationException
-from .utils import decode, educate, local_search
+from .population import PopulationStatistics
+from .utils import (
+    StopToken,
+    decode,
+    educate,
+    local_search,
+    local_search_cache_info,
+    nearest_customers,
+    path_cache_info,
+    resize_local_search_cache,
+    resize_path_cache,
+    setup_local_search_cache,
+    setup_path_cache,
+    sortie,
+    sorties_count,
+)
 from ..abc import SingleObjectiveIndividual
-from ..utils import LRUCache, SizeMonitoredSet, weighted_random, weighted_random_choice
+from ..utils import CachePolicy, LRUCache, MemoryBudget, SizeMonitoredSet, jaccard_distance, progress_bar, resident_memory, weighted_random, weighted_random_choice
 if TYPE_CHECKING:
     from .solutions import VRPDFDSolution
 
@@ -44,28 +69,86 @@ else:
     BaseIndividual = SingleObjectiveIndividual
 
 
+# Bitset width in bytes, trucks count, drones count
+_PATHS_HEADER = struct.Struct("<HHH")
+
+
+def _pack_paths(truck_paths: Tuple[FrozenSet[int], ...], drone_paths: Tuple[Tuple[FrozenSet[int], ...], ...], /) -> bytes:
+    # Header (bitset width, trucks count, drones count, paths count of each drone), then one bitset per path
+    width = max((max(path) for path in itertools.chain(truck_paths, *drone_paths) if len(path) > 0), default=0) // 8 + 1
+    header = _PATHS_HEADER.pack(width, len(truck_paths), len(drone_paths)) + struct.pack(f"<{len(drone_paths)}H", *map(len, drone_paths))
+    return header + b"".join(sum(1 << customer for customer in path).to_bytes(width, "little") for path in itertools.chain(truck_paths, *drone_paths))
+
+
+def _unpack_paths(data: bytes, /) -> Tuple[Tuple[FrozenSet[int], ...], Tuple[Tuple[FrozenSet[int], ...], ...]]:
+    width, trucks_count, drones_count = _PATHS_HEADER.unpack_from(data)
+    counts = struct.unpack_from(f"<{drones_count}H", data, _PATHS_HEADER.size)
+    offset = _PATHS_HEADER.size + 2 * drones_count
+
+    def paths(count: int) -> Tuple[FrozenSet[int], ...]:
+        nonlocal offset
+        result: List[FrozenSet[int]] = []
+        for _ in range(count):
+            bits = int.from_bytes(data[offset:offset + width], "little")
+            customers: List[int] = []
+            while bits > 0:
+                lowest = bits & -bits
+                customers.append(lowest.bit_length() - 1)
+                bits ^= lowest
+
+            result.append(frozenset(customers))
+            offset += width
+
+        return tuple(result)
+
+    truck_paths = paths(trucks_count)
+    return truck_paths, tuple(paths(count) for count in counts)
+
+
+def _cache_entry_size(key: Tuple[Tuple[FrozenSet[int], ...], Tuple[Tuple[FrozenSet[int], ...], ...]], value: VRPDFDIndividual) -> int:
+    # The paths of the value are shared with its canonical key, only its own slots are counted
+    truck_paths, drone_paths = key
+    size = sys.getsizeof(key) + sys.getsizeof(truck_paths) + sum(map(sys.getsizeof, truck_paths)) + sys.getsizeof(drone_paths)
+    for paths in drone_paths:
+        size += sys.getsizeof(paths) + sum(map(sys.getsizeof, paths))
+
+    return size + sys.getsizeof(value)
+
+
 @final
 class VRPDFDIndividual(BaseIndividual):
 
     __slots__ = (
         "__cls",
         "__stuck_penalty",
+        "__cost",
+        "__violation",
+        "__fined_cost",
         "__decoded",
         "__educated",
         "__local_searched",
+        "__weakref__",
         "truck_paths",
         "drone_paths",
     )
     genetic_algorithm_generation: ClassVar[int] = 0
     genetic_algorithm_last_improved: ClassVar[int] = 0
     genetic_algorithm_result: ClassVar[Optional[VRPDFDIndividual]] = None
-    cache: ClassVar[LRUCache[Tuple[Tuple[FrozenSet[int], ...], Tuple[Tuple[FrozenSet[int], ...], ...]], VRPDFDIndividual]] = LRUCache(10000)
+    cache: ClassVar[LRUCache[Tuple[Tuple[FrozenSet[int], ...], Tuple[Tuple[FrozenSet[int], ...], ...]], VRPDFDIndividual]] = LRUCache(10000, sizeof=_cache_entry_size)
+    cold_cache: ClassVar[LRUCache[bytes, bytes]] = LRUCache(0)
+    cache_budget: ClassVar[Optional[MemoryBudget]] = None
+    __generation_started: ClassVar[float] = 0.0
+    __local_search_executor: ClassVar[Optional[ThreadPoolExecutor]] = None
+    __local_search_jobs: ClassVar[Dict[VRPDFDIndividual, Tuple[Future[Tuple[List[VRPDFDIndividual], List[VRPDFDIndividual]]], StopToken]]] = {}
     if TYPE_CHECKING:
         __cls: Final[Type[VRPDFDSolution]]
         __stuck_penalty: float
-        __decoded: Optional[VRPDFDSolution]
-        __educated: Optional[VRPDFDIndividual]
-        __local_searched: Optional[Tuple[Optional[VRPDFDIndividual], VRPDFDIndividual]]
+        __cost: Optional[float]
+        __violation: Optional[Tuple[float, float]]
+        __fined_cost: Optional[Tuple[Tuple[float, float], float]]
+        __decoded: Optional[weakref.ref[VRPDFDSolution]]
+        __educated: Optional[weakref.ref[VRPDFDIndividual]]
+        __local_searched: Optional[Tuple[Optional[weakref.ref[VRPDFDIndividual]], weakref.ref[VRPDFDIndividual]]]
         truck_paths: Final[Tuple[FrozenSet[int], ...]]
         drone_paths: Final[Tuple[Tuple[FrozenSet[int], ...], ...]]
 
@@ -77,14 +160,25 @@ class VRPDFDIndividual(BaseIndividual):
         drone_paths: Tuple[Tuple[FrozenSet[int], ...], ...],
         decoded: Optional[VRPDFDSolution] = None,
         local_searched: Optional[Tuple[Optional[VRPDFDIndividual], VRPDFDIndividual]] = None,
+        evaluation: Optional[Tuple[float, Tuple[float, float]]] = None,
     ) -> None:
+        # Derivation links are weak references, so that evicting an individual from the cache
+        # frees everything derived from it. The cost and violation are kept, the solution is
+        # decoded again when needed.
         self.__cls = solution_cls
         self.__stuck_penalty = 0
-        self.__decoded = decoded
+        self.__cost, self.__violation = (None, None) if evaluation is None else evaluation
+        self.__fined_cost = None
+        self.__decoded = None
         self.__educated = None
-        self.__local_searched = local_searched
+        self.__local_searched = None
         self.truck_paths = truck_paths
         self.drone_paths = drone_paths
+        if decoded is not None:
+            self.__remember_decoded(decoded)
+
+        if local_searched is not None:
+            self.__remember_local_searched(local_searched)
 
     @classmethod
     def from_cache(
@@ -99,25 +193,94 @@ class VRPDFDIndividual(BaseIndividual):
         tuplized_drone_paths = tuple(tuple(filter(lambda path: len(path) > 1, sorted(paths, key=tuple))) for paths in drone_paths)
         hashed = truck_paths, tuplized_drone_paths
 
-        try:
-            return cls.cache[hashed]
+        result = cls.cache.get(hashed)
+        if result is not None:
+            return result
+
+        if cls.cold_cache.capacity > 0:
+            result = cls.__from_cold_cache(hashed, solution_cls=solution_cls)
+            if result is not None:
+                return result
 
-        except KeyError:
-            unique = cls(
+        unique = cls(
+            solution_cls=solution_cls,
+            truck_paths=truck_paths,
+            drone_paths=tuplized_drone_paths,
+            decoded=decoded,
+            local_searched=local_searched,
+        ).decode().encode(create_new=True)  # ensure uniqueness
+
+        canonical = unique.truck_paths, unique.drone_paths
+        result = cls.cache.peek(canonical)
+        if result is None:
+            result = unique
+
+        cls.cache.set_many(((hashed, result), (canonical, result)))
+        return result
+
+    @classmethod
+    def __from_cold_cache(
+        cls,
+        hashed: Tuple[Tuple[FrozenSet[int], ...], Tuple[Tuple[FrozenSet[int], ...], ...]],
+        /,
+        *,
+        solution_cls: Type[VRPDFDSolution],
+    ) -> Optional[VRPDFDIndividual]:
+        packed = cls.cold_cache.get(_pack_paths(*hashed))
+        if packed is None:
+            return None
+
+        cost, time_violation, weight_violation = struct.unpack_from("<3d", packed)
+        canonical = hashed if len(packed) == 24 else _unpack_paths(packed[24:])
+        result = cls.cache.peek(canonical)
+        if result is None:
+            result = cls(
                 solution_cls=solution_cls,
-                truck_paths=truck_paths,
-                drone_paths=tuplized_drone_paths,
-                decoded=decoded,
-                local_searched=local_searched,
-            ).decode().encode(create_new=True)  # ensure uniqueness
-
-            try:
-                result = cls.cache[unique.truck_paths, unique.drone_paths]
-            except KeyError:
-                result = unique
-
-            cls.cache[hashed] = cls.cache[unique.truck_paths, unique.drone_paths] = result
-            return result
+                truck_paths=canonical[0],
+                drone_paths=canonical[1],
+                evaluation=(cost, (time_violation, weight_violation)),
+            )
+
+        cls.cache.set_many(((hashed, result), (canonical, result)))
+        return result
+
+    @classmethod
+    def __demote(
+        cls,
+        hashed: Tuple[Tuple[FrozenSet[int], ...], Tuple[Tuple[FrozenSet[int], ...], ...]],
+        individual: VRPDFDIndividual,
+        /,
+    ) -> None:
+        # Packed cost and violations, followed by the canonical paths if they differ from the key
+        packed = struct.pack("<3d", individual.base_cost, *individual.violation)
+        if hashed != (individual.truck_paths, individual.drone_paths):
+            packed += _pack_paths(individual.truck_paths, individual.drone_paths)
+
+        cls.cold_cache.set(_pack_paths(*hashed), packed)
+
+    @classmethod
+    def setup_cache(cls, capacity: int, /, *, policy: CachePolicy = "lru", cold_capacity: int = 0) -> None:
+        """Replace the individual cache with an empty one, the TSP and local search caches are set up alike
+
+        With a positive `cold_capacity`, individuals evicted from the cache are kept packed in
+        `cold_cache` and rebuilt from there without decoding them again.
+        """
+        cls.cold_cache = LRUCache(cold_capacity, policy=policy)
+        cls.cache = LRUCache(capacity, sizeof=_cache_entry_size, policy=policy, on_evict=cls.__demote if cold_capacity > 0 else None)
+        setup_path_cache(capacity, policy=policy)
+        setup_local_search_cache(capacity, policy=policy)
+
+    @classmethod
+    def setup_cache_memory(cls, memory: int, /) -> MemoryBudget:
+        """Share `memory` bytes between the individual, TSP and local search caches, rebalanced after each generation"""
+        budget = cls.cache_budget = MemoryBudget(memory)
+        budget.register("individual", info=cls.cache.to_json, resize=functools.partial(setattr, cls.cache, "memory"))
+        if cls.cold_cache.capacity > 0:
+            budget.register("cold_individual", info=cls.cold_cache.to_json, resize=functools.partial(setattr, cls.cold_cache, "memory"))
+
+        budget.register("tsp", info=path_cache_info, resize=resize_path_cache)
+        budget.register("local_search", info=local_search_cache_info, resize=resize_local_search_cache)
+        return budget
 
     @property
     def cls(self) -> Type[VRPDFDSolution]:
@@ -142,7 +305,7 @@ class VRPDFDIndividual(BaseIndividual):
         for index in range(len(path) - 1):
             current = path[index]
             next = path[index + 1]
-            distance += config.distances[current][next]
+            distance += config.distance_view[current, next]
 
         return distance
 
@@ -185,13 +348,40 @@ class VRPDFDIndividual(BaseIndividual):
         )
 
     def feasible(self) -> bool:
-        decoded = self.decode()
-        return decoded.feasible()
+        return max(self.violation) == 0
+
+    @property
+    def base_cost(self) -> float:
+        if self.__cost is None:
+            self.decode()
+
+        assert self.__cost is not None
+        return self.__cost
 
     @property
     def cost(self) -> float:
-        decoded = self.decode()
-        return decoded.cost
+        # Memoized along with the fine coefficient it was computed with: the coefficient tuple is
+        # replaced, never mutated, so an identity check tells whether it has been tuned since
+        fine_coefficient = self.__cls.fine_coefficient
+        fined_cost = self.__fined_cost
+        if fined_cost is not None and fined_cost[0] is fine_coefficient:
+            return fined_cost[1]
+
+        cost = self.base_cost + sum(coeff * vio for coeff, vio in zip(fine_coefficient, self.violation, strict=True))
+        self.__fined_cost = fine_coefficient, cost
+        return cost
+
+    @property
+    def violation(self) -> Tuple[float, float]:
+        if self.__violation is None:
+            self.decode()
+
+        assert self.__violation is not None
+        return self.__violation
+
+    @property
+    def stuck_penalty(self) -> float:
+        return self.__stuck_penalty
 
     @property
     def penalized_cost(self) -> float:
@@ -202,8 +392,15 @@ class VRPDFDIndividual(BaseIndividual):
         assert config.stuck_penalty_increase_rate is not None
         self.__stuck_penalty *= config.stuck_penalty_increase_rate
 
+    def __remember_decoded(self, decoded: VRPDFDSolution, /) -> None:
+        self.__decoded = weakref.ref(decoded)
+        if self.__cost is None:
+            self.__cost = decoded.base_cost
+            self.__violation = decoded.violation
+
     def decode(self) -> VRPDFDSolution:
-        if self.__decoded is None:
+        decoded = None if self.__decoded is None else self.__decoded()
+        if decoded is None:
             config = ProblemConfig.get_config()
 
             truck_paths_mapping, drone_paths_mapping = decode(
@@ -240,14 +437,15 @@ class VRPDFDIndividual(BaseIndividual):
                     drone_distances[-1].append(distance)
                     drone_paths[-1].append(tuple((customer, drone_paths_mapping[drone][path_index][customer]) for customer in ordered))
 
-            self.__decoded = self.cls(
+            decoded = self.cls(
                 truck_paths=tuple(truck_paths),
                 drone_paths=tuple(map(tuple, drone_paths)),
                 truck_distances=tuple(truck_distances),
                 drone_distances=tuple(map(tuple, drone_distances)),
             )
+            self.__remember_decoded(decoded)
 
-        return self.__decoded
+        return decoded
 
     def crossover(self, other: Self) -> List[VRPDFDIndividual]:
         # flatten paths into a single array
@@ -297,6 +495,18 @@ class VRPDFDIndividual(BaseIndividual):
                 distances = [self.calculate_distance(path) for path in paths]
                 path_index = weighted_random_choice([1 / d if d > 0.0 else 10 ** 6 for d in distances])
 
+                if config.neighbors_limit > 0:
+                    # Granular neighborhood: only consider customers close to this path, plus the absent
+                    # customers with unmet demands, which may be far from every path
+                    candidates = set(itertools.chain.from_iterable(nearest_customers(c) for c in paths[path_index]))
+                    present = set(itertools.chain.from_iterable(paths))
+                    candidates.update(c for c in random_customers if c not in present and config.customers[c].low > 0)
+                    candidates.difference_update(paths[path_index])
+                    if len(candidates) > 0:
+                        customer = random.choice(sorted(candidates))
+                        paths[path_index] = paths[path_index].union([customer])
+                        return self.reconstruct(paths)
+
                 for customer in random_customers:
                     if customer not in paths[path_index]:
                         new_path = paths[path_index].union([customer])
@@ -306,12 +516,20 @@ class VRPDFDIndividual(BaseIndividual):
                 return self.reconstruct(paths)
 
             def append_path(_: List[FrozenSet[int]]) -> VRPDFDIndividual:
+                drone = random.randint(0, config.drones_count - 1)
+                if config.sortie_limit > 0:
+                    # Draw a feasible sortie from the catalogue
+                    for customer in random_customers:
+                        count = sorties_count(customer)
+                        if count > 0:
+                            ordered = sortie(customer, random.randrange(count))[1]
+                            return self.append_drone_path(drone, frozenset(ordered))
+
                 customer = random_customers[0]
                 for customer in random_customers:
-                    if 2 * config.distances[0][customer] <= config.drone.speed * config.drone.time_limit:
+                    if 2 * config.distance_view[0, customer] <= config.drone.speed * config.drone.time_limit:
                         break
 
-                drone = random.randint(0, config.drones_count - 1)
                 path = frozenset([0, customer])
 
                 return self.append_drone_path(drone, path)
@@ -327,20 +545,65 @@ class VRPDFDIndividual(BaseIndividual):
         return self
 
     def educate(self) -> VRPDFDIndividual:
-        if self.__educated is None:
-            self.__educated = educate(self)
+        educated = None if self.__educated is None else self.__educated()
+        if educated is None:
+            educated = educate(self)
+            self.__educated = weakref.ref(educated)
 
-        return self.__educated
+        return educated
 
     @property
     def local_searched(self) -> bool:
+        """Whether local search was applied to this individual, its results may have been freed since"""
         return self.__local_searched is not None
 
-    def local_search(self, *, prioritize_feasible: bool = False, updater: Callable[[VRPDFDIndividual], None]) -> VRPDFDIndividual:
+    def __remember_local_searched(self, local_searched: Tuple[Optional[VRPDFDIndividual], VRPDFDIndividual], /) -> None:
+        feasible, any = local_searched
+        self.__local_searched = None if feasible is None else weakref.ref(feasible), weakref.ref(any)
+
+    def __recall_local_searched(self) -> Optional[Tuple[Optional[VRPDFDIndividual], VRPDFDIndividual]]:
         if self.__local_searched is None:
-            self.__local_searched = local_search(self, updater)
+            return None
+
+        feasible_ref, any_ref = self.__local_searched
+        feasible = None if feasible_ref is None else feasible_ref()
+        any = any_ref()
+        if any is None or (feasible_ref is not None and feasible is None):
+            return None
+
+        return feasible, any
 
-        feasible, any = self.__local_searched
+    def local_search(
+        self,
+        *,
+        prioritize_feasible: bool = False,
+        updater: Callable[[VRPDFDIndividual], None],
+        deadline: Optional[float] = None,
+        max_evaluations: Optional[int] = None,
+        stop: Optional[StopToken] = None,
+    ) -> VRPDFDIndividual:
+        """Return the result of local search from this individual
+
+        The search stops early with the best individual found so far at `deadline` (a
+        `time.monotonic()` value) or after `max_evaluations` candidates. Either way, the
+        result is memoized as this individual's local search result, until the resulting
+        individuals are freed. A search interrupted by `stop` returns its partial result
+        without memoizing it.
+        """
+        local_searched = self.__recall_local_searched()
+        if local_searched is None:
+            local_searched = local_search(
+                self,
+                updater,
+                fine_coefficient=self.cls.fine_coefficient,
+                time_limit=None if deadline is None else max(deadline - time.monotonic(), 0.0),
+                max_evaluations=max_evaluations,
+                stop=stop,
+            )
+            if stop is None or not stop.stopped:
+                self.__remember_local_searched(local_searched)
+
+        feasible, any = local_searched
         if prioritize_feasible and feasible is not None:
             return feasible
         else:
@@ -357,6 +620,7 @@ class VRPDFDIndividual(BaseIndividual):
         verbose: bool,
         updater: Callable[[VRPDFDIndividual], None],
     ) -> None:
+        cls.__generation_started = time.perf_counter()
         result.cls.tune_fine_coefficients(population)
 
     @classmethod
@@ -370,41 +634,49 @@ class VRPDFDIndividual(BaseIndividual):
         verbose: bool,
         updater: Callable[[VRPDFDIndividual], None],
     ) -> None:
+        hook_started = time.perf_counter()
         cls.genetic_algorithm_generation = generation
         cls.genetic_algorithm_last_improved = last_improved
         cls.genetic_algorithm_result = result
         config = ProblemConfig.get_config()
 
-        if config.logger is not None:
-            best = min(population)
-            worst = max(population)
-            average_cost = sum(individual.cost for individual in population) / len(population)
-            feasible_count = len([i for i in population if i.feasible()])
-
-            decoded = set(individual.decode() for individual in population)
-            violations = (
-                sum(s.violation[0] for s in decoded) / len(decoded),
-                sum(s.violation[1] for s in decoded) / len(decoded),
-            )
+        if cls.cache_budget is not None:
+            cls.cache_budget.rebalance()
 
+        if config.logger is not None:
+            statistics = PopulationStatistics(population)
+            costs = statistics.costs(result.cls.fine_coefficient)
+            time_violation, weight_violation = statistics.average_violation()
+            individual_cache = cls.cache.to_json()
+            tsp_cache = path_cache_info()
+            local_search_cache = local_search_cache_info()
             config.logger.write(
-                ",".join(
-                    map(
-                        str,
-                        (
-                            generation + 1,
-                            result.cost,
-                            best.cost,
-                            worst.cost,
-                            average_cost,
-                            feasible_count,
-                            *result.cls.fine_coefficient,
-                            *violations,
-                        ),
-                    ),
-                ),
+                {
+                    "Generation": generation + 1,
+                    "Current result": result.cost,
+                    "Population best": float(costs.min()),
+                    "Population worst": float(costs.max()),
+                    "Population average": float(costs.mean()),
+                    "Feasible count": statistics.feasible_count(),
+                    "Time violation coefficient": result.cls.fine_coefficient[0],
+                    "Weight violation coefficient": result.cls.fine_coefficient[1],
+                    "Average time violation": time_violation,
+                    "Average weight violation": weight_violation,
+                    "Population size": len(statistics),
+                    "Generation time": time.perf_counter() - cls.__generation_started,
+                    "Individual cache hit": individual_cache["hit"],
+                    "Individual cache miss": individual_cache["miss"],
+                    "TSP cache hit": tsp_cache["hit"],
+                    "TSP cache miss": tsp_cache["miss"],
+                    "Local search cache hit": local_search_cache["hit"],
+                    "Local search cache miss": local_search_cache["miss"],
+                },
             )
-            config.logger.write("\n")
+
+        if len(cls.__local_search_jobs) > 0:
+            collected = cls.__collect_local_search_jobs(population=population, updater=updater)
+            if collected > 0 and config.logger is not None:
+                config.logger.note(f"Injected {collected} background local search results")
 
         last_improved_distance = generation - last_improved
         if (
@@ -422,64 +694,219 @@ class VRPDFDIndividual(BaseIndividual):
             sorted_population = sorted(population, key=lambda i: i.penalized_cost)[:population_size]
 
             if config.logger is not None:
-                config.logger.write("\"Increasing stuck penalty and applying local search\"\n")
+                config.logger.note("Increasing stuck penalty and applying local search")
 
             local_searched: List[VRPDFDIndividual] = []
             not_local_searched: List[VRPDFDIndividual] = []
             for individual in sorted_population:
+                if individual in cls.__local_search_jobs:
+                    continue
+
                 target = local_searched if individual.local_searched else not_local_searched
                 target.append(individual)
 
             assert config.local_search_batch is not None
-            to_local_search = set(
-                map(
-                    not_local_searched.__getitem__,
-                    weighted_random(
-                        [1 + 1 / (index + 1) for index in range(len(not_local_searched))],
-                        count=min(config.local_search_batch, len(not_local_searched)),
+            batch_size = min(config.local_search_batch, len(not_local_searched))
+            if config.local_search_queue:
+                batch_size = min(batch_size, config.local_search_queue - len(cls.__local_search_jobs))
+
+            to_local_search = list(
+                dict.fromkeys(
+                    map(
+                        not_local_searched.__getitem__,
+                        weighted_random(
+                            [1 + 1 / (index + 1) for index in range(len(not_local_searched))],
+                            count=max(batch_size, 0),
+                        ),
                     ),
                 ),
             )
 
-            population.difference_update(to_local_search)
+            if config.local_search_queue:
+                # The sources stay in the population and keep evolving, their results are
+                # injected at a later generation boundary
+                if cls.__local_search_executor is None:
+                    cls.__local_search_executor = ThreadPoolExecutor(max_workers=config.local_search_workers or 1)
 
-            iterable: Union[tqdm[VRPDFDIndividual], Set[VRPDFDIndividual]] = to_local_search
-            if verbose:
-                iterable = tqdm(iterable, desc=f"Local search (#{generation + 1})", ascii=" █", colour="red")
+                for individual in to_local_search:
+                    stop = StopToken()
+                    cls.__local_search_jobs[individual] = cls.__local_search_executor.submit(cls.__two_layer_local_search, individual, stop=stop), stop
 
-            for individual in iterable:
-                # 2-layer local search
-                for states in itertools.product((True, False), repeat=2):
-                    current = individual
-                    for state in states:
-                        current = current.local_search(prioritize_feasible=state, updater=updater)
+            else:
+                population.difference_update(to_local_search)
 
-                    population.add(current)
+                # Local search releases the GIL, so a thread pool runs the batch in parallel. Workers pull
+                # individuals from a shared queue, which balances the very uneven local search times.
+                executor = None
+                if config.local_search_workers is not None and config.local_search_workers > 1:
+                    executor = ThreadPoolExecutor(max_workers=config.local_search_workers)
+
+                try:
+                    outcomes: Iterable[Tuple[List[VRPDFDIndividual], List[VRPDFDIndividual]]] = (
+                        map(cls.__two_layer_local_search, to_local_search)
+                        if executor is None
+                        else executor.map(cls.__two_layer_local_search, to_local_search)
+                    )
+                    if verbose:
+                        outcomes = progress_bar(outcomes, total=len(to_local_search), desc=f"Local search (#{generation + 1})", ascii=" █", colour="red")
+
+                    for results, updates in outcomes:
+                        for individual in updates:
+                            updater(individual)
+
+                        population.update(results)
+
+                finally:
+                    if executor is not None:
+                        executor.shutdown(cancel_futures=True)
 
             sorted_population = sorted(population, key=lambda i: i.penalized_cost)  # mysterious speed-up, even though individuals already support rich comparison
             population.clear()
             population.update(sorted_population[:population_size])
 
+        if config.telemetry is not None and config.telemetry.clients > 0:
+            config.telemetry.publish(cls.__telemetry_event(generation=generation, result=result, population=population, hook_started=hook_started))
+
     @classmethod
-    def selection(cls, *, population: FrozenSet[Self], size: int) -> Set[Self]:
-        population_sorted = sorted(population, key=lambda i: i.penalized_cost)
+    def __telemetry_event(
+        cls,
+        *,
+        generation: int,
+        result: VRPDFDIndividual,
+        population: Set[VRPDFDIndividual],
+        hook_started: float,
+    ) -> Dict[str, Any]:
+        statistics = PopulationStatistics(population)
+        caches = {"individual": cls.cache.to_json(), "tsp": path_cache_info(), "local_search": local_search_cache_info()}
+
+        # Diversity is the average Jaccard distance between the paths of neighbouring individuals in
+        # the (arbitrary) set order, which samples pairs without drawing from the GA random state
+        path_ids: Dict[FrozenSet[int], int] = {}
+        routes = [{path_ids.setdefault(path, len(path_ids)) for path in itertools.chain(i.truck_paths, *i.drone_paths)} for i in statistics.individuals[:101]]
+        pairs = list(zip(routes, routes[1:]))
+        diversity = sum(jaccard_distance(first, second) for first, second in pairs) / max(len(pairs), 1)
+
+        return {
+            "event": "generation",
+            "problem": ProblemConfig.get_config().problem,
+            "pid": os.getpid(),
+            "generation": generation + 1,
+            "best_cost": result.cost,
+            "feasible": result.feasible(),
+            "population_best": float(statistics.costs(result.cls.fine_coefficient).min()),
+            "feasible_count": statistics.feasible_count(),
+            "timings": {
+                "evolution": hook_started - cls.__generation_started,
+                "hook": time.perf_counter() - hook_started,
+            },
+            "cache_hit_rates": {name: info["hit"] / max(info["hit"] + info["miss"], 1) for name, info in caches.items()},
+            "diversity": diversity,
+            "rss": resident_memory(),
+        }
 
-        feasible = list(filter(lambda i: i.feasible(), population_sorted))
-        infeasible = deque(filter(lambda i: not i.feasible(), population_sorted))
+    @classmethod
+    def after_algorithm_hook(
+        cls,
+        *,
+        result: VRPDFDIndividual,
+        population: Set[VRPDFDIndividual],
+        verbose: bool,
+    ) -> None:
+        if cls.__local_search_executor is not None:
+            # Stop the running jobs and wait for them to return, so that no search outlives the algorithm,
+            # their results are discarded
+            for _, stop in cls.__local_search_jobs.values():
+                stop.stop()
 
-        while len(feasible) > size // 2 and len(feasible) + len(infeasible) > size:
-            feasible.pop()
+            cls.__local_search_executor.shutdown(wait=True, cancel_futures=True)
+            cls.__local_search_executor = None
 
-        while len(feasible) < size:
-            feasible.append(infeasible.popleft())
+        cls.__local_search_jobs.clear()
 
-        return set(feasible)
+        config = ProblemConfig.get_config()
+        if config.telemetry is not None:
+            config.telemetry.publish({"event": "finished", "problem": config.problem, "pid": os.getpid(), "best_cost": result.cost, "feasible": result.feasible()})
+
+    @staticmethod
+    def __two_layer_local_search(individual: VRPDFDIndividual, *, stop: Optional[StopToken] = None) -> Tuple[List[VRPDFDIndividual], List[VRPDFDIndividual]]:
+        config = ProblemConfig.get_config()
+        deadline = None
+        if config.local_search_time_limit is not None:
+            # The time budget covers both layers
+            deadline = time.monotonic() + config.local_search_time_limit
+
+        # Updates are collected and replayed in the batch order, regardless of which worker finishes first
+        results: List[VRPDFDIndividual] = []
+        updates: List[VRPDFDIndividual] = []
+        for states in itertools.product((True, False), repeat=2):
+            current = individual
+            for state in states:
+                current = current.local_search(
+                    prioritize_feasible=state,
+                    updater=updates.append,
+                    deadline=deadline,
+                    max_evaluations=config.local_search_evaluations,
+                    stop=stop,
+                )
+
+            results.append(current)
+
+        return results, updates
+
+    @classmethod
+    def __collect_local_search_jobs(cls, *, population: Set[VRPDFDIndividual], updater: Callable[[VRPDFDIndividual], None]) -> int:
+        """Inject the results of completed background jobs into `population`, and cancel the jobs
+        whose source was eliminated from it
+
+        Running jobs are asked to stop through their token, their partial results are discarded. The
+        population is truncated back to its original size. Returns the number of injected jobs.
+        """
+        population_size = len(population)
+        collected = 0
+        for source, (job, stop) in list(cls.__local_search_jobs.items()):  # in submission order
+            if job.done():
+                del cls.__local_search_jobs[source]
+                results, updates = job.result()
+                for individual in updates:
+                    updater(individual)
+
+                population.update(results)
+                collected += 1
+
+            elif source not in population:
+                stop.stop()
+                job.cancel()
+                del cls.__local_search_jobs[source]
+
+        if len(population) > population_size:
+            sorted_population = sorted(population, key=lambda i: i.penalized_cost)
+            population.clear()
+            population.update(sorted_population[:population_size])
+
+        return collected
+
+    @classmethod
+    def selection(cls, *, population: FrozenSet[Self], size: int) -> Set[Self]:
+        statistics = PopulationStatistics(population)
+        if len(statistics) == 0:
+            return set()
+
+        ranks = statistics.ranks(statistics.individuals[0].cls.fine_coefficient)
+        feasible = ranks[statistics.feasible[ranks]]
+        infeasible = ranks[~statistics.feasible[ranks]]
+
+        # Keep the best feasible individuals, but leave at least half of the population to the
+        # infeasible ones when there are enough of them
+        feasible = feasible[:max(size // 2, size - len(infeasible))]
+        selected = numpy.concatenate((feasible, infeasible[:size - len(feasible)]))
+        return {statistics.individuals[index] for index in selected}
 
     @classmethod
     def parents_selection(cls, *, population: FrozenSet[Self]) -> Tuple[Self, Self]:
-        population_sorted = sorted(population, key=lambda i: i.penalized_cost)
+        statistics = PopulationStatistics(population)
+        ranks = statistics.ranks(statistics.individuals[0].cls.fine_coefficient)
         first, second = weighted_random([1 + 1 / (2 * index + 1) for index in range(len(population))], count=2)
-        return population_sorted[first], population_sorted[second]
+        return statistics.individuals[ranks[first]], statistics.individuals[ranks[second]]
 
     @classmethod
     def initial(cls, *, solution_cls: Type[VRPDFDSolution], size: int, verbose: bool) -> Set[VRPDFDIndividual]:
@@ -497,7 +924,7 @@ class VRPDFDIndividual(BaseIndividual):
                     )
                 )
 
-            distances_to_port = [config.distances[0][customer] for customer in range(len(config.customers))]
+            distances_to_port = [config.distance_view[0, customer] for customer in range(len(config.customers))]
             customers_sorted = sorted(range(1, len(config.customers)), key=distances_to_port.__getitem__)
             nearest = customers_sorted[:len(customers_sorted) // 2]
             furthest = customers_sorted[len(customers_sorted) // 2:]
@@ -528,7 +955,7 @@ class VRPDFDIndividual(BaseIndividual):
 
                 drone_paths = paths[config.trucks_count:]
                 try:
-                    first, second = weighted_random([config.distances[0][sorted(path)[-1]] for path in drone_paths], count=2)
+                    first, second = weighted_random([config.distance_view[0, sorted(path)[-1]] for path in drone_paths], count=2)
                 except ValueError:
                     return original.mutate()
 
@@ -556,5 +983,29 @@ class VRPDFDIndividual(BaseIndividual):
     def __repr__(self) -> str:
         return f"VRPDFDIndividual(solution_cls=VRPDFDSolution, truck_paths={self.truck_paths!r}, drone_paths={self.drone_paths!r})"
 
+    # The class is final, so the exact type check replaces the isinstance checks of BaseCostComparison
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is VRPDFDIndividual:
+            return self.cost == other.cost
+
+        return NotImplemented
+
+    def __lt__(self, other: Any) -> bool:
+        if type(other) is VRPDFDIndividual:
+            return self.cost < other.cost
+
+        return NotImplemented
+
+    def __gt__(self, other: Any) -> bool:
+        if type(other) is VRPDFDIndividual:
+            return self.cost > other.cost
+
+        return NotImplemented
+
     def __hash__(self) -> int:
         return hash((self.truck_paths, self.drone_paths))
+
+    def __reduce__(self) -> Tuple[Callable[[], VRPDFDIndividual], Tuple[()]]:
+        # Only the genome and its evaluation are pickled, weak references cannot be
+        evaluation = None if self.__cost is None or self.__violation is None else (self.__cost, self.__violation)
+        return functools.partial(VRPDFDIndividual, solution_cls=self.__cls, truck_paths=self.truck_paths, drone_paths=self.drone_paths, evaluation=evaluation), ()
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import itertools
+from typing import Dict, Final, FrozenSet, Iterable, Tuple, TYPE_CHECKING
+
+import numpy
+
+if TYPE_CHECKING:
+    from numpy.typing import NDArray
+
+    from .individuals import VRPDFDIndividual
+
+
+__all__ = ("PopulationStatistics",)
+
+
+class PopulationStatistics:
+    """The evaluation of a population as arrays, one element per individual
+
+    Fields are gathered in a single pass over the population, statistics are then
+    computed as vectorized operations instead of repeated walks through the individuals.
+    """
+
+    __slots__ = (
+        "individuals",
+        "base_costs",
+        "time_violations",
+        "weight_violations",
+        "stuck_penalties",
+        "feasible",
+    )
+    if TYPE_CHECKING:
+        individuals: Final[Tuple[VRPDFDIndividual, ...]]
+        base_costs: Final[NDArray[numpy.float64]]
+        time_violations: Final[NDArray[numpy.float64]]
+        weight_violations: Final[NDArray[numpy.float64]]
+        stuck_penalties: Final[NDArray[numpy.float64]]
+        feasible: Final[NDArray[numpy.bool_]]
+
+    def __init__(self, population: Iterable[VRPDFDIndividual], /) -> None:
+        self.individuals = tuple(population)
+        fields = numpy.fromiter(
+            itertools.chain.from_iterable((i.base_cost, *i.violation, i.stuck_penalty) for i in self.individuals),
+            dtype=numpy.float64,
+            count=4 * len(self.individuals),
+        ).reshape(len(self.individuals), 4)
+
+        self.base_costs = fields[:, 0]
+        self.time_violations = fields[:, 1]
+        self.weight_violations = fields[:, 2]
+        self.stuck_penalties = fields[:, 3]
+        self.feasible = (self.time_violations == 0) & (self.weight_violations == 0)
+
+    def __len__(self) -> int:
+        return len(self.individuals)
+
+    def costs(self, fine_coefficient: Tuple[float, float], /) -> NDArray[numpy.float64]:
+        """The costs of the individuals under `fine_coefficient`, as `VRPDFDIndividual.cost`"""
+        time_coefficient, weight_coefficient = fine_coefficient
+        return self.base_costs + (time_coefficient * self.time_violations + weight_coefficient * self.weight_violations)
+
+    def penalized_costs(self, fine_coefficient: Tuple[float, float], /) -> NDArray[numpy.float64]:
+        """The costs of the individuals with their stuck penalties, as `VRPDFDIndividual.penalized_cost`"""
+        return self.costs(fine_coefficient) + self.stuck_penalties
+
+    def ranks(self, fine_coefficient: Tuple[float, float], /) -> NDArray[numpy.intp]:
+        """Indices of the individuals in ascending order of penalized cost, ties keep the population order"""
+        return numpy.argsort(self.penalized_costs(fine_coefficient), kind="stable")
+
+    def distinct(self) -> PopulationStatistics:
+        """The statistics of the first individual of each distinct genome, in population order"""
+        genomes: Dict[Tuple[Tuple[FrozenSet[int], ...], Tuple[Tuple[FrozenSet[int], ...], ...]], VRPDFDIndividual] = {}
+        for individual in self.individuals:
+            genomes.setdefault((individual.truck_paths, individual.drone_paths), individual)
+
+        return self if len(genomes) == len(self.individuals) else PopulationStatistics(genomes.values())
+
+    def average_violation(self) -> Tuple[float, float]:
+        return float(self.time_violations.mean()), float(self.weight_violations.mean())
+
+    def feasible_count(self) -> int:
+        return int(numpy.count_nonzero(self.feasible))
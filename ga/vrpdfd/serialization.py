@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+import itertools
+import struct
+from array import array
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple, Type, TYPE_CHECKING
+
+from .individuals import VRPDFDIndividual
+from .solutions import VRPDFDSolution
+
+if TYPE_CHECKING:
+    from typing_extensions import Buffer
+
+
+__all__ = (
+    "SERIALIZED_VERSION",
+    "dumps",
+    "loads",
+)
+
+
+SERIALIZED_MAGIC = b"VRPDFDS\x00"
+SERIALIZED_VERSION = 1
+
+# magic, version, individuals count, solutions count
+_HEADER = struct.Struct("<8sIII")
+_SECTION = struct.Struct("<Q")
+
+# Sections following the header, each an item count then the items in native byte order:
+# - the distinct paths of all individuals: length of each path, then their customers
+# - the individuals: (trucks count, drones count, paths count of each drone, index of each path)
+#   each, then (base cost, time violation, weight violation) each
+# - the solutions: (trucks count, drones count, paths count of each drone, length of each path)
+#   each, then the customers and volumes of all paths, then the distance of each path
+_SECTIONS = "IHIdIHId"
+
+
+def dumps(*, individuals: Iterable[VRPDFDIndividual] = (), solutions: Iterable[VRPDFDSolution] = ()) -> bytes:
+    """Serialize individuals (e.g. a population) and solutions, see `loads`
+
+    Individuals keep their cost and violation, and the paths they share are stored once.
+    """
+    path_indices: Dict[FrozenSet[int], int] = {}
+    individual_structure = array("I")
+    evaluations = array("d")
+    individuals_count = 0
+    for individual in individuals:
+        individual_structure.extend((len(individual.truck_paths), len(individual.drone_paths), *map(len, individual.drone_paths)))
+        individual_structure.extend(path_indices.setdefault(path, len(path_indices)) for path in itertools.chain(individual.truck_paths, *individual.drone_paths))
+        evaluations.extend((individual.base_cost, *individual.violation))
+        individuals_count += 1
+
+    solution_structure = array("I")
+    solution_customers = array("H")
+    solution_volumes = array("I")
+    distances = array("d")
+    solutions_count = 0
+    for solution in solutions:
+        paths = (*solution.truck_paths, *itertools.chain.from_iterable(solution.drone_paths))
+        solution_structure.extend((len(solution.truck_paths), len(solution.drone_paths), *map(len, solution.drone_paths), *map(len, paths)))
+        for path in paths:
+            for customer, volume in path:
+                solution_customers.append(customer)
+                solution_volumes.append(volume)
+
+        distances.extend(solution.truck_distances)
+        distances.extend(itertools.chain.from_iterable(solution.drone_distances))
+        solutions_count += 1
+
+    sections = (
+        array("I", map(len, path_indices)),
+        array("H", itertools.chain.from_iterable(path_indices)),
+        individual_structure,
+        evaluations,
+        solution_structure,
+        solution_customers,
+        solution_volumes,
+        distances,
+    )
+    chunks = [_HEADER.pack(SERIALIZED_MAGIC, SERIALIZED_VERSION, individuals_count, solutions_count)]
+    for section in sections:
+        chunks.append(_SECTION.pack(len(section)))
+        chunks.append(section.tobytes())
+
+    return b"".join(chunks)
+
+
+def loads(data: Buffer, /, *, solution_cls: Type[VRPDFDSolution] = VRPDFDSolution) -> Tuple[List[VRPDFDIndividual], List[VRPDFDSolution]]:
+    """Restore the individuals and solutions serialized by `dumps`, without decoding them"""
+    view = memoryview(data).cast("B")
+    magic, version, individuals_count, solutions_count = _HEADER.unpack_from(view)
+    if magic != SERIALIZED_MAGIC:
+        raise ValueError("Not a serialized VRPDFD object")
+
+    if version != SERIALIZED_VERSION:
+        raise ValueError(f"Unsupported serialization version {version} (expected {SERIALIZED_VERSION})")
+
+    offset = _HEADER.size
+    sections: List[array[Any]] = []
+    for code in _SECTIONS:
+        (count,) = _SECTION.unpack_from(view, offset)
+        section = array(code)
+        start = offset + _SECTION.size
+        offset = start + count * section.itemsize
+        if offset > len(view):
+            raise ValueError("Truncated serialized VRPDFD object")
+
+        section.frombytes(view[start:offset])
+        sections.append(section)
+
+    path_lengths: List[int] = sections[0].tolist()
+    path_customers: List[int] = sections[1].tolist()
+    individual_structure: List[int] = sections[2].tolist()
+    evaluations: List[float] = sections[3].tolist()
+    solution_structure: List[int] = sections[4].tolist()
+    solution_customers: List[int] = sections[5].tolist()
+    solution_volumes: List[int] = sections[6].tolist()
+    distances: List[float] = sections[7].tolist()
+
+    paths: List[FrozenSet[int]] = []
+    offset = 0
+    for length in path_lengths:
+        paths.append(frozenset(path_customers[offset:offset + length]))
+        offset += length
+
+    individuals: List[VRPDFDIndividual] = []
+    cursor = 0
+    for index in range(individuals_count):
+        trucks_count, drones_count = individual_structure[cursor:cursor + 2]
+        counts = individual_structure[cursor + 2:cursor + 2 + drones_count]
+        cursor += 2 + drones_count
+        truck_paths = tuple(map(paths.__getitem__, individual_structure[cursor:cursor + trucks_count]))
+        cursor += trucks_count
+
+        drone_paths: List[Tuple[FrozenSet[int], ...]] = []
+        for count in counts:
+            drone_paths.append(tuple(map(paths.__getitem__, individual_structure[cursor:cursor + count])))
+            cursor += count
+
+        cost, time_violation, weight_violation = evaluations[3 * index:3 * index + 3]
+        individuals.append(
+            VRPDFDIndividual(
+                solution_cls=solution_cls,
+                truck_paths=truck_paths,
+                drone_paths=tuple(drone_paths),
+                evaluation=(cost, (time_violation, weight_violation)),
+            ),
+        )
+
+    solutions: List[VRPDFDSolution] = []
+    cursor = stop = distance = 0
+    for _ in range(solutions_count):
+        trucks_count, drones_count = solution_structure[cursor:cursor + 2]
+        counts = solution_structure[cursor + 2:cursor + 2 + drones_count]
+        cursor += 2 + drones_count
+
+        stops: List[Tuple[Tuple[int, int], ...]] = []
+        for length in solution_structure[cursor:cursor + trucks_count + sum(counts)]:
+            stops.append(tuple(zip(solution_customers[stop:stop + length], solution_volumes[stop:stop + length])))
+            stop += length
+
+        cursor += len(stops)
+        path_distances = distances[distance:distance + len(stops)]
+        distance += len(stops)
+
+        drone_stops: List[Tuple[Tuple[Tuple[int, int], ...], ...]] = []
+        drone_distances: List[Tuple[float, ...]] = []
+        start = trucks_count
+        for count in counts:
+            drone_stops.append(tuple(stops[start:start + count]))
+            drone_distances.append(tuple(path_distances[start:start + count]))
+            start += count
+
+        solutions.append(
+            solution_cls(
+                truck_paths=tuple(stops[:trucks_count]),
+                drone_paths=tuple(drone_stops),
+                truck_distances=tuple(path_distances[:trucks_count]),
+                drone_distances=tuple(drone_distances),
+            ),
+        )
+
+    return individuals, solutions
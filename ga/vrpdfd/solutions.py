@@ -1,16 +1,17 @@
 from __future__ import annotations
 
+import functools
 import itertools
-from typing import ClassVar, Final, Iterable, List, Optional, Sequence, Tuple, Union, TYPE_CHECKING, final, overload
-
-from matplotlib import axes, pyplot
+import weakref
+from typing import Any, Callable, ClassVar, Final, Iterable, List, Optional, Sequence, Tuple, Union, TYPE_CHECKING, final, overload
 
 from .config import ProblemConfig
 from .errors import InfeasibleSolution
 from .individuals import VRPDFDIndividual
+from .population import PopulationStatistics
 from .types import SolutionInfo
 from ..abc import SingleObjectiveSolution
-from ..utils import isclose, positive_max
+from ..utils import isclose, positive_max, prepare_pyplot
 
 
 __all__ = ("VRPDFDSolution",)
@@ -29,6 +30,8 @@ class VRPDFDSolution(SingleObjectiveSolution[VRPDFDIndividual]):
         "__revenue",
         "__cost",
         "__violation",
+        "__fined_cost",
+        "__weakref__",
         "truck_paths",
         "drone_paths",
 
@@ -43,7 +46,7 @@ class VRPDFDSolution(SingleObjectiveSolution[VRPDFDIndividual]):
     fine_coefficient: ClassVar[Tuple[float, float]] = (0, 0)
     if TYPE_CHECKING:
         __hash: Optional[int]
-        __encoded: Optional[VRPDFDIndividual]
+        __encoded: Optional[weakref.ref[VRPDFDIndividual]]
         __truck_distance: Optional[float]
         __drone_distance: Optional[float]
         __truck_distances: Optional[Tuple[float, ...]]
@@ -51,6 +54,7 @@ class VRPDFDSolution(SingleObjectiveSolution[VRPDFDIndividual]):
         __revenue: Optional[int]
         __cost: Optional[float]
         __violation: Optional[Tuple[float, float]]
+        __fined_cost: Optional[Tuple[Tuple[float, float], float]]
         truck_paths: Final[Tuple[Tuple[Tuple[int, int], ...], ...]]
         drone_paths: Final[Tuple[Tuple[Tuple[Tuple[int, int], ...], ...], ...]]
 
@@ -87,6 +91,7 @@ class VRPDFDSolution(SingleObjectiveSolution[VRPDFDIndividual]):
         self.__revenue = revenue
         self.__cost = cost
         self.__violation = violation
+        self.__fined_cost = None
 
         config = ProblemConfig.get_config()
         self.truck_time_violations = tuple(self._approx(d / config.truck.speed - config.time_limit) for d in self.truck_distances)
@@ -184,7 +189,7 @@ class VRPDFDSolution(SingleObjectiveSolution[VRPDFDIndividual]):
         for index in range(len(path) - 1):
             current = path[index][0]
             next = path[index + 1][0]
-            distance += config.distances[current][next]
+            distance += config.distance_view[current, next]
 
         return distance
 
@@ -244,12 +249,25 @@ class VRPDFDSolution(SingleObjectiveSolution[VRPDFDIndividual]):
         return config.drone.cost_coefficient * self.drone_distance
 
     @property
-    def cost(self) -> float:
+    def base_cost(self) -> float:
+        """The cost of this solution without the fines of its violations"""
         if self.__cost is None:
             # We want to maximize profit i.e. minimize cost = -profit
             self.__cost = self.truck_cost + self.drone_cost - self.revenue
 
-        return self.__cost + sum(coeff * vio for coeff, vio in zip(self.fine_coefficient, self.violation, strict=True))
+        return self.__cost
+
+    @property
+    def cost(self) -> float:
+        # Memoized per fine coefficient tuple, see VRPDFDIndividual.cost
+        fine_coefficient = self.fine_coefficient
+        fined_cost = self.__fined_cost
+        if fined_cost is not None and fined_cost[0] is fine_coefficient:
+            return fined_cost[1]
+
+        cost = self.base_cost + sum(coeff * vio for coeff, vio in zip(fine_coefficient, self.violation, strict=True))
+        self.__fined_cost = fine_coefficient, cost
+        return cost
 
     @property
     def violation(self) -> Tuple[float, float]:
@@ -272,26 +290,27 @@ class VRPDFDSolution(SingleObjectiveSolution[VRPDFDIndividual]):
         return self.__violation
 
     def encode(self, *, create_new: bool = False) -> VRPDFDIndividual:
-        factory = VRPDFDIndividual if create_new else VRPDFDIndividual.from_cache
-        result = factory(
-            solution_cls=self.__class__,
-            truck_paths=tuple(map(lambda path: frozenset(c[0] for c in path), self.truck_paths)),
-            drone_paths=tuple(tuple(map(lambda path: frozenset(c[0] for c in path), paths)) for paths in self.drone_paths),
-            decoded=self,
-        )
-
-        if create_new:
-            return result
-
-        if self.__encoded is None:
-            self.__encoded = result
+        encoded = None if create_new or self.__encoded is None else self.__encoded()
+        if encoded is None:
+            factory = VRPDFDIndividual if create_new else VRPDFDIndividual.from_cache
+            encoded = factory(
+                solution_cls=self.__class__,
+                truck_paths=tuple(map(lambda path: frozenset(c[0] for c in path), self.truck_paths)),
+                drone_paths=tuple(tuple(map(lambda path: frozenset(c[0] for c in path), paths)) for paths in self.drone_paths),
+                decoded=self,
+            )
+            if not create_new:
+                self.__encoded = weakref.ref(encoded)
 
-        return self.__encoded
+        return encoded
 
     def feasible(self) -> bool:
         return max(self.violation) == 0
 
     def plot(self, file_name: Optional[str] = None) -> None:
+        prepare_pyplot()
+        from matplotlib import axes, pyplot
+
         _, ax = pyplot.subplots()
         assert isinstance(ax, axes.Axes)
 
@@ -384,17 +403,18 @@ class VRPDFDSolution(SingleObjectiveSolution[VRPDFDIndividual]):
         }
 
     @classmethod
-    def tune_fine_coefficients(cls, population: Iterable[VRPDFDIndividual]) -> None:
-        decoded = set(individual.decode() for individual in population)
-        violations = (
-            sum(s.violation[0] for s in decoded) / len(decoded),
-            sum(s.violation[1] for s in decoded) / len(decoded),
-        )
+    def tune_fine_coefficients(cls, population: Union[Iterable[VRPDFDIndividual], PopulationStatistics]) -> None:
+        statistics = population if isinstance(population, PopulationStatistics) else PopulationStatistics(population)
+
+        # Each genome counts once, however many times the population holds it
+        statistics = statistics.distinct()
+        violations = statistics.average_violation()
 
-        best = min(decoded)
-        worst = max(decoded)
-        # Note: VRPDFDSolution.cost does NOT include stuck penalty
-        base = max(worst.cost - best.cost, abs(worst.cost + best.cost))
+        # Note: VRPDFDIndividual.cost does NOT include stuck penalty
+        costs = statistics.costs(cls.fine_coefficient)
+        best = float(costs.min())
+        worst = float(costs.max())
+        base = max(worst - best, abs(worst + best))
 
         if max(violations) == 0:
             # The entire population is feasible
@@ -406,11 +426,40 @@ class VRPDFDSolution(SingleObjectiveSolution[VRPDFDIndividual]):
                 base * violations[1] / (violations[0] ** 2 + violations[1] ** 2),
             )
 
+    # The class is final, so the exact type check replaces the isinstance checks of BaseCostComparison
+    def __eq__(self, other: Any) -> bool:
+        if type(other) is VRPDFDSolution:
+            return self.cost == other.cost
+
+        return NotImplemented
+
+    def __lt__(self, other: Any) -> bool:
+        if type(other) is VRPDFDSolution:
+            return self.cost < other.cost
+
+        return NotImplemented
+
+    def __gt__(self, other: Any) -> bool:
+        if type(other) is VRPDFDSolution:
+            return self.cost > other.cost
+
+        return NotImplemented
+
     def __hash__(self) -> int:
         if self.__hash is None:
             self.__hash = hash((frozenset(self.truck_paths), frozenset(map(frozenset, self.drone_paths))))
 
         return self.__hash
 
+    def __reduce__(self) -> Tuple[Callable[[], VRPDFDSolution], Tuple[()]]:
+        # The violations are computed again, the weak link to the encoded individual cannot be pickled
+        return functools.partial(
+            VRPDFDSolution,
+            truck_paths=self.truck_paths,
+            drone_paths=self.drone_paths,
+            truck_distances=self.truck_distances,
+            drone_distances=self.drone_distances,
+        ), ()
+
     def __repr__(self) -> str:
         return f"VRPDFDSolution(truck_paths={self.truck_paths!r}, drone_paths={self.drone_paths!r})"
@@ -2,12 +2,13 @@ from __future__ import annotations
 
 from typing import Dict, Optional, Sequence, Tuple, TypedDict
 
-from ..utils import LRUCacheInfo
+from ..utils import CachePolicy, LRUCacheInfo
 
 
 __all__ = (
     "SolutionInfo",
     "CacheInfo",
+    "LocalSearchInfo",
     "SolutionJSON",
     "MILPSolutionJSON",
 )
@@ -22,8 +23,22 @@ class SolutionInfo(TypedDict):
 
 class CacheInfo(TypedDict):
     limit: int
+    cold_limit: int
+    memory: Optional[int]
+    policy: CachePolicy
     individual: LRUCacheInfo
+    cold_individual: LRUCacheInfo
     tsp: LRUCacheInfo
+    local_search: LRUCacheInfo
+
+
+class LocalSearchInfo(TypedDict):
+    calls: int
+    evaluations: int
+    exhausted: int
+    stopped: int
+    skipped: int
+    microseconds: int
 
 
 class SolutionJSON(TypedDict):
@@ -34,12 +49,15 @@ class SolutionJSON(TypedDict):
     reset_after: int
     stuck_penalty_increase_rate: float
     local_search_batch: int
+    local_search_time_limit: Optional[float]
+    local_search_evaluations: Optional[int]
     solution: SolutionInfo
     time: float
     fake_tsp_solver: bool
     last_improved: int
     extra: Optional[str]
     cache_info: CacheInfo
+    local_search_info: LocalSearchInfo
 
 
 class MILPSolutionJSON(TypedDict):
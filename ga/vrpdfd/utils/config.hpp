@@ -1,10 +1,15 @@
 #pragma once
 
 #include <algorithm>
+#include <atomic>
 #include <map>
-#include <numeric>
+#include <memory>
+#include <mutex>
+#include <optional>
 #include <set>
 #include <stdexcept>
+#include <tuple>
+#include <unordered_map>
 #include <vector>
 #ifdef DEBUG
 #include <iostream>
@@ -12,7 +17,9 @@
 
 #include "../../utils/helpers.hpp"
 #include "../../utils/lru_cache.hpp"
+#include "../../utils/nearest_neighbors.hpp"
 #include "../../utils/tsp_solver.hpp"
+#include "distance_matrix.hpp"
 
 typedef int volume_t;
 typedef std::pair<std::vector<std::set<unsigned>>, std::vector<std::vector<std::set<unsigned>>>> individual;
@@ -25,8 +32,9 @@ struct Customer
     const std::pair<double, double> location;
     static volume_t total_low, total_high;
     static std::vector<Customer> customers;
-    static std::vector<std::vector<double>> distances;
-    static std::vector<std::vector<unsigned>> nearests;
+    static std::shared_ptr<distance_matrix> distances;
+    static unsigned neighbors_limit;
+    static std::vector<std::vector<unsigned>> nearests; // at most neighbors_limit customers each, the depot excluded
 
     Customer(volume_t low, volume_t high, volume_t w, double x, double y)
         : low(low), high(high), w(w), x(x), y(y),
@@ -36,28 +44,372 @@ struct Customer
 struct Vehicle
 {
     const volume_t capacity;
-    const double distance_limit, cost_coefficient;
+    const double distance_limit, cost_coefficient, speed, time_limit;
     static Vehicle *truck, *drone;
+    static double working_time; // time limit of the whole system
 
-    Vehicle(volume_t capacity, double distance_limit, double cost_coefficient)
+    Vehicle(volume_t capacity, double distance_limit, double cost_coefficient, double speed, double time_limit)
         : capacity(capacity),
           distance_limit(distance_limit),
-          cost_coefficient(cost_coefficient) {}
+          cost_coefficient(cost_coefficient),
+          speed(speed),
+          time_limit(time_limit) {}
 };
 
 volume_t Customer::total_low, Customer::total_high;
 std::vector<Customer> Customer::customers;
-std::vector<std::vector<double>> Customer::distances;
+std::shared_ptr<distance_matrix> Customer::distances;
+unsigned Customer::neighbors_limit = 0;
 std::vector<std::vector<unsigned>> Customer::nearests;
 
 Vehicle *Vehicle::truck = nullptr, *Vehicle::drone = nullptr;
+double Vehicle::working_time = 0.0;
+
+struct Sortie
+{
+    const double distance;
+    const std::vector<unsigned> path; // depot at both ends, same format as path_order
+
+    static unsigned limit;
+    static std::vector<Sortie> sorties;
+    static std::vector<std::vector<unsigned>> by_customer;
+    static std::vector<std::vector<bool>> compatible;
+
+    struct hash
+    {
+        std::size_t operator()(const std::vector<unsigned> &customers) const
+        {
+            std::size_t seed = customers.size();
+            for (auto customer : customers)
+            {
+                seed ^= customer + 0x9e3779b9 + (seed << 6) + (seed >> 2);
+            }
+            return seed;
+        }
+    };
+
+    static std::unordered_map<std::vector<unsigned>, unsigned, hash> index; // sorted customers (without depot) -> sortie
+
+    Sortie(const double distance, const std::vector<unsigned> &path) : distance(distance), path(path) {}
+};
+
+unsigned Sortie::limit = 0;
+std::vector<Sortie> Sortie::sorties;
+std::vector<std::vector<unsigned>> Sortie::by_customer;
+std::vector<std::vector<bool>> Sortie::compatible;
+std::unordered_map<std::vector<unsigned>, unsigned, Sortie::hash> Sortie::index;
+
+/** Incremented whenever the problem, the neighbor lists or the sortie catalogue change, invalidating derived caches */
+std::atomic<unsigned> setup_epoch = 0;
 
 lru_cache<std::set<unsigned>, std::pair<double, std::vector<unsigned>>> path_order_cache(100000);
+std::mutex path_order_cache_mutex; // local searches may run concurrently in several threads
 
-void setup_path_cache(unsigned capacity)
+void setup_path_cache(unsigned capacity, const std::string &policy)
 {
-    path_order_cache.clear();
+    std::lock_guard<std::mutex> lock(path_order_cache_mutex);
     path_order_cache.capacity = capacity;
+    path_order_cache.clear(parse_cache_policy(policy));
+}
+
+void trace_path_cache(const std::optional<std::string> &path)
+{
+    std::lock_guard<std::mutex> lock(path_order_cache_mutex);
+    path_order_cache.trace(path);
+}
+
+void resize_path_cache(std::size_t memory)
+{
+    std::lock_guard<std::mutex> lock(path_order_cache_mutex);
+    path_order_cache.resize(memory);
+}
+
+bool __add_sortie(const std::vector<unsigned> &customers)
+{
+    // Find the optimal tour by brute force, the catalogue only holds a few customers per sortie
+    std::vector<unsigned> order(customers), best_order;
+    double best = -1.0;
+    do
+    {
+        double d = Customer::distances->at(0, order.front()) + Customer::distances->at(order.back(), 0);
+        for (unsigned i = 0; i + 1 < order.size(); i++)
+        {
+            d += Customer::distances->at(order[i], order[i + 1]);
+        }
+
+        if (d < best || best == -1.0)
+        {
+            best = d;
+            best_order = order;
+        }
+    } while (std::next_permutation(order.begin(), order.end()));
+
+    // Only the flight distance bounds a sortie: volumes are decided later and a customer's demand may be
+    // split across several paths, so no demand-based bound is sound here
+    if (best > Vehicle::drone->distance_limit)
+    {
+        return false;
+    }
+
+    std::vector<unsigned> path = {0};
+    path.insert(path.end(), best_order.begin(), best_order.end());
+    path.push_back(0);
+
+    unsigned sortie = Sortie::sorties.size();
+    Sortie::sorties.emplace_back(best, path);
+    Sortie::index[customers] = sortie;
+    for (auto customer : customers)
+    {
+        Sortie::by_customer[customer].push_back(sortie);
+    }
+
+    return true;
+}
+
+void __extend_sorties(std::vector<unsigned> &customers)
+{
+    for (unsigned next = customers.back() + 1; next < Customer::customers.size(); next++)
+    {
+        // A superset tour is never shorter, so every pair inside a sortie must be compatible
+        bool extendable = true;
+        for (unsigned i = 0; i < customers.size() && extendable; i++)
+        {
+            extendable = Sortie::compatible[customers[i]][next];
+        }
+
+        if (extendable)
+        {
+            customers.push_back(next);
+            if (__add_sortie(customers) && customers.size() < Sortie::limit)
+            {
+                __extend_sorties(customers);
+            }
+            customers.pop_back();
+        }
+    }
+}
+
+unsigned setup_sorties(const unsigned limit)
+{
+    unsigned size = Customer::customers.size();
+
+    Sortie::limit = limit;
+    setup_epoch++;
+    Sortie::sorties.clear();
+    Sortie::index.clear();
+    Sortie::by_customer.assign(size, {});
+    Sortie::compatible.assign(size, std::vector<bool>(size, false));
+
+    if (limit > 0)
+    {
+        std::vector<unsigned> reachable;
+        for (unsigned customer = 1; customer < size; customer++)
+        {
+            if (__add_sortie({customer}))
+            {
+                reachable.push_back(customer);
+            }
+        }
+
+        if (limit > 1)
+        {
+            // Compute all pairs before extending, since extensions check every pair in the sortie
+            for (unsigned i = 0; i < reachable.size(); i++)
+            {
+                for (unsigned j = i + 1; j < reachable.size(); j++)
+                {
+                    if (__add_sortie({reachable[i], reachable[j]}))
+                    {
+                        Sortie::compatible[reachable[i]][reachable[j]] = Sortie::compatible[reachable[j]][reachable[i]] = true;
+                    }
+                }
+            }
+
+            for (unsigned i = 0; i < reachable.size() && limit > 2; i++)
+            {
+                for (unsigned j = i + 1; j < reachable.size(); j++)
+                {
+                    if (Sortie::compatible[reachable[i]][reachable[j]])
+                    {
+                        std::vector<unsigned> customers = {reachable[i], reachable[j]};
+                        __extend_sorties(customers);
+                    }
+                }
+            }
+        }
+
+        for (auto &sorties : Sortie::by_customer)
+        {
+            std::sort(
+                sorties.begin(), sorties.end(),
+                [](unsigned a, unsigned b)
+                {
+                    return Sortie::sorties[a].distance < Sortie::sorties[b].distance;
+                });
+        }
+    }
+
+    return Sortie::sorties.size();
+}
+
+void __index_sorties()
+{
+    for (unsigned sortie = 0; sortie < Sortie::sorties.size(); sortie++)
+    {
+        auto &path = Sortie::sorties[sortie].path;
+        std::vector<unsigned> customers(std::next(path.begin()), std::prev(path.end()));
+        std::sort(customers.begin(), customers.end());
+
+        Sortie::index[customers] = sortie;
+        for (auto customer : customers)
+        {
+            Sortie::by_customer[customer].push_back(sortie);
+        }
+
+        if (customers.size() == 2)
+        {
+            Sortie::compatible[customers[0]][customers[1]] = Sortie::compatible[customers[1]][customers[0]] = true;
+        }
+    }
+
+    for (auto &sorties : Sortie::by_customer)
+    {
+        std::stable_sort(
+            sorties.begin(), sorties.end(),
+            [](unsigned a, unsigned b)
+            {
+                return Sortie::sorties[a].distance < Sortie::sorties[b].distance;
+            });
+    }
+}
+
+std::tuple<py::bytes, py::bytes, py::bytes> export_sorties()
+{
+    std::vector<double> distances;
+    std::vector<uint64_t> offsets = {0};
+    std::vector<uint32_t> paths;
+    for (auto &sortie : Sortie::sorties)
+    {
+        distances.push_back(sortie.distance);
+        paths.insert(paths.end(), sortie.path.begin(), sortie.path.end());
+        offsets.push_back(paths.size());
+    }
+
+    return std::make_tuple(
+        py::bytes((const char *)distances.data(), distances.size() * sizeof(double)),
+        py::bytes((const char *)offsets.data(), offsets.size() * sizeof(uint64_t)),
+        py::bytes((const char *)paths.data(), paths.size() * sizeof(uint32_t)));
+}
+
+unsigned import_sorties(const unsigned limit, const py::buffer &distances, const py::buffer &offsets, const py::buffer &paths)
+{
+    auto distances_info = distances.request(), offsets_info = offsets.request(), paths_info = paths.request();
+    if (distances_info.itemsize != sizeof(double) || offsets_info.itemsize != sizeof(uint64_t) || paths_info.itemsize != sizeof(uint32_t))
+    {
+        throw std::invalid_argument("Unexpected item sizes of sortie buffers");
+    }
+    if ((std::size_t)offsets_info.size != (std::size_t)distances_info.size + 1)
+    {
+        throw std::invalid_argument("Sortie offsets must have one more element than sortie distances");
+    }
+
+    auto distances_ptr = (const double *)distances_info.ptr;
+    auto offsets_ptr = (const uint64_t *)offsets_info.ptr;
+    auto paths_ptr = (const uint32_t *)paths_info.ptr;
+
+    py::gil_scoped_release release;
+    unsigned size = Customer::customers.size();
+
+    Sortie::limit = limit;
+    setup_epoch++;
+    Sortie::sorties.clear();
+    Sortie::index.clear();
+    Sortie::by_customer.assign(size, {});
+    Sortie::compatible.assign(size, std::vector<bool>(size, false));
+
+    Sortie::sorties.reserve(distances_info.size);
+    for (py::ssize_t i = 0; i < distances_info.size; i++)
+    {
+        if (offsets_ptr[i + 1] > (uint64_t)paths_info.size || offsets_ptr[i] + 3 > offsets_ptr[i + 1])
+        {
+            throw std::invalid_argument(format("Invalid sortie #%d", i));
+        }
+
+        Sortie::sorties.emplace_back(
+            distances_ptr[i],
+            std::vector<unsigned>(paths_ptr + offsets_ptr[i], paths_ptr + offsets_ptr[i + 1]));
+    }
+
+    __index_sorties();
+    return Sortie::sorties.size();
+}
+
+unsigned sorties_count(const unsigned customer)
+{
+    if (customer >= Sortie::by_customer.size())
+    {
+        return 0;
+    }
+
+    return Sortie::by_customer[customer].size();
+}
+
+std::pair<double, std::vector<unsigned>> sortie(const unsigned customer, const unsigned index)
+{
+    if (index >= sorties_count(customer))
+    {
+        throw std::out_of_range(format("Customer %d does not have sortie #%d", customer, index));
+    }
+
+    auto &result = Sortie::sorties[Sortie::by_customer[customer][index]];
+    return std::make_pair(result.distance, result.path);
+}
+
+bool sortie_compatible(const unsigned first, const unsigned second)
+{
+    if (first >= Sortie::compatible.size() || second >= Sortie::compatible.size())
+    {
+        return false;
+    }
+
+    return Sortie::compatible[first][second];
+}
+
+/**
+ * Whether a drone path (with the depot) may fit the flight limit according to the sortie catalogue.
+ *
+ * A customer without any sortie, or a pair of incompatible customers, exceeds the limit in every
+ * tour, since a superset tour is never shorter. Always true when the catalogue is disabled.
+ */
+bool sortie_allowed(const std::set<unsigned> &path)
+{
+    if (Sortie::limit == 0)
+    {
+        return true;
+    }
+
+    for (auto first = path.begin(); first != path.end(); first++)
+    {
+        if (*first == 0)
+        {
+            continue;
+        }
+
+        if (Sortie::by_customer[*first].empty())
+        {
+            return false;
+        }
+
+        for (auto second = std::next(first); second != path.end() && Sortie::limit > 1; second++)
+        {
+            if (!sortie_compatible(*first, *second))
+            {
+                return false;
+            }
+        }
+    }
+
+    return true;
 }
 
 void setup(
@@ -71,7 +423,12 @@ void setup(
     const double truck_capacity,
     const double drone_capacity,
     const double truck_cost_coefficient,
-    const double drone_cost_coefficient)
+    const double drone_cost_coefficient,
+    const std::shared_ptr<distance_matrix> &distances,
+    const double time_limit,
+    const double truck_speed,
+    const double drone_speed,
+    const double drone_time_limit)
 {
     unsigned size = low.size();
     if (size != high.size() || size != w.size() || size != x.size() || size != y.size())
@@ -93,62 +450,138 @@ void setup(
         Customer::total_high += high[i];
     }
 
-    Customer::distances.clear();
-    Customer::distances.resize(size, std::vector<double>(size, 0.0));
-    for (unsigned i = 0; i < size; i++)
+    if (distances->size() != size)
     {
-        for (unsigned j = i; j < size; j++)
-        {
-            Customer::distances[i][j] = Customer::distances[j][i] = distance(
-                Customer::customers[i].x - Customer::customers[j].x,
-                Customer::customers[i].y - Customer::customers[j].y);
-        }
+        throw std::runtime_error(format("Distance matrix size %d does not match the number of customers %d", distances->size(), size));
     }
+    Customer::distances = distances;
 
-    Customer::nearests.clear();
-    for (unsigned i = 0; i < size; i++)
-    {
-        std::vector<unsigned> all(size);
-        std::iota(all.begin(), all.end(), 0);
-        std::sort(
-            all.begin(), all.end(),
-            [i](unsigned a, unsigned b)
-            {
-                return Customer::distances[i][a] < Customer::distances[i][b];
-            });
-
-        Customer::nearests.push_back(all);
-    }
+    Customer::neighbors_limit = 0;
+    Customer::nearests.assign(size, {});
 
     if (Vehicle::truck != nullptr)
     {
         delete Vehicle::truck;
     }
-    Vehicle::truck = new Vehicle(truck_capacity, truck_distance_limit, truck_cost_coefficient);
+    Vehicle::truck = new Vehicle(truck_capacity, truck_distance_limit, truck_cost_coefficient, truck_speed, time_limit);
 
     if (Vehicle::drone != nullptr)
     {
         delete Vehicle::drone;
     }
-    Vehicle::drone = new Vehicle(drone_capacity, drone_distance_limit, drone_cost_coefficient);
+    Vehicle::drone = new Vehicle(drone_capacity, drone_distance_limit, drone_cost_coefficient, drone_speed, drone_time_limit);
+    Vehicle::working_time = time_limit;
 
     // Clear path cache
-    setup_path_cache(path_order_cache.capacity);
+    setup_path_cache(path_order_cache.capacity, cache_policy_name(path_order_cache.policy()));
+
+    // Clear sortie catalogue
+    setup_sorties(0);
 }
 
-std::map<std::string, unsigned> path_cache_info()
+void setup_neighbors(const unsigned limit)
 {
+    std::vector<std::pair<double, double>> locations;
+    for (auto &customer : Customer::customers)
+    {
+        locations.push_back(customer.location);
+    }
+
+    // Query one extra neighbor to make up for the depot, which is dropped from the lists
+    Customer::neighbors_limit = limit;
+    setup_epoch++;
+    Customer::nearests = k_nearest_neighbors(locations, limit > 0 ? limit + 1 : 0);
+    for (auto &nearest : Customer::nearests)
+    {
+        nearest.erase(std::remove(nearest.begin(), nearest.end(), 0u), nearest.end());
+        if (nearest.size() > limit)
+        {
+            nearest.pop_back();
+        }
+    }
+}
+
+std::pair<py::bytes, py::bytes> export_neighbors()
+{
+    std::vector<uint32_t> lengths, flattened;
+    for (auto &nearest : Customer::nearests)
+    {
+        lengths.push_back(nearest.size());
+        flattened.insert(flattened.end(), nearest.begin(), nearest.end());
+    }
+
+    return std::make_pair(
+        py::bytes((const char *)lengths.data(), lengths.size() * sizeof(uint32_t)),
+        py::bytes((const char *)flattened.data(), flattened.size() * sizeof(uint32_t)));
+}
+
+void import_neighbors(const unsigned limit, const py::buffer &lengths, const py::buffer &flattened)
+{
+    auto lengths_info = lengths.request(), flattened_info = flattened.request();
+    if (lengths_info.itemsize != sizeof(uint32_t) || flattened_info.itemsize != sizeof(uint32_t))
+    {
+        throw std::invalid_argument("Neighbor buffers must hold 32-bit unsigned integers");
+    }
+    if ((std::size_t)lengths_info.size != Customer::customers.size())
+    {
+        throw std::invalid_argument(format("Expected %d neighbor lists, got %d", Customer::customers.size(), lengths_info.size));
+    }
+
+    auto lengths_ptr = (const uint32_t *)lengths_info.ptr;
+    auto flattened_ptr = (const uint32_t *)flattened_info.ptr;
+
+    py::gil_scoped_release release;
+    std::vector<std::vector<unsigned>> nearests;
+    std::size_t offset = 0;
+    for (py::ssize_t i = 0; i < lengths_info.size; i++)
+    {
+        if (offset + lengths_ptr[i] > (std::size_t)flattened_info.size)
+        {
+            throw std::invalid_argument("Neighbor lengths exceed the flattened buffer");
+        }
+
+        nearests.emplace_back(flattened_ptr + offset, flattened_ptr + offset + lengths_ptr[i]);
+        offset += lengths_ptr[i];
+    }
+
+    Customer::neighbors_limit = limit;
+    setup_epoch++;
+    Customer::nearests = nearests;
+}
+
+std::vector<unsigned> nearest_customers(const unsigned customer)
+{
+    if (customer >= Customer::nearests.size())
+    {
+        throw std::out_of_range(format("Customer %d does not exist", customer));
+    }
+
+    return Customer::nearests[customer];
+}
+
+std::map<std::string, std::size_t> path_cache_info()
+{
+    std::lock_guard<std::mutex> lock(path_order_cache_mutex);
     return path_order_cache.to_json();
 }
 
-std::pair<double, std::vector<unsigned>> path_order(const std::set<unsigned> &path)
+std::optional<std::pair<double, std::vector<unsigned>>> __sortie_order(const std::set<unsigned> &path)
 {
-    auto cached = path_order_cache.get(path);
-    if (cached.has_value())
+    if (path.size() > 1 && path.size() <= Sortie::limit + 1 && *path.begin() == 0)
     {
-        return cached.value();
+        auto iter = Sortie::index.find(std::vector<unsigned>(std::next(path.begin()), path.end()));
+        if (iter != Sortie::index.end())
+        {
+            auto &result = Sortie::sorties[iter->second];
+            return std::make_pair(result.distance, result.path);
+        }
     }
 
+    return std::nullopt;
+}
+
+std::pair<double, std::vector<unsigned>> __solve_path_order(const std::set<unsigned> &path)
+{
     std::vector<std::pair<double, double>> coordinates;
     std::vector<unsigned> path_vector(path.begin(), path.end()); // depot at customers[0]
     for (auto customer : path_vector)
@@ -164,11 +597,84 @@ std::pair<double, std::vector<unsigned>> path_order(const std::set<unsigned> &pa
     }
 
     result.second = result_path;
+    return result;
+}
+
+std::pair<double, std::vector<unsigned>> path_order(const std::set<unsigned> &path)
+{
+    auto sortie = __sortie_order(path);
+    if (sortie.has_value())
+    {
+        return *sortie;
+    }
+
+    {
+        std::lock_guard<std::mutex> lock(path_order_cache_mutex);
+        auto cached = path_order_cache.get(path);
+        if (cached.has_value())
+        {
+            return cached.value();
+        }
+    }
+
+    auto result = __solve_path_order(path);
+
+    std::lock_guard<std::mutex> lock(path_order_cache_mutex);
     path_order_cache.set(path, result);
 
     return result;
 }
 
+/** Order several paths, looking all of them up in the cache under a single lock */
+std::vector<std::pair<double, std::vector<unsigned>>> path_orders(const std::vector<std::set<unsigned>> &paths)
+{
+    std::vector<std::optional<std::pair<double, std::vector<unsigned>>>> orders(paths.size());
+    std::vector<std::set<unsigned>> lookups;
+    std::vector<unsigned> lookup_indices;
+    for (unsigned i = 0; i < paths.size(); i++)
+    {
+        orders[i] = __sortie_order(paths[i]);
+        if (!orders[i].has_value())
+        {
+            lookups.push_back(paths[i]);
+            lookup_indices.push_back(i);
+        }
+    }
+
+    if (!lookups.empty())
+    {
+        {
+            std::lock_guard<std::mutex> lock(path_order_cache_mutex);
+            auto cached = path_order_cache.get_many(lookups);
+            for (unsigned i = 0; i < lookups.size(); i++)
+            {
+                orders[lookup_indices[i]] = cached[i];
+            }
+        }
+
+        // Store each order as soon as it is solved, so that a cache trace measures each miss on its own
+        for (auto i : lookup_indices)
+        {
+            if (!orders[i].has_value())
+            {
+                orders[i] = __solve_path_order(paths[i]);
+
+                std::lock_guard<std::mutex> lock(path_order_cache_mutex);
+                path_order_cache.set(paths[i], *orders[i]);
+            }
+        }
+    }
+
+    std::vector<std::pair<double, std::vector<unsigned>>> result;
+    result.reserve(paths.size());
+    for (auto &order : orders)
+    {
+        result.push_back(std::move(*order));
+    }
+
+    return result;
+}
+
 individual get_paths(const py::object &py_individual)
 {
     auto truck_paths = py::cast<std::vector<std::set<unsigned>>>(py_individual.attr("truck_paths"));
@@ -257,7 +763,7 @@ double drone_path_profit(const std::vector<std::pair<unsigned, volume_t>> &path)
     double cost = 0.0;
     for (unsigned i = 0; i < path.size() - 1; i++)
     {
-        cost += Customer::distances[path[i].first][path[i + 1].first];
+        cost += Customer::distances->at(path[i].first, path[i + 1].first);
     }
     cost *= Vehicle::drone->cost_coefficient;
 
@@ -1,6 +1,7 @@
 #include "config.hpp"
 #include "decode.hpp"
 #include "educate.hpp"
+#include "evaluate.hpp"
 #include "local_search.hpp"
 #include "paths_from_flow.hpp"
 
@@ -8,20 +9,144 @@ namespace py = pybind11;
 
 PYBIND11_MODULE(cpp_utils, m)
 {
+    py::class_<distance_matrix, std::shared_ptr<distance_matrix>>(m, "DistanceMatrix", py::buffer_protocol())
+        .def(
+            py::init(
+                [](const std::vector<std::pair<double, double>> &points, const std::string &storage, const std::optional<py::buffer> &data)
+                {
+                    if (!data.has_value())
+                    {
+                        py::gil_scoped_release release;
+                        return std::make_shared<distance_matrix>(points, storage);
+                    }
+
+                    auto info = std::make_shared<py::buffer_info>(data->request());
+                    bool contiguous = true;
+                    for (py::ssize_t i = info->ndim, stride = info->itemsize; i-- > 0; stride *= info->shape[i])
+                    {
+                        contiguous = contiguous && info->strides[i] == stride;
+                    }
+
+                    if (info->itemsize != sizeof(double) || (std::size_t)info->size != points.size() * points.size() || !contiguous)
+                    {
+                        throw std::invalid_argument(format("Expected %d contiguous doubles of precomputed distances", points.size() * points.size()));
+                    }
+
+                    // Dense matrices of doubles use the buffer in place (e.g. the pages of a memory-mapped
+                    // compiled problem, shared between processes), holding the buffer until the matrix is
+                    // destroyed. Releasing a buffer requires the GIL, which matrices replaced inside
+                    // setup() do not hold.
+                    auto owner = std::shared_ptr<const void>(
+                        info.get(),
+                        [info](const void *) mutable
+                        {
+                            if (Py_IsInitialized())
+                            {
+                                py::gil_scoped_acquire acquire;
+                                info.reset();
+                            }
+                            else
+                            {
+                                new std::shared_ptr<py::buffer_info>(std::move(info)); // The interpreter is gone, leak the view
+                            }
+                        });
+
+                    py::gil_scoped_release release;
+                    return std::make_shared<distance_matrix>(points, storage, (const double *)info->ptr, owner);
+                }),
+            py::arg("points"), py::kw_only(), py::arg("storage") = "double", py::arg("data") = py::none())
+        .def_property_readonly("storage", &distance_matrix::storage)
+        .def(
+            "__getitem__",
+            [](const distance_matrix &self, const std::pair<unsigned, unsigned> &index)
+            {
+                if (index.first >= self.size() || index.second >= self.size())
+                {
+                    throw py::index_error(format("Index (%d, %d) out of range", index.first, index.second));
+                }
+
+                return self.at(index.first, index.second);
+            },
+            py::arg("index"))
+        .def("__len__", &distance_matrix::size)
+        .def_buffer(
+            [](distance_matrix &self)
+            {
+                void *data = self.data();
+                if (data == nullptr)
+                {
+                    throw py::buffer_error("Lazy distance matrix does not expose a buffer");
+                }
+
+                std::size_t size = self.size(), item_size = self.item_size();
+                return py::buffer_info(
+                    data,
+                    item_size,
+                    self.storage() == "float" ? py::format_descriptor<float>::format() : py::format_descriptor<double>::format(),
+                    2,
+                    {size, size},
+                    {size * item_size, item_size},
+                    true);
+            });
+
     m.def(
         "setup", &setup,
         py::arg("low"), py::arg("high"), py::arg("w"), py::arg("x"), py::arg("y"),
         py::arg("truck_distance_limit"), py::arg("drone_distance_limit"),
         py::arg("truck_capacity"), py::arg("drone_capacity"),
         py::arg("truck_cost_coefficient"), py::arg("drone_cost_coefficient"),
+        py::kw_only(), py::arg("distances"),
+        py::arg("time_limit"), py::arg("truck_speed"), py::arg("drone_speed"), py::arg("drone_time_limit"),
         py::call_guard<py::gil_scoped_release>());
     m.def(
         "setup_path_cache", &setup_path_cache,
-        py::arg("capacity"),
+        py::arg("capacity"), py::kw_only(), py::arg("policy") = "lru",
+        py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "trace_path_cache", &trace_path_cache,
+        py::arg("path"),
+        py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "resize_path_cache", &resize_path_cache,
+        py::arg("memory"),
         py::call_guard<py::gil_scoped_release>());
     m.def(
         "path_cache_info", &path_cache_info,
         py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "setup_neighbors", &setup_neighbors,
+        py::arg("limit"),
+        py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "nearest_customers", &nearest_customers,
+        py::arg("customer"),
+        py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "export_neighbors", &export_neighbors); // Do not release the GIL
+    m.def(
+        "import_neighbors", &import_neighbors,
+        py::arg("limit"), py::arg("lengths"), py::arg("flattened")); // Releases the GIL after reading the buffers
+    m.def(
+        "setup_sorties", &setup_sorties,
+        py::arg("limit"),
+        py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "sorties_count", &sorties_count,
+        py::arg("customer"),
+        py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "sortie", &sortie,
+        py::arg("customer"), py::arg("index"),
+        py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "sortie_compatible", &sortie_compatible,
+        py::arg("first"), py::arg("second"),
+        py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "export_sorties", &export_sorties); // Do not release the GIL
+    m.def(
+        "import_sorties", &import_sorties,
+        py::arg("limit"), py::arg("distances"), py::arg("offsets"), py::arg("paths")); // Releases the GIL after reading the buffers
     m.def(
         "path_order", &path_order,
         py::arg("path"),
@@ -30,12 +155,49 @@ PYBIND11_MODULE(cpp_utils, m)
         "decode", &decode,
         py::arg("truck_paths"), py::arg("drone_paths"),
         py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "evaluate",
+        py::overload_cast<
+            const std::vector<std::set<unsigned>> &,
+            const std::vector<std::vector<std::set<unsigned>>> &,
+            const std::pair<double, double> &>(&evaluate),
+        py::arg("truck_paths"), py::arg("drone_paths"), py::kw_only(), py::arg("fine_coefficient"),
+        py::call_guard<py::gil_scoped_release>());
     m.def(
         "educate", &educate,
         py::arg("py_individual")); // Do not release the GIL
+    py::class_<stop_token, std::shared_ptr<stop_token>>(m, "StopToken")
+        .def(py::init<>())
+        .def("stop", &stop_token::stop, py::call_guard<py::gil_scoped_release>())
+        .def_property_readonly(
+            "stopped",
+            [](const stop_token &self)
+            {
+                return self.stopped.load();
+            });
     m.def(
         "local_search", &local_search,
-        py::arg("py_individual"), py::arg("py_updater")); // Do not release the GIL
+        py::arg("py_individual"), py::arg("py_updater"), py::kw_only(), py::arg("fine_coefficient"),
+        py::arg("time_limit") = std::nullopt, py::arg("max_evaluations") = std::nullopt,
+        py::arg("stop") = nullptr); // Releases the GIL during the search
+    m.def(
+        "setup_trade_limits", &setup_trade_limits,
+        py::arg("truck"), py::arg("drone"),
+        py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "local_search_info", &local_search_info,
+        py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "setup_local_search_cache", &setup_local_search_cache,
+        py::arg("capacity"), py::kw_only(), py::arg("policy") = "lru",
+        py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "resize_local_search_cache", &resize_local_search_cache,
+        py::arg("memory"),
+        py::call_guard<py::gil_scoped_release>());
+    m.def(
+        "local_search_cache_info", &local_search_cache_info,
+        py::call_guard<py::gil_scoped_release>());
     m.def(
         "paths_from_flow", &paths_from_flow,
         py::arg("truck_paths_count"), py::arg("drone_paths_count"), py::arg("flows"), py::arg("neighbors"),
@@ -1,21 +1,59 @@
-from typing import AbstractSet, Callable, Dict, List, Optional, Sequence, Set, Tuple
+from typing import AbstractSet, Callable, Dict, List, Literal, Optional, Sequence, Set, Tuple
+
+from typing_extensions import Buffer
 
 from ..individuals import VRPDFDIndividual
-from ..types import LRUCacheInfo
+from ..types import LocalSearchInfo, LRUCacheInfo
+from ...utils import CachePolicy
 
 
 __all__ = (
+    "DistanceMatrix",
     "setup",
     "setup_path_cache",
+    "trace_path_cache",
+    "resize_path_cache",
     "path_cache_info",
+    "setup_neighbors",
+    "nearest_customers",
+    "export_neighbors",
+    "import_neighbors",
+    "setup_sorties",
+    "sorties_count",
+    "sortie",
+    "sortie_compatible",
+    "export_sorties",
+    "import_sorties",
     "path_order",
     "decode",
+    "evaluate",
     "educate",
+    "setup_trade_limits",
+    "StopToken",
     "local_search",
+    "local_search_info",
+    "setup_local_search_cache",
+    "resize_local_search_cache",
+    "local_search_cache_info",
     "paths_from_flow",
 )
 
 
+class DistanceMatrix:
+    def __init__(
+        self,
+        points: Sequence[Tuple[float, float]],
+        *,
+        storage: Literal["double", "float", "lazy"] = "double",
+        data: Optional[Buffer] = None,
+    ) -> None: ...
+    @property
+    def storage(self) -> Literal["double", "float", "lazy"]: ...
+    def __getitem__(self, index: Tuple[int, int]) -> float: ...
+    def __len__(self) -> int: ...
+    def __buffer__(self, flags: int, /) -> memoryview: ...
+
+
 def setup(
     low: Sequence[int],
     high: Sequence[int],
@@ -28,11 +66,29 @@ def setup(
     drone_capacity: int,
     truck_cost_coefficient: float,
     drone_cost_coefficient: float,
+    *,
+    distances: DistanceMatrix,
+    time_limit: float,
+    truck_speed: float,
+    drone_speed: float,
+    drone_time_limit: float,
 ) -> None: ...
 
 
-def setup_path_cache(capacity: int) -> None: ...
+def setup_path_cache(capacity: int, *, policy: CachePolicy = "lru") -> None: ...
+def trace_path_cache(path: Optional[str]) -> None: ...
+def resize_path_cache(memory: int) -> None: ...
 def path_cache_info() -> LRUCacheInfo: ...
+def setup_neighbors(limit: int) -> None: ...
+def nearest_customers(customer: int) -> List[int]: ...
+def export_neighbors() -> Tuple[bytes, bytes]: ...
+def import_neighbors(limit: int, lengths: Buffer, flattened: Buffer) -> None: ...
+def setup_sorties(limit: int) -> int: ...
+def sorties_count(customer: int) -> int: ...
+def sortie(customer: int, index: int) -> Tuple[float, List[int]]: ...
+def sortie_compatible(first: int, second: int) -> bool: ...
+def export_sorties() -> Tuple[bytes, bytes, bytes]: ...
+def import_sorties(limit: int, distances: Buffer, offsets: Buffer, paths: Buffer) -> int: ...
 def path_order(path: AbstractSet[int]) -> Tuple[float, List[int]]: ...
 
 
@@ -45,15 +101,44 @@ def decode(
 ]: ...
 
 
+def evaluate(
+    truck_paths: Sequence[AbstractSet[int]],
+    drone_paths: Sequence[Sequence[AbstractSet[int]]],
+    *,
+    fine_coefficient: Tuple[float, float],
+) -> Tuple[float, Tuple[float, float]]: ...
+
+
 def educate(py_individual: VRPDFDIndividual) -> VRPDFDIndividual: ...
 
 
+def setup_trade_limits(truck: int, drone: int) -> None: ...
+
+
+class StopToken:
+    def __init__(self) -> None: ...
+    def stop(self) -> None: ...
+    @property
+    def stopped(self) -> bool: ...
+
+
 def local_search(
     py_individual: VRPDFDIndividual,
     py_updater: Callable[[VRPDFDIndividual], None],
+    *,
+    fine_coefficient: Tuple[float, float],
+    time_limit: Optional[float] = None,
+    max_evaluations: Optional[int] = None,
+    stop: Optional[StopToken] = None,
 ) -> Tuple[Optional[VRPDFDIndividual], VRPDFDIndividual]: ...
 
 
+def local_search_info() -> LocalSearchInfo: ...
+def setup_local_search_cache(capacity: int, *, policy: CachePolicy = "lru") -> None: ...
+def resize_local_search_cache(memory: int) -> None: ...
+def local_search_cache_info() -> LRUCacheInfo: ...
+
+
 def paths_from_flow(
     truck_paths_count: int,
     drone_paths_count: Sequence[int],
@@ -0,0 +1,145 @@
+#pragma once
+
+#include <cmath>
+#include <memory>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+#include "../../utils/helpers.hpp"
+
+class distance_matrix
+{
+private:
+    const unsigned _size;
+    const std::string _storage;
+    const std::vector<std::pair<double, double>> _points;
+    std::vector<double> _double_data;
+    std::vector<float> _float_data;
+
+    // A dense matrix of doubles owned by someone else (e.g. a memory-mapped file), kept alive by _owner
+    const double *_external = nullptr;
+    std::shared_ptr<const void> _owner;
+
+    double _compute(const unsigned i, const unsigned j) const
+    {
+        double dx = _points[i].first - _points[j].first, dy = _points[i].second - _points[j].second;
+        return weird_round(std::sqrt(dx * dx + dy * dy), 2);
+    }
+
+public:
+    /**
+     * Row-major matrix of pairwise distances between `points`.
+     *
+     * `storage` is one of "double", "float" (half the memory) or "lazy" (computed
+     * on demand from the coordinates, for instances too large for a dense matrix).
+     * A row-major `precomputed` matrix of doubles is used instead of computing
+     * the distances again. With "double" storage and an `owner` keeping it alive,
+     * it is used in place without being copied.
+     */
+    distance_matrix(
+        const std::vector<std::pair<double, double>> &points,
+        const std::string &storage,
+        const double *const precomputed = nullptr,
+        const std::shared_ptr<const void> &owner = nullptr)
+        : _size(points.size()), _storage(storage), _points(points)
+    {
+        if (storage == "double" && precomputed != nullptr && owner != nullptr)
+        {
+            _external = precomputed;
+            _owner = owner;
+            return;
+        }
+
+        if (storage == "double")
+        {
+            _double_data.resize((std::size_t)_size * _size);
+        }
+        else if (storage == "float")
+        {
+            _float_data.resize((std::size_t)_size * _size);
+        }
+        else if (storage != "lazy")
+        {
+            throw std::invalid_argument("Unknown distance storage \"" + storage + "\"");
+        }
+
+        if (precomputed != nullptr && storage == "double")
+        {
+            std::copy(precomputed, precomputed + _double_data.size(), _double_data.begin());
+            return;
+        }
+
+        for (unsigned i = 0; i < _size && storage != "lazy"; i++)
+        {
+            for (unsigned j = i; j < _size; j++)
+            {
+                double d = precomputed == nullptr ? _compute(i, j) : precomputed[(std::size_t)i * _size + j];
+                if (storage == "double")
+                {
+                    _double_data[(std::size_t)i * _size + j] = _double_data[(std::size_t)j * _size + i] = d;
+                }
+                else
+                {
+                    _float_data[(std::size_t)i * _size + j] = _float_data[(std::size_t)j * _size + i] = d;
+                }
+            }
+        }
+    }
+
+    double at(const unsigned i, const unsigned j) const
+    {
+        if (_external != nullptr)
+        {
+            return _external[(std::size_t)i * _size + j];
+        }
+
+        if (!_double_data.empty())
+        {
+            return _double_data[(std::size_t)i * _size + j];
+        }
+
+        if (!_float_data.empty())
+        {
+            return _float_data[(std::size_t)i * _size + j];
+        }
+
+        return _compute(i, j);
+    }
+
+    unsigned size() const
+    {
+        return _size;
+    }
+
+    const std::string &storage() const
+    {
+        return _storage;
+    }
+
+    /** Pointer to the dense data, or nullptr in lazy mode */
+    void *data()
+    {
+        if (_external != nullptr)
+        {
+            return const_cast<double *>(_external); // exposed read-only
+        }
+
+        if (!_double_data.empty())
+        {
+            return _double_data.data();
+        }
+
+        if (!_float_data.empty())
+        {
+            return _float_data.data();
+        }
+
+        return nullptr;
+    }
+
+    std::size_t item_size() const
+    {
+        return _storage == "float" ? sizeof(float) : sizeof(double);
+    }
+};
@@ -0,0 +1,164 @@
+#pragma once
+
+#include <cmath>
+
+#include "config.hpp"
+#include "decode.hpp"
+
+/**
+ * Native counterpart of a decoded `VRPDFDSolution`, holding just enough to rank individuals
+ * without going through Python.
+ */
+struct evaluation
+{
+    individual source; // the evaluated paths
+    individual genome; // canonical: reduced paths, drone paths without customers dropped and sorted
+    double cost;       // including the fines of violations
+    std::pair<double, double> violation;
+
+    bool feasible() const
+    {
+        return std::max(violation.first, violation.second) == 0.0;
+    }
+
+    bool operator<(const evaluation &other) const
+    {
+        return cost < other.cost;
+    }
+};
+
+std::size_t approximate_size(const evaluation &value)
+{
+    return sizeof(value) + approximate_size(value.source) + approximate_size(value.genome) - 2 * sizeof(individual);
+}
+
+double __approx(const double value)
+{
+    return std::abs(value) < 0.0001 ? 0.0 : std::max(value, 0.0);
+}
+
+/**
+ * Evaluate an individual the same way `VRPDFDIndividual.decode()` and `VRPDFDSolution` do:
+ * decode the volumes, drop the customers without deliveries, order each path, then compute
+ * the cost and the normalized (time, weight) violations.
+ */
+evaluation evaluate(const individual &genome, const std::pair<double, double> &fine_coefficient)
+{
+    const auto &[truck_paths, drone_paths] = genome;
+    const auto [truck_volumes, drone_volumes] = decode(truck_paths, drone_paths);
+
+    std::vector<volume_t> total_weight(Customer::customers.size());
+    double revenue = 0.0;
+    auto reduce = [&total_weight, &revenue](const std::map<unsigned, volume_t> &volumes, volume_t &weight)
+    {
+        std::set<unsigned> reduced = {0};
+        weight = 0;
+        for (auto &[customer, volume] : volumes)
+        {
+            if (volume > 0)
+            {
+                reduced.insert(customer);
+                weight += volume;
+                total_weight[customer] += volume;
+                revenue += Customer::customers[customer].w * volume;
+            }
+        }
+
+        return reduced;
+    };
+
+    // Reduce every path first, so that their orders are looked up in the cache in a single batch
+    std::vector<std::set<unsigned>> reduced_paths;
+    std::vector<volume_t> weights;
+    auto reduce_all = [&reduce, &reduced_paths, &weights](const std::vector<std::map<unsigned, volume_t>> &paths)
+    {
+        for (auto &volumes : paths)
+        {
+            volume_t weight;
+            reduced_paths.push_back(reduce(volumes, weight));
+            weights.push_back(weight);
+        }
+    };
+
+    reduce_all(truck_volumes);
+    for (auto &paths : drone_volumes)
+    {
+        reduce_all(paths);
+    }
+
+    const auto orders = path_orders(reduced_paths);
+    unsigned index = 0;
+
+    evaluation result;
+    result.source = genome;
+
+    double truck_distance = 0.0, truck_time_violation = 0.0, truck_weight_violation = 0.0;
+    for (unsigned truck = 0; truck < truck_volumes.size(); truck++, index++)
+    {
+        auto &reduced = reduced_paths[index];
+        auto weight = weights[index];
+        double distance = orders[index].first;
+
+        truck_distance += distance;
+        truck_time_violation += __approx(distance / Vehicle::truck->speed - Vehicle::working_time);
+        truck_weight_violation += __approx(weight - Vehicle::truck->capacity);
+        result.genome.first.push_back(reduced);
+    }
+
+    double drone_distance = 0.0, drone_time_violation = 0.0, drone_flight_time_violation = 0.0, drone_weight_violation = 0.0;
+    for (auto &paths : drone_volumes)
+    {
+        double distance_sum = 0.0, flight_time_violation = 0.0, weight_violation = 0.0;
+        std::vector<std::set<unsigned>> drone_reduced_paths;
+        for (unsigned path = 0; path < paths.size(); path++, index++)
+        {
+            auto &reduced = reduced_paths[index];
+            auto weight = weights[index];
+            double distance = orders[index].first;
+
+            distance_sum += distance;
+            flight_time_violation += __approx(distance / Vehicle::drone->speed - Vehicle::drone->time_limit);
+            weight_violation += __approx(weight - Vehicle::drone->capacity);
+            if (reduced.size() > 1)
+            {
+                drone_reduced_paths.push_back(reduced);
+            }
+        }
+
+        drone_distance += distance_sum;
+        drone_time_violation += __approx(distance_sum / Vehicle::drone->speed - Vehicle::working_time);
+        drone_flight_time_violation += flight_time_violation;
+        drone_weight_violation += weight_violation;
+
+        std::sort(drone_reduced_paths.begin(), drone_reduced_paths.end());
+        result.genome.second.push_back(drone_reduced_paths);
+    }
+
+    double customer_weight_violation = 0.0;
+    for (unsigned customer = 0; customer < Customer::customers.size(); customer++)
+    {
+        auto &c = Customer::customers[customer];
+        double violation = __approx(c.low - total_weight[customer]) + __approx(total_weight[customer] - c.high);
+        if (violation != 0.0)
+        {
+            customer_weight_violation += violation / c.high;
+        }
+    }
+
+    result.violation = std::make_pair(
+        (truck_time_violation + drone_time_violation) / Vehicle::working_time + drone_flight_time_violation / Vehicle::drone->time_limit,
+        truck_weight_violation / Vehicle::truck->capacity + drone_weight_violation / Vehicle::drone->capacity + customer_weight_violation);
+    result.cost = Vehicle::truck->cost_coefficient * truck_distance + Vehicle::drone->cost_coefficient * drone_distance - revenue;
+    result.cost += (fine_coefficient.first * result.violation.first + fine_coefficient.second * result.violation.second);
+
+    return result;
+}
+
+std::pair<double, std::pair<double, double>> evaluate(
+    const std::vector<std::set<unsigned>> &truck_paths,
+    const std::vector<std::vector<std::set<unsigned>>> &drone_paths,
+    const std::pair<double, double> &fine_coefficient)
+{
+    auto result = evaluate(std::make_pair(truck_paths, drone_paths), fine_coefficient);
+    return std::make_pair(result.cost, result.violation);
+}
@@ -1,13 +1,30 @@
 #pragma once
 
+#include <atomic>
+#include <memory>
+#include <numeric>
+
 #include "config.hpp"
+#include "evaluate.hpp"
+
+// Customers traded between trucks and drones by local_search_5, which tries every subset of them
+unsigned truck_trade_limit = 4u, drone_trade_limit = 4u;
+const unsigned TRADE_LIMIT = 30u;
 
-const unsigned TRUCK_TRADE_LIMIT = 4u;
-const unsigned DRONE_TRADE_LIMIT = 4u;
+void setup_trade_limits(const unsigned truck, const unsigned drone)
+{
+    if (truck + drone > TRADE_LIMIT)
+    {
+        throw std::invalid_argument(format("Trade limits %d + %d exceed %d customers", truck, drone, TRADE_LIMIT));
+    }
+
+    truck_trade_limit = truck;
+    drone_trade_limit = drone;
+    setup_epoch++;
+}
 
 struct extra_info
 {
-    const py::object py_individual;
     const unsigned trucks_count;
     const unsigned drones_count;
     const std::vector<std::set<unsigned int>> truck_paths;
@@ -17,14 +34,13 @@ struct extra_info
     const std::set<unsigned> in_truck_paths_only;
     const std::set<unsigned> in_drone_paths_only;
     const std::set<unsigned> absent;
-    const py::object py_updater;
 
-    static extra_info from_individual(const py::object &py_individual, const py::object &py_updater);
+    static extra_info from_genome(const individual &genome);
 };
 
-extra_info extra_info::from_individual(const py::object &py_individual, const py::object &py_updater)
+extra_info extra_info::from_genome(const individual &genome)
 {
-    const auto [truck_paths, drone_paths] = get_paths(py_individual);
+    const auto &[truck_paths, drone_paths] = genome;
 
     unsigned trucks_count = truck_paths.size(),
              drones_count = drone_paths.size();
@@ -85,28 +101,117 @@ extra_info extra_info::from_individual(const py::object &py_individual, const py
     }
 
     return extra_info{
-        py_individual, trucks_count, drones_count, truck_paths, drone_paths,
-        in_truck_paths, in_drone_paths, in_truck_paths_only, in_drone_paths_only, absent, py_updater};
+        trucks_count, drones_count, truck_paths, drone_paths,
+        in_truck_paths, in_drone_paths, in_truck_paths_only, in_drone_paths_only, absent};
 }
 
+typedef std::pair<std::optional<evaluation>, evaluation> local_search_result;
+
+/** Statistics accumulated over all `local_search` calls, possibly from several threads */
+struct local_search_statistics
+{
+    std::atomic<unsigned long long> calls = 0;
+    std::atomic<unsigned long long> evaluations = 0;
+    std::atomic<unsigned long long> exhausted = 0;    // calls stopped by their budget
+    std::atomic<unsigned long long> stopped = 0;      // calls stopped by their stop token
+    std::atomic<unsigned long long> skipped = 0;      // neighborhood applications skipped by the scheduler
+    std::atomic<unsigned long long> microseconds = 0; // wall-clock time spent searching
+} local_search_stats;
+
+/** A flag asking the `local_search` calls holding it to return early, settable from any thread */
+struct stop_token
+{
+    std::atomic<bool> stopped = false;
+
+    void stop()
+    {
+        stopped = true;
+    }
+};
+
+/** State shared by the neighborhoods of a single `local_search` call */
+class local_search_state
+{
+private:
+    std::map<individual, evaluation> _memo;
+
+public:
+    const std::pair<double, double> fine_coefficient;
+    const Timer timer;
+    const std::optional<double> time_limit;
+    const std::optional<unsigned> max_evaluations;
+    const std::shared_ptr<stop_token> stop;
+    unsigned evaluations = 0;                // candidates evaluated, memoized ones excluded
+    unsigned skipped = 0;                    // neighborhood applications skipped by the scheduler
+    std::optional<evaluation> best_feasible; // best feasible candidate seen, reported to the updater
+
+    local_search_state(
+        const std::pair<double, double> &fine_coefficient,
+        const std::optional<double> &time_limit = std::nullopt,
+        const std::optional<unsigned> &max_evaluations = std::nullopt,
+        const std::shared_ptr<stop_token> &stop = nullptr)
+        : fine_coefficient(fine_coefficient),
+          timer(time_limit.value_or(0.0)),
+          time_limit(time_limit),
+          max_evaluations(max_evaluations),
+          stop(stop) {}
+
+    /** Whether this call was asked to stop */
+    bool stopped() const
+    {
+        return stop != nullptr && stop->stopped;
+    }
+
+    /** Whether the time or evaluation budget of this call is used up, or the call was asked to stop */
+    bool exhausted() const
+    {
+        return (max_evaluations.has_value() && evaluations >= *max_evaluations) || (time_limit.has_value() && timer.timeup()) || stopped();
+    }
+
+    const evaluation &evaluate(const individual &genome)
+    {
+        auto iter = _memo.find(genome);
+        if (iter == _memo.end())
+        {
+            evaluations++;
+            iter = _memo.emplace(genome, ::evaluate(genome, fine_coefficient)).first;
+        }
+
+        return iter->second;
+    }
+
+    const evaluation &evaluate(
+        const std::vector<std::set<unsigned>> &truck_paths,
+        const std::vector<std::vector<std::set<unsigned>>> &drone_paths)
+    {
+        return evaluate(std::make_pair(truck_paths, drone_paths));
+    }
+
+    /** Report a candidate to the updater and record it in the search result */
+    void consider(const evaluation &candidate, local_search_result &result)
+    {
+        if (candidate.feasible())
+        {
+            best_feasible = std::min(best_feasible.value_or(candidate), candidate);
+            result.first = std::min(result.first.value_or(candidate), candidate);
+        }
+        result.second = std::min(result.second, candidate);
+    }
+};
+
+
 void local_search_1(
     const extra_info &extra,
-    std::pair<std::optional<py::object>, py::object> &result)
+    local_search_state &state,
+    local_search_result &result)
 {
     auto mutable_truck_paths = extra.truck_paths;
-    for (unsigned truck = 0; truck < extra.trucks_count; truck++)
+    for (unsigned truck = 0; truck < extra.trucks_count && !state.exhausted(); truck++)
     {
         // Temporary modify the individual
         mutable_truck_paths[truck].insert(extra.absent.begin(), extra.absent.end());
 
-        py::object py_new_individual = from_cache(mutable_truck_paths, extra.drone_paths);
-        extra.py_updater(py_new_individual);
-
-        if (feasible(py_new_individual))
-        {
-            result.first = std::min(result.first.value_or(py_new_individual), py_new_individual);
-        }
-        result.second = std::min(result.second, py_new_individual);
+        state.consider(state.evaluate(mutable_truck_paths, extra.drone_paths), result);
 
         // Restore the individual
         for (auto c : extra.absent)
@@ -118,28 +223,27 @@ void local_search_1(
 
 void local_search_2(
     const extra_info &extra,
-    std::pair<std::optional<py::object>, py::object> &result)
+    local_search_state &state,
+    local_search_result &result)
 {
-    std::vector<unsigned> new_path(extra.absent.begin(), extra.absent.end());
-    new_path.push_back(0);
+    std::set<unsigned> new_path(extra.absent.begin(), extra.absent.end());
+    new_path.insert(0);
+
+    // Paths that the sortie catalogue rules out can only exceed the flight limit
+    bool new_path_allowed = sortie_allowed(new_path);
 
-    auto py_new_path = py_frozenset(new_path.begin(), new_path.end());
     auto mutable_drone_paths = extra.drone_paths;
-    for (unsigned drone = 0; drone < extra.drones_count; drone++)
+    for (unsigned drone = 0; drone < extra.drones_count && !state.exhausted(); drone++)
     {
-        for (unsigned path = 0; path < extra.drone_paths[drone].size(); path++)
+        for (unsigned path = 0; path < extra.drone_paths[drone].size() && !state.exhausted(); path++)
         {
             // Temporary modify the individual
             mutable_drone_paths[drone][path].insert(extra.absent.begin(), extra.absent.end());
 
-            py::object py_new_individual = from_cache(extra.truck_paths, mutable_drone_paths);
-            extra.py_updater(py_new_individual);
-
-            if (feasible(py_new_individual))
+            if (new_path_allowed && sortie_allowed(mutable_drone_paths[drone][path]))
             {
-                result.first = std::min(result.first.value_or(py_new_individual), py_new_individual);
+                state.consider(state.evaluate(extra.truck_paths, mutable_drone_paths), result);
             }
-            result.second = std::min(result.second, py_new_individual);
 
             // Restore the individual
             for (auto c : extra.absent)
@@ -148,49 +252,79 @@ void local_search_2(
             }
         }
 
-        py::object py_new_individual = append_drone_path(extra.py_individual, drone, py_new_path);
-        extra.py_updater(py_new_individual);
-
-        if (feasible(py_new_individual))
+        if (state.exhausted() || !new_path_allowed)
         {
-            result.first = std::min(result.first.value_or(py_new_individual), py_new_individual);
+            return;
         }
-        result.second = std::min(result.second, py_new_individual);
+
+        // Append a new path
+        mutable_drone_paths[drone].push_back(new_path);
+        state.consider(state.evaluate(extra.truck_paths, mutable_drone_paths), result);
+        mutable_drone_paths[drone].pop_back();
     }
 }
 
 void local_search_3(
     const extra_info &extra,
-    std::pair<std::optional<py::object>, py::object> &result)
+    local_search_state &state,
+    local_search_result &result)
 {
-    for (auto customer : extra.in_truck_paths)
+    // Granular neighborhood: only customers close to the depot are worth a new drone path
+    std::set<unsigned> candidates;
+    if (Customer::neighbors_limit > 0)
+    {
+        for (auto customer : Customer::nearests[0])
+        {
+            if (extra.in_truck_paths.count(customer))
+            {
+                candidates.insert(customer);
+            }
+        }
+    }
+    else
+    {
+        candidates = extra.in_truck_paths;
+    }
+
+    // A single-customer path is catalogued exactly when the drone can serve that customer alone
+    for (auto iter = candidates.begin(); iter != candidates.end();)
+    {
+        iter = sortie_allowed({0, *iter}) ? std::next(iter) : candidates.erase(iter);
+    }
+
+    for (auto customer : candidates)
     {
         for (unsigned drone = 0; drone < extra.drones_count; drone++)
         {
+            if (state.exhausted())
+            {
+                return;
+            }
+
             auto new_drone_paths = extra.drone_paths;
 
             new_drone_paths[drone].push_back({0, customer});
-            py::object py_new_individual = from_cache(extra.truck_paths, new_drone_paths);
-            extra.py_updater(py_new_individual);
-
-            if (feasible(py_new_individual))
+            evaluation new_individual = state.evaluate(extra.truck_paths, new_drone_paths);
+            state.consider(new_individual, result);
+            if (state.exhausted())
             {
-                result.first = std::min(result.first.value_or(py_new_individual), py_new_individual);
+                return;
             }
-            result.second = std::min(result.second, py_new_individual);
 
             new_drone_paths[drone].push_back({0, customer});
-            py::object py_new_new_individual = from_cache(extra.truck_paths, new_drone_paths);
+            evaluation new_new_individual = state.evaluate(extra.truck_paths, new_drone_paths);
 
-            while (py_new_new_individual < py_new_individual && feasible(py_new_new_individual))
+            while (new_new_individual < new_individual && new_new_individual.feasible())
             {
-                py_new_individual = py_new_new_individual;
-                new_drone_paths[drone].push_back({0, customer});
-                py_new_new_individual = from_cache(extra.truck_paths, new_drone_paths);
+                new_individual = new_new_individual;
+                state.consider(new_individual, result); // Feasibility guaranteed
+                if (state.exhausted())
+                {
+                    return;
+                }
 
-                extra.py_updater(py_new_individual);
-                result.first = std::min(result.first.value_or(py_new_individual), py_new_individual); // Feasibility guaranteed
-                result.second = std::min(result.second, py_new_individual);
+                new_drone_paths[drone].push_back({0, customer});
+                new_new_individual = state.evaluate(extra.truck_paths, new_drone_paths);
             }
         }
     }
@@ -198,7 +332,8 @@ void local_search_3(
 
 void local_search_4(
     const extra_info &extra,
-    std::pair<std::optional<py::object>, py::object> &result)
+    local_search_state &state,
+    local_search_result &result)
 {
     auto mutable_drone_paths = extra.drone_paths;
     for (unsigned drone = 0; drone < extra.drones_count; drone++)
@@ -213,20 +348,18 @@ void local_search_4(
             // Split
             for (auto customer : extra.drone_paths[drone][path])
             {
+                if (state.exhausted())
+                {
+                    return;
+                }
+
                 if (customer != 0)
                 {
                     // Temporary modify the individual
                     mutable_drone_paths[drone][path].erase(customer);
                     mutable_drone_paths[drone].push_back({0, customer});
 
-                    py::object py_new_individual = from_cache(extra.truck_paths, mutable_drone_paths);
-                    extra.py_updater(py_new_individual);
-
-                    if (feasible(py_new_individual))
-                    {
-                        result.first = std::min(result.first.value_or(py_new_individual), py_new_individual);
-                    }
-                    result.second = std::min(result.second, py_new_individual);
+                    state.consider(state.evaluate(extra.truck_paths, mutable_drone_paths), result);
 
                     // Restore the individual
                     mutable_drone_paths[drone][path].insert(customer);
@@ -239,11 +372,26 @@ void local_search_4(
 
 void local_search_5(
     const extra_info &extra,
-    std::pair<std::optional<py::object>, py::object> &result)
+    local_search_state &state,
+    local_search_result &result)
 {
     std::vector<unsigned> in_truck_paths_only_vector(extra.in_truck_paths_only.begin(), extra.in_truck_paths_only.end()),
         in_drone_paths_only_vector(extra.in_drone_paths_only.begin(), extra.in_drone_paths_only.end());
 
+    if (Customer::neighbors_limit > 0)
+    {
+        // Granular neighborhood: skip the customers that a drone cannot reach at all. The nearest
+        // neighbors of the depot are too few here, restricting the trades to them loses good solutions.
+        in_truck_paths_only_vector.erase(
+            std::remove_if(
+                in_truck_paths_only_vector.begin(), in_truck_paths_only_vector.end(),
+                [](unsigned customer)
+                {
+                    return 2 * Customer::distances->at(0, customer) > Vehicle::drone->distance_limit;
+                }),
+            in_truck_paths_only_vector.end());
+    }
+
     // Calculate improved ratios
     std::vector<std::vector<double>> improved_ratio(2);
     improved_ratio[0].resize(in_truck_paths_only_vector.size(), -1);
@@ -268,6 +416,11 @@ void local_search_5(
         auto mutable_truck_paths = extra.truck_paths;
         for (unsigned truck_i = 0; truck_i < in_truck_paths_only_vector.size(); truck_i++)
         {
+            if (state.exhausted())
+            {
+                return;
+            }
+
             double total_ratio = 0.0;
             for (unsigned truck = 0; truck < extra.trucks_count; truck++)
             {
@@ -292,6 +445,11 @@ void local_search_5(
         auto mutable_drone_paths = extra.drone_paths;
         for (unsigned drone_i = 0; drone_i < in_drone_paths_only_vector.size(); drone_i++)
         {
+            if (state.exhausted())
+            {
+                return;
+            }
+
             double total_ratio = 0.0;
             for (unsigned drone = 0; drone < extra.drones_count; drone++)
             {
@@ -346,11 +504,11 @@ void local_search_5(
             return improved_ratio_map[a] < improved_ratio_map[b];
         });
 
-    while (in_truck_paths_only_vector.size() > TRUCK_TRADE_LIMIT)
+    while (in_truck_paths_only_vector.size() > truck_trade_limit)
     {
         in_truck_paths_only_vector.pop_back();
     }
-    while (in_drone_paths_only_vector.size() > DRONE_TRADE_LIMIT)
+    while (in_drone_paths_only_vector.size() > drone_trade_limit)
     {
         in_drone_paths_only_vector.pop_back();
     }
@@ -358,111 +516,386 @@ void local_search_5(
     const unsigned truck_trade = in_truck_paths_only_vector.size(),
                    drone_trade = in_drone_paths_only_vector.size();
 
-    // Brute-force swap
-    for (unsigned bitmask = 1; bitmask < (1u << (truck_trade + drone_trade)); bitmask++)
+    auto move_to_drones = [&extra](const unsigned customer, const bool moved, individual &candidate)
     {
-        auto new_truck_paths = extra.truck_paths;
-        auto new_drone_paths = extra.drone_paths;
-        std::vector<unsigned> from_truck, from_drone;
-        for (unsigned i = 0; i < truck_trade; i++)
+        auto &[truck_paths, drone_paths] = candidate;
+        for (unsigned truck = 0; truck < extra.trucks_count; truck++)
         {
-            if (bitmask & (1u << (i + drone_trade)))
+            if (moved)
+            {
+                truck_paths[truck].erase(customer);
+            }
+            else if (extra.truck_paths[truck].count(customer))
             {
-                unsigned customer = in_truck_paths_only_vector[i];
-                from_truck.push_back(customer);
-                for (auto &path : new_truck_paths)
+                truck_paths[truck].insert(customer);
+            }
+        }
+        for (auto &paths : drone_paths)
+        {
+            for (auto &path : paths)
+            {
+                if (moved)
                 {
-                    path.erase(customer);
+                    path.insert(customer);
                 }
-                for (auto &paths : new_drone_paths)
+                else
                 {
-                    for (auto &path : paths)
-                    {
-                        path.insert(customer);
-                    }
+                    path.erase(customer);
                 }
             }
         }
-        for (unsigned i = 0; i < drone_trade; i++)
+    };
+
+    auto move_to_trucks = [&extra](const unsigned customer, const bool moved, individual &candidate)
+    {
+        auto &[truck_paths, drone_paths] = candidate;
+        for (auto &path : truck_paths)
+        {
+            if (moved)
+            {
+                path.insert(customer);
+            }
+            else
+            {
+                path.erase(customer);
+            }
+        }
+        for (unsigned drone = 0; drone < extra.drones_count; drone++)
         {
-            if (bitmask & (1u << i))
+            for (unsigned path = 0; path < drone_paths[drone].size(); path++)
             {
-                unsigned customer = in_drone_paths_only_vector[i];
-                from_drone.push_back(customer);
-                for (auto &path : new_truck_paths)
+                if (moved)
                 {
-                    path.insert(customer);
+                    drone_paths[drone][path].erase(customer);
                 }
-                for (auto &paths : new_drone_paths)
+                else if (extra.drone_paths[drone][path].count(customer))
                 {
-                    for (auto &path : paths)
-                    {
-                        path.erase(customer);
-                    }
+                    drone_paths[drone][path].insert(customer);
                 }
             }
         }
+    };
 
-        py::object py_new_individual = from_cache(new_truck_paths, new_drone_paths);
-        extra.py_updater(py_new_individual);
+    // Brute-force swap, enumerating the subsets in Gray code order: consecutive subsets differ
+    // by a single customer, which is moved (or moved back) in place. The candidate is only
+    // copied when the memo of evaluations misses.
+    individual candidate(extra.truck_paths, extra.drone_paths);
+    for (unsigned long long step = 1; step < (1ull << (truck_trade + drone_trade)) && !state.exhausted(); step++)
+    {
+        unsigned bit = 0;
+        while (!(step & (1ull << bit)))
+        {
+            bit++;
+        }
 
-        if (feasible(py_new_individual))
+        const bool moved = (step ^ (step >> 1)) & (1ull << bit);
+        if (bit < drone_trade)
         {
-            result.first = std::min(result.first.value_or(py_new_individual), py_new_individual);
+            move_to_trucks(in_drone_paths_only_vector[bit], moved, candidate);
         }
-        result.second = std::min(result.second, py_new_individual);
+        else
+        {
+            move_to_drones(in_truck_paths_only_vector[bit - drone_trade], moved, candidate);
+        }
+
+        state.consider(state.evaluate(candidate), result);
     }
 }
 
-typedef std::function<void(const extra_info &, std::pair<std::optional<py::object>, py::object> &)> local_search_t;
-const std::vector<local_search_t> operations = {local_search_1, local_search_2, local_search_3, local_search_4, local_search_5};
+typedef std::function<void(const extra_info &, local_search_state &, local_search_result &)> local_search_t;
 
-std::pair<std::optional<py::object>, py::object> local_search(const py::object &py_individual, const py::object &py_updater)
+struct neighborhood
 {
-    py::object py_result_any = py_individual;
-    std::optional<py::object> py_result_feasible;
-    if (feasible(py_individual))
+    local_search_t apply;
+    std::function<bool(const extra_info &)> applicable; // false if the neighborhood cannot yield a new candidate
+};
+
+const std::vector<neighborhood> neighborhoods = {
+    {local_search_1,
+     [](const extra_info &extra)
+     {
+         return !extra.absent.empty();
+     }},
+    {local_search_2,
+     [](const extra_info &extra)
+     {
+         return !extra.absent.empty();
+     }},
+    {local_search_3,
+     [](const extra_info &extra)
+     {
+         return extra.drones_count > 0 && extra.in_truck_paths.size() > 1; // the depot is always in truck paths
+     }},
+    {local_search_4,
+     [](const extra_info &extra)
+     {
+         for (auto &paths : extra.drone_paths)
+         {
+             for (auto &path : paths)
+             {
+                 if (path.size() >= 3)
+                 {
+                     return true;
+                 }
+             }
+         }
+
+         return false;
+     }},
+    {local_search_5,
+     [](const extra_info &extra)
+     {
+         return !extra.in_truck_paths_only.empty() || !extra.in_drone_paths_only.empty();
+     }},
+};
+
+/** Success of a neighborhood over its applications within a single `local_search` call */
+struct neighborhood_statistics
+{
+    unsigned improvements = 0;
+    unsigned evaluations = 0;
+
+    /** Improvements per evaluated candidate, optimistic for neighborhoods that were rarely applied */
+    double score() const
+    {
+        return (improvements + 1.0) / (evaluations + 1.0);
+    }
+};
+
+/** Indices of the neighborhoods, the most successful per evaluated candidate first */
+std::vector<unsigned> neighborhood_order(const std::vector<neighborhood_statistics> &stats)
+{
+    std::vector<unsigned> order(neighborhoods.size());
+    std::iota(order.begin(), order.end(), 0);
+    std::stable_sort(
+        order.begin(), order.end(),
+        [&stats](unsigned first, unsigned second)
+        {
+            return stats[first].score() > stats[second].score();
+        });
+
+    return order;
+}
+
+/** Outcomes of completed searches, keyed by their initial genome and fine coefficients */
+lru_cache<std::pair<individual, std::pair<double, double>>, local_search_result> local_search_cache(10000);
+unsigned local_search_cache_epoch = 0;
+std::mutex local_search_cache_mutex; // local searches may run concurrently in several threads
+
+void setup_local_search_cache(unsigned capacity, const std::string &policy)
+{
+    std::lock_guard<std::mutex> lock(local_search_cache_mutex);
+    local_search_cache.capacity = capacity;
+    local_search_cache.clear(parse_cache_policy(policy));
+    local_search_cache_epoch = setup_epoch;
+}
+
+void resize_local_search_cache(std::size_t memory)
+{
+    std::lock_guard<std::mutex> lock(local_search_cache_mutex);
+    local_search_cache.resize(memory);
+}
+
+std::map<std::string, std::size_t> local_search_cache_info()
+{
+    std::lock_guard<std::mutex> lock(local_search_cache_mutex);
+    return local_search_cache.to_json();
+}
+
+/** Drop the cached outcomes once the problem setup has changed, the caller holds the lock */
+void __validate_local_search_cache()
+{
+    if (local_search_cache_epoch != setup_epoch)
     {
-        py_result_feasible = py_individual;
+        local_search_cache.clear();
+        local_search_cache_epoch = setup_epoch;
     }
+}
+
+/** Run the variable neighborhood descent from `genome` */
+local_search_result __local_search(const individual &genome, local_search_state &state)
+{
+    const auto initial = state.evaluate(genome);
+    local_search_result result = std::make_pair(initial.feasible() ? std::make_optional(initial) : std::nullopt, initial);
+
+    std::map<individual, extra_info> cache;
+    auto get_extra = [&cache](const individual &genome) -> const extra_info &
+    {
+        auto iter = cache.find(genome);
+        if (iter == cache.end())
+        {
+            iter = cache.emplace(genome, extra_info::from_genome(genome)).first;
+        }
 
-    std::unordered_map<py::object, extra_info> cache;
-    auto get_extra = [&cache, &py_updater](const py::object &py_individual)
+        return iter->second;
+    };
+
+    // Variable neighborhood descent: after an improvement, restart from the neighborhood with
+    // the best success rate so far. A neighborhood is never applied twice to the same individual
+    // (its candidates would all be memoized already) nor when it cannot yield a new candidate.
+    // The statistics are kept per call and measured in evaluations rather than time, so that
+    // the search does not depend on other calls or on the machine load.
+    std::vector<neighborhood_statistics> stats(neighborhoods.size());
+    auto order = neighborhood_order(stats);
+    std::vector<std::optional<individual>> applied_to(neighborhoods.size());
+    for (unsigned k = 0; k < order.size() && !state.exhausted();)
     {
-        try
+        const unsigned index = order[k];
+        const individual current = result.first.has_value() ? result.first->genome : result.second.genome;
+        const auto &extra = get_extra(current);
+        if (applied_to[index] == current || !neighborhoods[index].applicable(extra))
+        {
+            state.skipped++;
+            k++;
+            continue;
+        }
+
+        applied_to[index] = current;
+
+        auto old_result = result.first;
+        const unsigned evaluations = state.evaluations;
+        neighborhoods[index].apply(extra, state, result);
+
+        bool improved = old_result.has_value() ? *result.first < *old_result : result.first.has_value();
+        stats[index].improvements += improved;
+        stats[index].evaluations += state.evaluations - evaluations;
+        if (improved)
         {
-            return cache.at(py_individual);
+            order = neighborhood_order(stats);
+            k = 0;
         }
-        catch (std::out_of_range &e)
+        else
         {
-            auto extra = extra_info::from_individual(py_individual, py_updater);
-            cache.insert(std::make_pair(py_individual, extra));
-            return extra;
+            k++;
         }
+    }
+
+    local_search_stats.calls++;
+    local_search_stats.evaluations += state.evaluations;
+    local_search_stats.stopped += state.stopped();
+    local_search_stats.exhausted += state.exhausted() && !state.stopped();
+    local_search_stats.skipped += state.skipped;
+    local_search_stats.microseconds += (unsigned long long)(state.timer.elapsed() * 1.0e6);
+
+    return result;
+}
+
+/**
+ * Whether the evaluation of `py_individual` matches `e`. Costs are compared without their fines,
+ * which depend on the fine coefficients at the time of each evaluation, within a relative tolerance.
+ */
+bool __agrees(const py::object &py_individual, const evaluation &e, const std::pair<double, double> &fine_coefficient)
+{
+    auto close = [](const double first, const double second)
+    {
+        return std::abs(first - second) <= 1.0e-9 * std::max({1.0, std::abs(first), std::abs(second)});
     };
 
-    auto result = std::make_pair(py_result_feasible, py_result_any);
+    const auto [time_violation, weight_violation] = py::cast<std::pair<double, double>>(py_individual.attr("violation"));
+    const double base_cost = e.cost - fine_coefficient.first * e.violation.first - fine_coefficient.second * e.violation.second;
+    return close(py::cast<double>(py_individual.attr("base_cost")), base_cost) && close(time_violation, e.violation.first) && close(weight_violation, e.violation.second);
+}
+
+/**
+ * Search the neighborhoods of `py_individual`, returning the best feasible candidate (if any)
+ * and the best candidate overall.
+ *
+ * The search stops early, keeping the best candidates found so far, once `time_limit` seconds
+ * of wall-clock time have elapsed, `max_evaluations` candidates have been evaluated or `stop`
+ * is set.
+ *
+ * Completed searches are cached by genome, so searching a genome again under the same fine
+ * coefficients costs a single lookup. Searches stopped early are not cached.
+ */
+std::pair<std::optional<py::object>, py::object> local_search(
+    const py::object &py_individual,
+    const py::object &py_updater,
+    const std::pair<double, double> &fine_coefficient,
+    const std::optional<double> &time_limit,
+    const std::optional<unsigned> &max_evaluations,
+    const std::shared_ptr<stop_token> &stop)
+{
+    const auto genome = get_paths(py_individual);
+    const auto key = std::make_pair(genome, fine_coefficient);
+    local_search_state state(fine_coefficient, time_limit, max_evaluations, stop);
 
-    for (auto &operation : operations)
+    std::optional<local_search_result> result;
+    std::optional<evaluation> best_feasible;
     {
-        operations[0](get_extra(result.first.has_value() ? *result.first : result.second), result);
+        // Candidates are evaluated natively, so the GIL is only needed again to build the results
+        py::gil_scoped_release release;
 
-        bool improved = true;
-        while (improved)
         {
-            auto old_result = result.first;
-            operation(get_extra(result.first.has_value() ? *result.first : result.second), result);
+            std::lock_guard<std::mutex> lock(local_search_cache_mutex);
+            __validate_local_search_cache();
+            result = local_search_cache.get(key);
+        }
 
-            if (!old_result.has_value())
-            {
-                improved = result.first.has_value();
-            }
-            else
+        if (result.has_value())
+        {
+            best_feasible = result->first;
+        }
+        else
+        {
+            result = __local_search(genome, state);
+            best_feasible = state.best_feasible;
+            if (!state.exhausted())
             {
-                improved = *result.first < *old_result;
+                std::lock_guard<std::mutex> lock(local_search_cache_mutex);
+                __validate_local_search_cache();
+                local_search_cache.set(key, *result);
             }
         }
     }
 
-    return result;
+    // Each genome has a single instance, held by the individual cache. The cached instance may
+    // hold the solution decoded from another equivalent genome, its own feasibility then decides.
+    auto materialize = [&py_individual, &genome, &fine_coefficient](const evaluation &e)
+    {
+        if (e.source == genome)
+        {
+            return std::make_pair(py_individual, e.feasible());
+        }
+
+        auto py_cached = from_cache(e.source.first, e.source.second);
+        if (__agrees(py_cached, e, fine_coefficient))
+        {
+            return std::make_pair(py_cached, e.feasible());
+        }
+
+        return std::make_pair(py_cached, py::cast<bool>(py_cached.attr("feasible")()));
+    };
+
+    if (best_feasible.has_value())
+    {
+        auto [py_best, feasible] = materialize(*best_feasible);
+        if (feasible)
+        {
+            py_updater(py_best);
+        }
+    }
+
+    std::optional<py::object> py_result_feasible;
+    if (result->first.has_value())
+    {
+        auto [py_feasible, feasible] = materialize(*result->first);
+        if (feasible)
+        {
+            py_result_feasible = py_feasible;
+        }
+    }
+
+    return std::make_pair(py_result_feasible, materialize(result->second).first);
+}
+
+std::map<std::string, unsigned long long> local_search_info()
+{
+    return {
+        {"calls", local_search_stats.calls},
+        {"evaluations", local_search_stats.evaluations},
+        {"exhausted", local_search_stats.exhausted},
+        {"stopped", local_search_stats.stopped},
+        {"skipped", local_search_stats.skipped},
+        {"microseconds", local_search_stats.microseconds},
+    };
 }
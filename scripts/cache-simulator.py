@@ -0,0 +1,95 @@
+import argparse
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from ga.utils import CachePolicy, LRUCache, prepare_pyplot
+
+
+class Namespace(argparse.Namespace):
+    if TYPE_CHECKING:
+        traces: List[str]
+        capacities: List[int]
+        policies: List[CachePolicy]
+        plot: Optional[str]
+
+
+MAGIC = b"GATRACE1"
+LOOKUP = 0xFFFFFFFF
+
+
+parser = argparse.ArgumentParser(description="Replay cache traces recorded with vrpdfd.py --cache-trace against other capacities and policies", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("traces", nargs="+", type=str, help="the trace files (e.g. \"traces/tsp.trace\")")
+parser.add_argument("--capacities", nargs="*", default=[], type=int, help="the capacities to simulate (default: 1/64 to 1x the number of distinct keys)")
+parser.add_argument("--policies", nargs="*", default=["lru", "clock", "slru", "tinylfu"], choices=["lru", "clock", "slru", "tinylfu"], type=str, help="the eviction policies to simulate")
+parser.add_argument("--plot", type=str, help="save the hit ratio and saved time curves to this image")
+
+
+def read_trace(path: Path) -> List[Tuple[int, int]]:
+    data = path.read_bytes()
+    if not data.startswith(MAGIC):
+        raise ValueError(f"{path} is not a cache trace")
+
+    return list(struct.iter_unpack("<QI", data[len(MAGIC):len(data) - (len(data) - len(MAGIC)) % 12]))
+
+
+def simulate(records: List[Tuple[int, int]], costs: Dict[int, float], *, capacity: int, policy: CachePolicy) -> Tuple[float, float]:
+    """Return the hit ratio and the seconds saved by the hits"""
+    cache: LRUCache[int, bool] = LRUCache(capacity, policy=policy)
+    saved = 0.0
+    for key, value in records:
+        if value == LOOKUP:
+            if cache.get(key) is None:
+                cache[key] = True  # the value is computed and stored after a miss
+            else:
+                saved += costs[key]
+
+        elif key not in cache:
+            cache[key] = True  # stored without a lookup, e.g. under a second key
+
+    lookups = cache.hit + cache.miss
+    return cache.hit / max(lookups, 1), saved
+
+
+namespace = Namespace()
+parser.parse_args(namespace=namespace)
+
+curves: Dict[Tuple[str, CachePolicy], List[Tuple[int, float, float]]] = {}
+print("trace,policy,capacity,hit_ratio,saved_seconds")
+for trace in namespace.traces:
+    records = read_trace(Path(trace))
+
+    # The cost of a key is its last measured miss, or the average miss for keys that never missed
+    measured: Dict[int, float] = {key: value / 1e6 for key, value in records if value not in (0, LOOKUP)}
+    average = sum(measured.values()) / max(len(measured), 1)
+    keys = {key for key, _ in records}
+    costs = {key: measured.get(key, average) for key in keys}
+
+    capacities = namespace.capacities or sorted({max(len(keys) >> shift, 1) for shift in range(7)})
+    for policy in namespace.policies:
+        curve = curves[trace, policy] = []
+        for capacity in capacities:
+            hit_ratio, saved = simulate(records, costs, capacity=capacity, policy=policy)
+            curve.append((capacity, hit_ratio, saved))
+            print(f"{trace},{policy},{capacity},{hit_ratio:.4f},{saved:.4f}")
+
+
+if namespace.plot is not None:
+    prepare_pyplot()
+    from matplotlib import pyplot
+
+    figure, (hit_axes, saved_axes) = pyplot.subplots(1, 2, figsize=(12, 5))
+    for (trace, policy), curve in curves.items():
+        capacities = [capacity for capacity, _, _ in curve]
+        hit_axes.plot(capacities, [hit_ratio for _, hit_ratio, _ in curve], marker="o", label=f"{Path(trace).stem} ({policy})")
+        saved_axes.plot(capacities, [saved for _, _, saved in curve], marker="o", label=f"{Path(trace).stem} ({policy})")
+
+    for axes, label in ((hit_axes, "Hit ratio"), (saved_axes, "Saved time (s)")):
+        axes.set_xscale("log")
+        axes.set_xlabel("Capacity")
+        axes.set_ylabel(label)
+        axes.grid(True)
+        axes.legend()
+
+    figure.savefig(namespace.plot)
+    print(f"Saved plot to {namespace.plot}")
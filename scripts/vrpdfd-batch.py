@@ -0,0 +1,328 @@
+import argparse
+import collections
+import contextlib
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import signal
+import time
+import traceback
+from multiprocessing.connection import Connection, wait
+from pathlib import Path
+from typing import Deque, Dict, List, Literal, NamedTuple, Optional, Tuple, Union, TYPE_CHECKING
+
+from ga import utils
+from ga.vrpdfd import ProblemConfig, VRPDFDIndividual, VRPDFDSolution, SolutionJSON, local_search_cache_info, local_search_info, path_cache_info
+
+
+class Namespace(argparse.Namespace):
+    if TYPE_CHECKING:
+        problems: List[str]
+        seeds: List[int]
+        iterations: List[int]
+        size: List[int]
+        mutation_rate: List[float]
+        reset_after: List[int]
+        stuck_penalty_increase_rate: List[float]
+        local_search_batch: List[int]
+        local_search_time_limit: Optional[float]
+        local_search_evaluations: Optional[int]
+        sortie_limit: int
+        neighbors_limit: int
+        truck_trade_limit: int
+        drone_trade_limit: int
+        distance_storage: Literal["double", "float", "lazy"]
+        cache_limit: int
+        cache_policy: utils.CachePolicy
+        fake_tsp_solver: bool
+        extra: Optional[str]
+        workers: int
+        output: str
+        overwrite: bool
+
+
+class Settings(NamedTuple):
+    """The parameters shared by all jobs of a batch"""
+    local_search_time_limit: Optional[float]
+    local_search_evaluations: Optional[int]
+    sortie_limit: int
+    neighbors_limit: int
+    truck_trade_limit: int
+    drone_trade_limit: int
+    distance_storage: Literal["double", "float", "lazy"]
+    cache_limit: int
+    cache_policy: utils.CachePolicy
+    fake_tsp_solver: bool
+    extra: Optional[str]
+
+
+class Job(NamedTuple):
+    problem: str
+    seed: int
+    iterations: int
+    size: int
+    mutation_rate: float
+    reset_after: int
+    stuck_penalty_increase_rate: float
+    local_search_batch: int
+
+    def output(self, directory: Path, settings: Settings) -> Path:
+        # The digest covers the shared settings too, so that resuming with other settings runs the jobs again
+        digest = hashlib.sha1(json.dumps([self, settings]).encode("utf-8")).hexdigest()[:12]
+        return directory / f"output-{self.problem}-{self.seed}-{digest}.json"
+
+
+# A worker answers each job with its result or the formatted exception
+Outcome = Tuple[Job, Union[SolutionJSON, str]]
+
+
+parser = argparse.ArgumentParser(description="Run vrpdfd.py over a grid of problems, seeds and parameters on a pool of worker processes", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("problems", nargs="+", type=str, help="the problem names (e.g. \"6.5.1\", \"200.10.1\", ...)")
+parser.add_argument("--seeds", nargs="+", default=[0], type=int, help="the random seeds, each combination of parameters is run once per seed")
+parser.add_argument("-i", "--iterations", nargs="+", default=[200], type=int, help="the numbers of generations")
+parser.add_argument("--size", nargs="+", default=[100], type=int, help="the population sizes")
+parser.add_argument("--mutation-rate", nargs="+", default=[0.1], type=float, help="the mutation rates")
+parser.add_argument("--reset-after", nargs="+", default=[10], type=int, help="the numbers of non-improving generations before applying stuck penalty and local search")
+parser.add_argument("--stuck-penalty-increase-rate", nargs="+", default=[0.0], type=float, help="the stuck penalty increase rates")
+parser.add_argument("--local-search-batch", nargs="+", default=[50], type=int, help="the batch sizes for local search")
+parser.add_argument("--local-search-time-limit", type=float, help="the wall-clock seconds allowed for the local search of each individual (default: unlimited)")
+parser.add_argument("--local-search-evaluations", type=int, help="the maximum number of candidates evaluated by each local search call (default: unlimited)")
+parser.add_argument("--sortie-limit", default=0, type=int, help="precompute all feasible drone sorties serving up to this number of customers (0 to disable)")
+parser.add_argument("--neighbors-limit", default=0, type=int, help="restrict mutation and local search to this number of nearest customers (0 to consider all customers)")
+parser.add_argument("--truck-trade-limit", default=4, type=int, help="the number of truck-only customers that local search may move to drones")
+parser.add_argument("--drone-trade-limit", default=4, type=int, help="the number of drone-only customers that local search may move to trucks")
+parser.add_argument("--distance-storage", default="double", choices=["double", "float", "lazy"], type=str, help="storage of the distance matrix, \"lazy\" computes distances on demand for very large problems")
+parser.add_argument("--cache-limit", default=100000, type=int, help="set limit for individuals, TSP and local search cache, kept across the jobs of a worker on the same problem")
+parser.add_argument("--cache-policy", default="lru", choices=["lru", "clock", "slru", "tinylfu"], type=str, help="the eviction policy of the individuals, TSP and local search cache")
+parser.add_argument("--fake-tsp-solver", action="store_true", help="use fake TSP solver")
+parser.add_argument("--extra", type=str, help="extra data saved with each result")
+parser.add_argument("--workers", default=os.cpu_count() or 1, type=int, help="the number of worker processes")
+parser.add_argument("--output", default="vrpdfd-summary", type=str, help="the directory of the output-*.json results, see scripts/vrpdfd-summary.py")
+parser.add_argument("--overwrite", action="store_true", help="run the jobs whose result already exists again instead of resuming the batch")
+
+
+def run(job: Job, settings: Settings) -> SolutionJSON:
+    """Run a job on the active problem, the caches are left warm for the next one"""
+    config = ProblemConfig.get_config(job.problem)
+    config.mutation_rate = job.mutation_rate
+    config.reset_after = job.reset_after
+    config.stuck_penalty_increase_rate = job.stuck_penalty_increase_rate
+    config.local_search_batch = job.local_search_batch
+    config.local_search_time_limit = settings.local_search_time_limit
+    config.local_search_evaluations = settings.local_search_evaluations
+
+    # Tuned by the previous job
+    VRPDFDSolution.fine_coefficient = (0, 0)
+
+    random.seed(job.seed)
+    start = time.perf_counter()
+    individual = VRPDFDIndividual.genetic_algorithm(
+        generations_count=job.iterations,
+        population_size=job.size,
+        population_expansion_limit=2 * job.size,
+        solution_cls=VRPDFDSolution,
+        verbose=False,
+    )
+    solution = individual.decode()
+    total_time = time.perf_counter() - start
+
+    return {
+        "problem": job.problem,
+        "generations": VRPDFDIndividual.genetic_algorithm_generation + 1,
+        "population_size": job.size,
+        "mutation_rate": job.mutation_rate,
+        "reset_after": job.reset_after,
+        "stuck_penalty_increase_rate": job.stuck_penalty_increase_rate,
+        "local_search_batch": job.local_search_batch,
+        "local_search_time_limit": settings.local_search_time_limit,
+        "local_search_evaluations": settings.local_search_evaluations,
+        "solution": solution.to_json(),
+        "time": total_time,
+        "fake_tsp_solver": settings.fake_tsp_solver,
+        "last_improved": VRPDFDIndividual.genetic_algorithm_last_improved,
+        "extra": settings.extra,
+        "cache_info": {
+            "limit": settings.cache_limit,
+            "cold_limit": 0,
+            "memory": None,
+            "policy": settings.cache_policy,
+            "individual": VRPDFDIndividual.cache.to_json(),
+            "cold_individual": VRPDFDIndividual.cold_cache.to_json(),
+            "tsp": path_cache_info(),
+            "local_search": local_search_cache_info(),
+        },
+        "local_search_info": local_search_info(),
+    }
+
+
+def worker(connection: Connection, settings: Settings) -> None:
+    """Run the jobs received from `connection` until it sends None"""
+    # An interrupted genetic algorithm returns its best individual so far, which must not be saved as a result
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if settings.fake_tsp_solver:
+        utils.tsp_solver = utils.fake_tsp_solver
+
+    ProblemConfig.distance_storage = settings.distance_storage
+    problem: Optional[str] = None
+    while (job := connection.recv()) is not None:
+        outcome: Outcome
+        try:
+            if job.problem != problem:
+                # The caches are keyed by customers only, they must not outlive the problem
+                config = ProblemConfig.get_config(job.problem)
+                ProblemConfig.context = problem = job.problem
+                config.setup_neighbors(settings.neighbors_limit)
+                config.setup_sorties(settings.sortie_limit)
+                config.setup_trade_limits(settings.truck_trade_limit, settings.drone_trade_limit)
+                VRPDFDIndividual.setup_cache(settings.cache_limit, policy=settings.cache_policy)
+
+            outcome = job, run(job, settings)
+
+        except Exception:
+            problem = None
+            outcome = job, traceback.format_exc()
+
+        connection.send(outcome)
+
+
+def schedule(jobs: List[Job], settings: Settings, *, directory: Path, workers: int) -> int:
+    """Run `jobs` on `workers` processes, return the number of failed jobs
+
+    An idle worker takes the next job of the problem it ran last, so that its caches stay warm,
+    and moves to the problem with the most pending jobs otherwise.
+    """
+    pending: Dict[str, Deque[Job]] = collections.defaultdict(collections.deque)
+    for job in jobs:
+        pending[job.problem].append(job)
+
+    def next_job(problem: Optional[str]) -> Optional[Job]:
+        if problem is None or problem not in pending:
+            if len(pending) == 0:
+                return None
+
+            problem = max(pending, key=lambda p: len(pending[p]))
+
+        queue = pending[problem]
+        job = queue.popleft()
+        if len(queue) == 0:
+            del pending[problem]
+
+        return job
+
+    processes: Dict[Connection, multiprocessing.Process] = {}
+    running: Dict[Connection, Job] = {}
+
+    def start(job: Job) -> None:
+        connection, child = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=worker, args=(child, settings), daemon=True)
+        process.start()
+        child.close()
+
+        processes[connection] = process
+        running[connection] = job
+        connection.send(job)
+
+    failed = done = 0
+    try:
+        for _ in range(workers):
+            if (first := next_job(None)) is None:
+                break
+
+            start(first)
+
+        while len(running) > 0:
+            for connection in wait(list(running)):
+                assert isinstance(connection, Connection)
+                job = running.pop(connection)
+                done += 1
+                try:
+                    _, result = connection.recv()
+
+                except EOFError:
+                    # The worker died with the job, the next one gets a new worker
+                    result = f"Worker exited with code {processes[connection].exitcode}"
+                    processes.pop(connection).join()
+                    connection.close()
+
+                if isinstance(result, str):
+                    failed += 1
+                    print(f"[{done}/{len(jobs)}] {job} failed:\n{result}", flush=True)
+
+                else:
+                    path = job.output(directory, settings)
+                    temporary = path.with_suffix(".tmp")
+                    with temporary.open("w", encoding="utf-8") as file:
+                        json.dump(result, file)
+
+                    # Written in one step, so that an interrupted batch never resumes past a partial result
+                    temporary.replace(path)
+                    print(f"[{done}/{len(jobs)}] {job}: profit {result['solution']['profit']} after {result['time']:.4f}s, saved to {path}", flush=True)
+
+                if connection in processes:
+                    if (following := next_job(job.problem)) is not None:
+                        running[connection] = following
+                        connection.send(following)
+
+                elif (following := next_job(None)) is not None:
+                    start(following)
+
+    finally:
+        for connection, process in processes.items():
+            if connection in running:
+                process.terminate()
+            else:
+                with contextlib.suppress(OSError):
+                    connection.send(None)
+
+        for connection, process in processes.items():
+            process.join()
+            connection.close()
+
+    return failed
+
+
+if __name__ == "__main__":
+    namespace = Namespace()
+    parser.parse_args(namespace=namespace)
+    print(namespace)
+
+    settings = Settings(
+        local_search_time_limit=namespace.local_search_time_limit,
+        local_search_evaluations=namespace.local_search_evaluations,
+        sortie_limit=namespace.sortie_limit,
+        neighbors_limit=namespace.neighbors_limit,
+        truck_trade_limit=namespace.truck_trade_limit,
+        drone_trade_limit=namespace.drone_trade_limit,
+        distance_storage=namespace.distance_storage,
+        cache_limit=namespace.cache_limit,
+        cache_policy=namespace.cache_policy,
+        fake_tsp_solver=namespace.fake_tsp_solver,
+        extra=namespace.extra,
+    )
+    directory = Path(namespace.output)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    jobs = [
+        Job(*values)
+        for values in itertools.product(
+            namespace.problems,
+            namespace.seeds,
+            namespace.iterations,
+            namespace.size,
+            namespace.mutation_rate,
+            namespace.reset_after,
+            namespace.stuck_penalty_increase_rate,
+            namespace.local_search_batch,
+        )
+    ]
+    remaining = [job for job in jobs if namespace.overwrite or not job.output(directory, settings).is_file()]
+    print(f"Running {len(remaining)} jobs ({len(jobs) - len(remaining)} completed earlier) on {min(namespace.workers, len(remaining))} workers")
+
+    start = time.perf_counter()
+    failed = schedule(remaining, settings, directory=directory, workers=namespace.workers)
+    print(f"Completed {len(remaining) - failed}/{len(remaining)} jobs in {time.perf_counter() - start:.4f}s")
+    if failed > 0:
+        raise SystemExit(1)
@@ -0,0 +1,39 @@
+import argparse
+import time
+from pathlib import Path
+from typing import List, TYPE_CHECKING
+
+from ga.vrpdfd import ProblemConfig
+
+
+class Namespace(argparse.Namespace):
+    if TYPE_CHECKING:
+        problems: List[str]
+        neighbors_limit: int
+        sortie_limit: int
+
+
+parser = argparse.ArgumentParser(description="Compile VRPDFD problems to memory-mappable binary files", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("problems", nargs="*", type=str, help="the problem names (e.g. \"6.5.1\", \"200.10.1\", ...), defaults to all problems")
+parser.add_argument("--neighbors-limit", default=0, type=int, help="also store this number of nearest customers of each customer")
+parser.add_argument("--sortie-limit", default=0, type=int, help="also store all feasible drone sorties serving up to this number of customers")
+
+
+namespace = Namespace()
+parser.parse_args(namespace=namespace)
+
+problems = namespace.problems
+if len(problems) == 0:
+    problems = sorted(
+        (file.stem for file in Path("problems/vrpdfd").glob("*.csv") if file.stem != "params"),
+        key=lambda problem: tuple(map(int, problem.split("."))),
+    )
+
+ProblemConfig.use_compiled = False
+for problem in problems:
+    start = time.perf_counter()
+    config = ProblemConfig(problem)
+    config.setup_neighbors(namespace.neighbors_limit)
+    config.setup_sorties(namespace.sortie_limit)
+    file_path = config.compile()
+    print(f"Compiled {problem} to {file_path} in {time.perf_counter() - start:.4f}s")
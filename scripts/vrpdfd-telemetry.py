@@ -0,0 +1,76 @@
+import argparse
+import json
+import selectors
+import socket
+import time
+from typing import Dict, List, TYPE_CHECKING
+
+from ga.utils import TelemetryServer
+
+
+class Namespace(argparse.Namespace):
+    if TYPE_CHECKING:
+        addresses: List[str]
+        raw: bool
+        wait: float
+
+
+parser = argparse.ArgumentParser(description="Tail the telemetry published by vrpdfd.py --telemetry", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("addresses", nargs="+", type=str, help="the telemetry addresses, \"unix:<path>\" or \"[host:]port\"")
+parser.add_argument("--raw", action="store_true", help="print the JSON lines as received")
+parser.add_argument("--wait", default=0.0, type=float, help="keep retrying to connect to runs that have not started yet for this many seconds")
+
+
+def connect(address: str, *, deadline: float) -> socket.socket:
+    while True:
+        try:
+            return TelemetryServer.connect(address)
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+
+            time.sleep(0.2)
+
+
+def summary(event: Dict[str, object]) -> str:
+    if event["event"] != "generation":
+        return f"{event['problem']} (pid {event['pid']}) {event['event']}: best {event['best_cost']} feasible {event['feasible']}"
+
+    hit_rates = event["cache_hit_rates"]
+    timings = event["timings"]
+    rss = event["rss"]
+    assert isinstance(hit_rates, dict) and isinstance(timings, dict) and isinstance(rss, int)
+    return (
+        f"{event['problem']} (pid {event['pid']}) #{event['generation']}: best {event['best_cost']:.2f}"
+        f" {'feasible' if event['feasible'] else 'infeasible'}, {event['feasible_count']} feasible,"
+        f" diversity {event['diversity']:.3f}, {sum(timings.values()):.3f}s,"
+        f" hits {' '.join(f'{name} {rate:.0%}' for name, rate in hit_rates.items())}, RSS {rss / 2 ** 20:.1f}MB"
+    )
+
+
+namespace = Namespace()
+parser.parse_args(namespace=namespace)
+
+deadline = time.monotonic() + namespace.wait
+selector = selectors.DefaultSelector()
+buffers: Dict[socket.socket, bytes] = {}
+for address in namespace.addresses:
+    client = connect(address, deadline=deadline)
+    selector.register(client, selectors.EVENT_READ, address)
+    buffers[client] = b""
+
+while len(buffers) > 0:
+    for key, _ in selector.select():
+        assert isinstance(key.fileobj, socket.socket)
+        data = key.fileobj.recv(1 << 16)
+        if len(data) == 0:
+            print(f"[{key.data}] disconnected")
+            selector.unregister(key.fileobj)
+            key.fileobj.close()
+            del buffers[key.fileobj]
+            continue
+
+        *lines, buffers[key.fileobj] = (buffers[key.fileobj] + data).split(b"\n")
+        for line in lines:
+            text = line.decode("utf-8")
+            print(f"[{key.data}] {text if namespace.raw else summary(json.loads(text))}", flush=True)
@@ -0,0 +1,249 @@
+import argparse
+import collections
+import itertools
+import json
+import math
+import os
+import random
+import re
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Deque, Dict, List, NamedTuple, Optional, Set, Tuple, TYPE_CHECKING
+
+from ga import utils
+from ga.vrpdfd import ProblemConfig, VRPDFDIndividual, VRPDFDSolution
+
+
+class Namespace(argparse.Namespace):
+    if TYPE_CHECKING:
+        problems: List[str]
+        classes: List[int]
+        instances: int
+        seeds: List[int]
+        size: List[int]
+        mutation_rate: List[float]
+        reset_after: List[int]
+        stuck_penalty_increase_rate: List[float]
+        local_search_batch: List[int]
+        configurations: int
+        iterations: int
+        eta: int
+        grace: float
+        cache_limit: int
+        fake_tsp_solver: bool
+        workers: int
+        seed: int
+        output: str
+
+
+class Configuration(NamedTuple):
+    size: int
+    mutation_rate: float
+    reset_after: int
+    stuck_penalty_increase_rate: float
+    local_search_batch: int
+
+
+class Task(NamedTuple):
+    configuration: Configuration
+    problem: str
+    seed: int
+    iterations: int
+    cutoff: Optional[Tuple[float, ...]]
+    grace: int
+
+
+# The best feasible cost after each generation, infinite until a feasible individual is found
+Curve = Tuple[float, ...]
+
+
+parser = argparse.ArgumentParser(description="Tune the GA parameters per instance size by successive halving over configurations and seeds", formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+parser.add_argument("problems", nargs="*", type=str, help="the problem names (default: all problems in problems/vrpdfd)")
+parser.add_argument("--classes", nargs="+", default=[6, 10, 12, 20, 50, 100, 150, 200], type=int, help="the instance sizes (numbers of customers) to tune for")
+parser.add_argument("--instances", default=3, type=int, help="the number of problems sampled from each instance size")
+parser.add_argument("--seeds", nargs="+", default=[0, 1], type=int, help="the random seeds each configuration runs with on each problem")
+parser.add_argument("--size", nargs="+", default=[50, 100, 200], type=int, help="the candidate population sizes")
+parser.add_argument("--mutation-rate", nargs="+", default=[0.05, 0.1, 0.2, 0.4], type=float, help="the candidate mutation rates")
+parser.add_argument("--reset-after", nargs="+", default=[5, 10, 20], type=int, help="the candidate numbers of non-improving generations before applying stuck penalty and local search")
+parser.add_argument("--stuck-penalty-increase-rate", nargs="+", default=[0.0, 1.0, 5.0], type=float, help="the candidate stuck penalty increase rates")
+parser.add_argument("--local-search-batch", nargs="+", default=[20, 50, 100], type=int, help="the candidate batch sizes for local search")
+parser.add_argument("--configurations", default=27, type=int, help="the number of configurations sampled from the candidates")
+parser.add_argument("--iterations", default=200, type=int, help="the number of generations of the last round")
+parser.add_argument("--eta", default=3, type=int, help="keep 1/eta of the configurations after each round, which runs eta times fewer generations than the next one")
+parser.add_argument("--grace", default=0.5, type=float, help="the fraction of generations each run completes before it may be stopped early for falling behind the survivors")
+parser.add_argument("--cache-limit", default=100000, type=int, help="set limit for individuals, TSP and local search cache")
+parser.add_argument("--fake-tsp-solver", action="store_true", help="use fake TSP solver")
+parser.add_argument("--workers", default=os.cpu_count() or 1, type=int, help="the number of worker processes")
+parser.add_argument("--seed", default=0, type=int, help="the random seed of the configuration and problem sampling")
+parser.add_argument("--output", default="vrpdfd-tuning.json", type=str, help="save the winning configuration of each instance size to this file")
+
+
+_problem: Optional[str] = None
+
+
+def initializer(fake_tsp_solver: bool) -> None:
+    if fake_tsp_solver:
+        utils.tsp_solver = utils.fake_tsp_solver
+
+
+def evaluate(task: Task, cache_limit: int) -> Curve:
+    """Run the GA for a task, stopping once its progress falls behind `task.cutoff` after `task.grace` generations"""
+    global _problem
+    if task.problem != _problem:
+        # The caches are keyed by customers only, they must not outlive the problem
+        ProblemConfig.quick_setup(task.problem)
+        VRPDFDIndividual.setup_cache(cache_limit)
+        _problem = task.problem
+
+    config = ProblemConfig.get_config(task.problem)
+    config.mutation_rate = task.configuration.mutation_rate
+    config.reset_after = task.configuration.reset_after
+    config.stuck_penalty_increase_rate = task.configuration.stuck_penalty_increase_rate
+    config.local_search_batch = task.configuration.local_search_batch
+    VRPDFDSolution.fine_coefficient = (0, 0)
+
+    random.seed(task.seed)
+    curve: List[float] = []
+    events = VRPDFDIndividual.genetic_algorithm_iter(
+        generations_count=task.iterations,
+        population_size=task.configuration.size,
+        population_expansion_limit=2 * task.configuration.size,
+        solution_cls=VRPDFDSolution,
+        verbose=False,
+        every_generation=True,
+    )
+    for event in events:
+        if event.generation > 0:
+            curve.append(event.result.base_cost if event.result.feasible() else math.inf)
+            if task.cutoff is not None and event.generation >= task.grace and curve[-1] > task.cutoff[event.generation - 1]:
+                break
+
+    events.close()
+    return tuple(curve)
+
+
+def mean_ranks(results: Dict[Configuration, List[float]]) -> Dict[Configuration, float]:
+    """The rank of each configuration on each run, averaged over the runs (tied configurations share their mean rank)"""
+    configurations = list(results)
+    totals = dict.fromkeys(configurations, 0.0)
+    runs = len(results[configurations[0]])
+    for run in range(runs):
+        ordered = sorted(configurations, key=lambda c: results[c][run])
+        for _, group in itertools.groupby(enumerate(ordered, start=1), key=lambda pair: results[pair[1]][run]):
+            tied = list(group)
+            rank = sum(position for position, _ in tied) / len(tied)
+            for _, configuration in tied:
+                totals[configuration] += rank
+
+    return {configuration: total / runs for configuration, total in totals.items()}
+
+
+def race(
+    executor: ProcessPoolExecutor,
+    configurations: List[Configuration],
+    *,
+    problems: List[str],
+    namespace: Namespace,
+) -> Tuple[Configuration, List[Dict[str, object]]]:
+    """Successive halving of `configurations` over `problems` and the seeds, return the winner and the rounds history"""
+    rounds = 0
+    survivors = len(configurations)
+    while survivors > 1 or rounds == 0:
+        survivors = math.ceil(survivors / namespace.eta)
+        rounds += 1
+
+    history: List[Dict[str, object]] = []
+    for index in range(rounds):
+        iterations = max(1, math.ceil(namespace.iterations / namespace.eta ** (rounds - 1 - index)))
+        keep = max(1, math.ceil(len(configurations) / namespace.eta))
+        instances = list(itertools.product(problems, namespace.seeds))
+
+        # Interleave the configurations, so that the runs of an instance complete early enough to stop the next ones
+        pending: Deque[Tuple[Configuration, Tuple[str, int]]] = collections.deque((c, i) for i, c in itertools.product(instances, configurations))
+        curves: Dict[Tuple[str, int], Dict[Configuration, Curve]] = {instance: {} for instance in instances}
+        futures: Dict[Future[Curve], Tuple[Configuration, Tuple[str, int]]] = {}
+        stopped: Set[Configuration] = set()
+
+        def submit() -> None:
+            configuration, instance = pending.popleft()
+            completed = [curve for curve in curves[instance].values() if len(curve) == iterations]
+            cutoff: Optional[Curve] = None
+            if len(completed) >= keep:
+                # A run that falls behind the last survivor among the completed runs can hardly survive
+                cutoff = tuple(sorted(values)[keep - 1] for values in zip(*completed))
+
+            task = Task(configuration, *instance, iterations=iterations, cutoff=cutoff, grace=math.ceil(namespace.grace * iterations))
+            futures[executor.submit(evaluate, task, namespace.cache_limit)] = configuration, instance
+
+        while len(pending) > 0 and len(futures) < namespace.workers:
+            submit()
+
+        while len(futures) > 0:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                configuration, instance = futures.pop(future)
+                curve = curves[instance][configuration] = future.result()
+                if len(curve) < iterations:
+                    stopped.add(configuration)
+
+                if len(pending) > 0:
+                    submit()
+
+        # A stopped run is scored by its last generation. Curves never increase, so it still ranks
+        # behind the completed runs that set its cutoff.
+        results = {configuration: [curves[instance][configuration][-1] for instance in instances] for configuration in configurations}
+        scores = mean_ranks(results)
+        ranked = sorted(configurations, key=scores.__getitem__)
+        history.append(
+            {
+                "iterations": iterations,
+                "configurations": [
+                    {
+                        "configuration": configuration._asdict(),
+                        "score": scores[configuration],
+                        "feasible": sum(math.isfinite(cost) for cost in results[configuration]) / len(instances),
+                        "stopped": configuration in stopped,
+                    }
+                    for configuration in ranked
+                ],
+            },
+        )
+
+        print(f"Round {index + 1}/{rounds}: {len(configurations)} configurations x {len(instances)} runs x {iterations} generations, best {ranked[0]} (mean rank {scores[ranked[0]]:.2f}), {len(stopped)} stopped early", flush=True)
+        configurations = ranked[:keep]
+
+    return configurations[0], history
+
+
+if __name__ == "__main__":
+    namespace = Namespace()
+    parser.parse_args(namespace=namespace)
+    print(namespace)
+
+    rng = random.Random(namespace.seed)
+    problems = namespace.problems or sorted(file.stem for file in Path("problems", "vrpdfd").iterdir() if re.fullmatch(r"\d+\.\d+\.\d+\.csv", file.name))
+
+    classes: Dict[int, List[str]] = {}
+    for problem in problems:
+        customers = int(problem.split(".")[0])
+        if customers in namespace.classes:
+            classes.setdefault(customers, []).append(problem)
+
+    grid = [Configuration(*values) for values in itertools.product(namespace.size, namespace.mutation_rate, namespace.reset_after, namespace.stuck_penalty_increase_rate, namespace.local_search_batch)]
+    configurations = grid if len(grid) <= namespace.configurations else rng.sample(grid, namespace.configurations)
+
+    output: Dict[str, Dict[str, object]] = {}
+    with ProcessPoolExecutor(max_workers=namespace.workers, initializer=initializer, initargs=(namespace.fake_tsp_solver,)) as executor:
+        for customers, candidates in sorted(classes.items()):
+            sampled = sorted(rng.sample(candidates, min(namespace.instances, len(candidates))))
+            print(f"Tuning for {customers} customers on {', '.join(sampled)}")
+
+            winner, history = race(executor, configurations, problems=sampled, namespace=namespace)
+            output[str(customers)] = {"problems": sampled, "configuration": winner._asdict(), "rounds": history}
+            print(f"Winner for {customers} customers: {winner}")
+
+            # Saved after each instance size, an interrupted tuning keeps the completed ones
+            with open(namespace.output, "w", encoding="utf-8") as file:
+                json.dump(output, file, indent=4)
+
+    print(f"Saved tuning results to {namespace.output}")
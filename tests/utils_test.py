@@ -1,5 +1,14 @@
+import functools
 import itertools
-from typing import Sequence
+import json
+import math
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, List, Sequence, Tuple
 
 from ga import utils
 
@@ -87,3 +96,227 @@ def test_flows_with_answers_as_demands() -> None:
 def test_weird_round() -> None:
     assert utils.weird_round(1.234, 2) == 1.24
     assert utils.weird_round(2.3301, 2) == 2.34
+
+
+def test_k_nearest_neighbors() -> None:
+    points = [(random.uniform(-10, 10), random.uniform(-10, 10)) for _ in range(500)]
+    neighbors = utils.k_nearest_neighbors(points, k=5)
+
+    assert len(neighbors) == len(points)
+    for index, point in enumerate(points):
+        expected = sorted(math.dist(point, other) for i, other in enumerate(points) if i != index)[:5]
+        assert utils.isclose(expected, [math.dist(point, points[i]) for i in neighbors[index]])
+
+
+def test_lru_cache_memory() -> None:
+    cache: utils.LRUCache[int, int] = utils.LRUCache(1000, memory=10000, sizeof=lambda key, value: 1000)
+    for key in range(20):
+        cache[key] = key
+
+    assert len(cache) < 10
+    assert cache.bytes <= cache.memory
+    assert all(key in cache for key in range(20 - len(cache), 20))
+
+    # A miss on a recently evicted key is a ghost hit
+    assert cache.get(19 - len(cache)) is None
+    assert cache.ghost_hit == 1
+    assert cache.get(0) is None
+    assert cache.ghost_hit == 1
+
+    cache.memory = 5000
+    assert cache.bytes <= 5000
+    assert cache.to_json()["bytes"] == cache.bytes
+
+    assert utils.parse_size("4G") == 4 * 2 ** 30
+    assert utils.parse_size("1.5m") == 3 * 2 ** 19
+    assert utils.parse_size("1024") == 1024
+
+
+def test_memory_budget() -> None:
+    caches: List[utils.LRUCache[int, int]] = [utils.LRUCache(100000, sizeof=lambda key, value: 100) for _ in range(2)]
+    budget = utils.MemoryBudget(100000)
+    for index, cache in enumerate(caches):
+        budget.register(str(index), info=cache.to_json, resize=functools.partial(setattr, cache, "memory"))
+
+    assert [cache.memory for cache in caches] == [50000, 50000]
+
+    # Only the first cache would benefit from more memory
+    for _ in range(20):
+        for key in range(310):
+            if caches[0].get(key) is None:
+                caches[0][key] = key
+
+        for key in range(100):
+            if caches[1].get(key) is None:
+                caches[1][key] = key
+
+        budget.rebalance()
+
+    assert caches[0].memory > caches[1].memory >= 5000
+    assert sum(cache.memory for cache in caches) == 100000
+    assert budget.to_json() == {"0": caches[0].memory, "1": caches[1].memory}
+
+
+def test_lru_cache_policies() -> None:
+    policies: List[utils.CachePolicy] = ["lru", "clock", "slru", "tinylfu"]
+    for policy in policies:
+        cache: utils.LRUCache[Tuple[FrozenSet[int], ...], int] = utils.LRUCache(100, policy=policy)
+        assert cache.policy == policy
+
+        # Keys are compared by value, not by identity
+        cache[frozenset([1, 2]), frozenset([3])] = 0
+        assert cache.get((frozenset([2, 1]), frozenset([3]))) == 0
+
+        reference: Dict[Tuple[FrozenSet[int], ...], int] = {}
+        for _ in range(5000):
+            key = (frozenset([random.randint(0, 300)]),)
+            if random.random() < 0.5:
+                cache[key] = reference[key] = random.randint(0, 1000)
+            else:
+                value = cache.get(key)
+                assert value is None or value == reference[key]
+
+        assert len(cache) <= 100
+        assert all(cache.peek(key) == reference[key] for key in cache)
+
+        info = cache.to_json()
+        assert all(key in cache for key in list(cache))
+        assert cache.to_json() == info
+
+        keys = list(cache)[:10]
+        assert cache.get_many(keys) == [reference[key] for key in keys]
+        assert cache.hit == info["hit"] + 10
+
+        cache.set_many([((frozenset([-1]),), -1), ((frozenset([-2]),), -2)])
+        if policy != "tinylfu":
+            assert cache.get_many([(frozenset([-1]),), (frozenset([-2]),)]) == [-1, -2]
+
+    # A scan of keys requested once does not flush the frequently used keys
+    for policy in ("slru", "tinylfu"):
+        scanned: utils.LRUCache[int, int] = utils.LRUCache(100, policy=policy)
+        for _ in range(3):
+            for number in range(50):
+                if scanned.get(number) is None:
+                    scanned[number] = number
+
+        for number in range(1000, 2000):
+            scanned[number] = number
+
+        assert all(number in scanned for number in range(50)), policy
+
+
+def test_lru_cache_trace() -> None:
+    cache: utils.LRUCache[int, int] = utils.LRUCache(10)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.trace")
+        cache.trace(path)
+        for key in (1, 2, 1):
+            if cache.get(key) is None:
+                cache[key] = key
+
+        cache[3] = 3
+        cache.trace(None)
+
+        with open(path, "rb") as trace:
+            assert trace.read(8) == b"GATRACE1"
+            records = list(struct.iter_unpack("<QI", trace.read()))
+
+    lookup = 0xFFFFFFFF
+    assert [(key, value == lookup) for key, value in records] == [(1, True), (1, False), (2, True), (2, False), (1, True), (3, False)]
+    assert records[1][1] > 0 and records[5][1] == 0
+
+
+def test_log_sink() -> None:
+    records = [{"Generation": generation, "Cost": generation / 3} for generation in range(1, 11)]
+    with tempfile.TemporaryDirectory() as directory:
+        for format in ("csv", "jsonl", "binary"):
+            path = os.path.join(directory, f"log.{format}")
+            sink = utils.LogSink(path, format=format, buffer=2, block=4)
+            for record in records:
+                sink.write(record)
+                if record["Generation"] == 5:
+                    sink.note("Halfway")
+
+            sink.close()
+
+            if format == "binary":
+                columns, notes = utils.read_log(path)
+                assert columns == {"Generation": [float(r["Generation"]) for r in records], "Cost": [r["Cost"] for r in records]}
+                assert notes == [(5, "Halfway")]
+
+            else:
+                with open(path, encoding="utf-8") as file:
+                    lines = file.read().splitlines()
+
+                if format == "csv":
+                    assert lines[0] == "Generation,Cost"
+                    assert lines[6] == "\"Halfway\""
+                    assert lines[11] == f"10,{10 / 3}"
+
+                else:
+                    assert lines[5] == "{\"note\": \"Halfway\"}"
+                    assert lines[10] == json.dumps(records[-1])
+
+
+def test_telemetry_server() -> None:
+    server = utils.TelemetryServer("127.0.0.1:0", buffer=16, client_buffer=4096)
+
+    def wait(condition: Callable[[], bool]) -> None:
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert condition()
+
+    try:
+        # A client that never reads loses events instead of slowing down the publisher
+        stalled = utils.TelemetryServer.connect(server.address)
+        wait(lambda: server.clients == 1)
+        started = time.perf_counter()
+        for index in range(10000):
+            server.publish({"index": index, "padding": "x" * 100})
+
+        assert time.perf_counter() - started < 1
+        wait(lambda: server.dropped > 0)
+
+        reader = utils.TelemetryServer.connect(server.address)
+        wait(lambda: server.clients == 2)
+        wait(lambda: server.publish({"index": "last"}))
+        with reader.makefile("rb") as stream:
+            last = json.loads(stream.readline())
+            while "padding" in last:  # events of the burst still queued when the reader connected
+                last = json.loads(stream.readline())
+
+        assert last == {"index": "last"}
+
+        reader.close()
+        stalled.close()
+
+    finally:
+        server.close()
+
+
+def test_telemetry_server_close() -> None:
+    server = utils.TelemetryServer("127.0.0.1:0", buffer=64, client_buffer=1 << 25)
+    reader = utils.TelemetryServer.connect(server.address)
+    try:
+        deadline = time.monotonic() + 5
+        while server.clients == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # Far more than a single send can pass to the socket, all of it must arrive after closing
+        for index in range(64):
+            assert server.publish({"index": index, "padding": "x" * (1 << 18)})
+
+        closing = threading.Thread(target=server.close)
+        closing.start()
+        with reader.makefile("rb") as stream:
+            indices = [json.loads(line)["index"] for line in stream]
+
+        closing.join()
+        assert indices == list(range(64))
+        assert server.dropped == 0
+
+    finally:
+        reader.close()
+        server.close()
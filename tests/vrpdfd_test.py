@@ -1,6 +1,28 @@
-from typing import Optional
+import contextlib
+import gc
+import itertools
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, FrozenSet, Iterator, List, Optional, Tuple
 
-from ga import utils, vrpdfd
+from ga import GeneticAlgorithmEvent, utils, vrpdfd
+
+
+@contextlib.contextmanager
+def uncached_local_search() -> Iterator[None]:
+    # Tests measuring the search itself must not hit the outcomes of earlier searches
+    capacity = vrpdfd.local_search_cache_info()["capacity"]
+    vrpdfd.setup_local_search_cache(0)
+    try:
+        yield
+    finally:
+        vrpdfd.setup_local_search_cache(capacity)
 
 
 def check_solution(solution: Optional[vrpdfd.VRPDFDSolution], *, expected: Optional[float] = None) -> None:
@@ -220,3 +242,680 @@ def test_decode_20_20_3() -> None:
     assert utils.isclose(solution.revenue, 28675.0)
     assert utils.isclose(solution.truck_cost, 26689.2)
     assert utils.isclose(solution.drone_cost, 3056.25)
+
+
+def test_sortie_catalogue_10_5_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("10.5.3")
+    try:
+        assert config.setup_sorties(2) > 0
+        for customer in range(1, len(config.customers)):
+            for index in range(vrpdfd.utils.sorties_count(customer)):
+                distance, ordered = vrpdfd.utils.sortie(customer, index)
+                assert customer in ordered
+                assert ordered[0] == ordered[-1] == 0
+                assert utils.isclose(distance, vrpdfd.VRPDFDIndividual.calculate_distance(ordered))
+                assert distance <= config.drone.speed * config.drone.time_limit
+
+        reachable = [customer for customer in range(1, len(config.customers)) if vrpdfd.utils.sorties_count(customer) > 0]
+        for first, second in itertools.combinations(reachable, 2):
+            shortest = min(vrpdfd.VRPDFDIndividual.calculate_distance(ordered) for ordered in ([0, first, second, 0], [0, second, first, 0]))
+            assert vrpdfd.utils.sortie_compatible(first, second) == (shortest <= config.drone.speed * config.drone.time_limit)
+
+    finally:
+        config.setup_sorties(0)
+
+
+def test_sortie_catalogue_local_search_50_30_1() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("50.30.1")
+    config.mutation_rate = 0.1
+    population = vrpdfd.VRPDFDIndividual.initial(solution_cls=vrpdfd.VRPDFDSolution, size=10, verbose=False)
+    try:
+        config.setup_sorties(2)
+        with uncached_local_search():
+            before = vrpdfd.local_search_info()
+            for individual in population:
+                # The drone paths ruled out by the catalogue are skipped, they are never feasible
+                feasible, _ = vrpdfd.utils.local_search(individual, lambda _: None, fine_coefficient=(0.0, 0.0))
+                assert feasible is None or feasible.feasible()
+                if individual.feasible():
+                    assert feasible is not None and (feasible.cost <= individual.cost or utils.isclose(feasible.cost, individual.cost))
+
+            assert vrpdfd.local_search_info()["evaluations"] > before["evaluations"]
+
+    finally:
+        config.setup_sorties(0)
+
+
+def test_distance_matrix_storage() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("12.10.1")
+    locations = [customer.location for customer in config.customers]
+    dense = config.distance_view
+    assert isinstance(dense, memoryview)
+    for storage in ("float", "lazy"):
+        matrix = vrpdfd.utils.DistanceMatrix(locations, storage=storage)
+        assert len(matrix) == len(config.customers)
+        for first in range(len(matrix)):
+            for second in range(len(matrix)):
+                assert dense[first, second] == config.distances[first, second]
+                assert utils.isclose(matrix[first, second], config.distances[first, second])
+
+
+def test_compiled_problem_20_20_3() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        vrpdfd.ProblemConfig.compiled_directory = directory
+        try:
+            source = vrpdfd.ProblemConfig("20.20.3")
+            source.setup_neighbors(5)
+            sorties_count = source.setup_sorties(2)
+            assert os.path.dirname(source.compile()) == directory
+
+            expected_neighbors = [vrpdfd.utils.nearest_customers(customer) for customer in range(len(source.customers))]
+            expected_sorties = [
+                [vrpdfd.utils.sortie(customer, index) for index in range(vrpdfd.utils.sorties_count(customer))]
+                for customer in range(len(source.customers))
+            ]
+
+            config = vrpdfd.ProblemConfig("20.20.3")
+            assert config.compiled is not None
+            assert config.customers == source.customers
+            assert config.truck == source.truck
+            assert config.drone == source.drone
+            assert memoryview(config.distances).tolist() == memoryview(source.distances).tolist()
+
+            config.setup_neighbors(5)
+            assert config.setup_sorties(2) == sorties_count
+            assert [vrpdfd.utils.nearest_customers(customer) for customer in range(len(config.customers))] == expected_neighbors
+            assert [
+                [vrpdfd.utils.sortie(customer, index) for index in range(vrpdfd.utils.sorties_count(customer))]
+                for customer in range(len(config.customers))
+            ] == expected_sorties
+
+        finally:
+            vrpdfd.ProblemConfig.compiled_directory = None
+
+
+def test_distance_matrix_wraps_buffer() -> None:
+    points = [(0.0, 0.0), (3.0, 4.0), (6.0, 8.0)]
+    data = memoryview(bytearray(memoryview(vrpdfd.utils.DistanceMatrix(points)))).cast("d")
+    distances = vrpdfd.utils.DistanceMatrix(points, data=data)
+    assert distances[0, 1] == 5.0
+
+    # The matrix reads the buffer in place instead of copying it
+    data[1] = 42.0
+    assert distances[0, 1] == 42.0
+    assert memoryview(distances)[0, 1] == 42.0
+
+
+def test_lazy_imports() -> None:
+    # Use a fresh interpreter, the test session itself may have loaded these modules already
+    code = """
+import json, sys, time
+start = time.perf_counter()
+import ga.vrpdfd
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, sorted(m for m in sys.modules if m.split(".")[0] in ("matplotlib", "tqdm", "colorama"))]))
+"""
+    elapsed, loaded = json.loads(subprocess.run([sys.executable, "-c", code], capture_output=True, check=True, text=True).stdout)
+    print(f"Imported ga.vrpdfd in {elapsed:.4f}s")
+    assert loaded == []
+    # Importing matplotlib.pyplot, tqdm and colorama alone takes close to a second
+    assert elapsed < 0.5
+
+
+def test_bounded_memory_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    capacity = vrpdfd.VRPDFDIndividual.cache.capacity
+    vrpdfd.VRPDFDIndividual.cache.capacity = 500
+
+    def rss() -> int:
+        with open("/proc/self/statm", encoding="utf-8") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    def live() -> int:
+        return sum(isinstance(o, vrpdfd.VRPDFDIndividual) for o in gc.get_objects())
+
+    def run() -> vrpdfd.VRPDFDIndividual:
+        return vrpdfd.VRPDFDIndividual.genetic_algorithm(
+            generations_count=60,
+            population_size=20,
+            population_expansion_limit=40,
+            solution_cls=vrpdfd.VRPDFDSolution,
+            verbose=False,
+        )
+
+    # Without reference cycles between derived objects, evicted individuals are freed by reference
+    # counting alone, so the cyclic garbage collector is disabled to expose any leak
+    gc.disable()
+    try:
+        run()
+        memory, count = rss(), live()
+        for _ in range(4):
+            result = run()
+
+        print(f"RSS grew by {(rss() - memory) / 2 ** 20:.2f} MB, live individuals {count} -> {live()}")
+        assert rss() - memory < 8 * 2 ** 20
+        assert live() < 2 * count
+
+        solution = result.decode()
+        restored = pickle.loads(pickle.dumps(result))
+        # The cost of the result may come from the local search solution it was built with, the
+        # restored individual decodes its genome instead
+        assert (restored.truck_paths, restored.drone_paths) == (result.truck_paths, result.drone_paths)
+        assert pickle.loads(pickle.dumps(solution)).cost == solution.cost
+
+    finally:
+        gc.enable()
+        vrpdfd.VRPDFDIndividual.cache.capacity = capacity
+
+
+def test_cold_cache_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    capacity = vrpdfd.VRPDFDIndividual.cache.capacity
+    path_capacity = vrpdfd.path_cache_info()["capacity"]
+    local_search_capacity = vrpdfd.local_search_cache_info()["capacity"]
+    vrpdfd.VRPDFDIndividual.setup_cache(200, cold_capacity=100000)
+    try:
+        vrpdfd.VRPDFDIndividual.genetic_algorithm(
+            generations_count=30,
+            population_size=20,
+            population_expansion_limit=40,
+            solution_cls=vrpdfd.VRPDFDSolution,
+            verbose=False,
+        )
+
+        cold_cache = vrpdfd.VRPDFDIndividual.cold_cache
+        print(cold_cache.to_json())
+        assert cold_cache.cached > 0
+        assert cold_cache.hit > 0
+
+        # Individuals rebuilt from the cold tier match the ones the hot tier returned
+        cache = vrpdfd.VRPDFDIndividual.cache
+        keys = [key for key, _ in cache.items()]
+        expected = [vrpdfd.VRPDFDIndividual.from_cache(solution_cls=vrpdfd.VRPDFDSolution, truck_paths=truck_paths, drone_paths=drone_paths) for truck_paths, drone_paths in keys]
+        cache.memory = 1  # demote everything
+        cache.memory = 0
+        assert len(list(cache.items())) == 0
+
+        for (truck_paths, drone_paths), individual in zip(keys, expected):
+            rebuilt = vrpdfd.VRPDFDIndividual.from_cache(solution_cls=vrpdfd.VRPDFDSolution, truck_paths=truck_paths, drone_paths=drone_paths)
+            assert rebuilt is not individual
+            assert (rebuilt.truck_paths, rebuilt.drone_paths) == (individual.truck_paths, individual.drone_paths)
+            assert (rebuilt.cost, rebuilt.violation) == (individual.cost, individual.violation)
+            assert rebuilt.decode().cost == individual.decode().cost
+
+    finally:
+        vrpdfd.VRPDFDIndividual.setup_cache(capacity)
+        vrpdfd.setup_path_cache(path_capacity)
+        vrpdfd.setup_local_search_cache(local_search_capacity)
+
+
+def test_pack_paths_large_customers() -> None:
+    # The cold tier must hold the paths of instances with thousands of customers
+    from ga.vrpdfd.individuals import _pack_paths, _unpack_paths
+
+    truck_paths: Tuple[FrozenSet[int], ...] = (frozenset({0, 2100}), frozenset(), frozenset({5, 4999}))
+    drone_paths: Tuple[Tuple[FrozenSet[int], ...], ...] = ((frozenset({0, 65535}),), (), (frozenset({7}), frozenset({0, 2040, 2047})))
+    assert _unpack_paths(_pack_paths(truck_paths, drone_paths)) == (truck_paths, drone_paths)
+
+
+def test_population_statistics_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    population = vrpdfd.VRPDFDIndividual.initial(solution_cls=vrpdfd.VRPDFDSolution, size=40, verbose=False)
+    fine_coefficient = vrpdfd.VRPDFDSolution.fine_coefficient
+
+    statistics = vrpdfd.PopulationStatistics(population)
+    individuals = statistics.individuals
+    assert statistics.costs(fine_coefficient).tolist() == [i.cost for i in individuals]
+    assert [individuals[index] for index in statistics.ranks(fine_coefficient)] == sorted(individuals, key=lambda i: i.penalized_cost)
+    assert statistics.feasible_count() == sum(i.feasible() for i in individuals)
+    assert utils.isclose(statistics.average_violation(), [sum(i.violation[index] for i in individuals) / len(individuals) for index in range(2)])
+
+    # Tuning counts every genome once, however many times the population holds it
+    assert statistics.distinct() is statistics
+    assert vrpdfd.PopulationStatistics([*individuals, *individuals]).distinct().individuals == individuals
+
+    vrpdfd.VRPDFDSolution.tune_fine_coefficients([*individuals, *individuals[:5]])
+    expected = vrpdfd.VRPDFDSolution.fine_coefficient
+    vrpdfd.VRPDFDSolution.fine_coefficient = fine_coefficient
+    vrpdfd.VRPDFDSolution.tune_fine_coefficients(individuals)
+    assert utils.isclose(vrpdfd.VRPDFDSolution.fine_coefficient, expected)
+    vrpdfd.VRPDFDSolution.fine_coefficient = fine_coefficient
+
+    # The selection keeps the best feasible individuals, leaving half of the places to the infeasible ones
+    frozen = frozenset(population)
+    ordered = sorted(frozen, key=lambda i: i.penalized_cost)
+    feasible = [i for i in ordered if i.feasible()]
+    infeasible = [i for i in ordered if not i.feasible()]
+    while len(feasible) > 10 and len(feasible) + len(infeasible) > 20:
+        feasible.pop()
+
+    assert vrpdfd.VRPDFDIndividual.selection(population=frozen, size=20) == set(feasible + infeasible[:20 - len(feasible)])
+
+
+def test_fined_cost_follows_fine_coefficient_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    population = vrpdfd.VRPDFDIndividual.initial(solution_cls=vrpdfd.VRPDFDSolution, size=20, verbose=False)
+    original = vrpdfd.VRPDFDSolution.fine_coefficient
+    try:
+        for fine_coefficient in ((1000.0, 500.0), (2.0, 3.0), original):
+            vrpdfd.VRPDFDSolution.fine_coefficient = fine_coefficient
+            for individual in population:
+                for evaluated in (individual, individual.decode()):
+                    time_violation, weight_violation = evaluated.violation
+                    assert evaluated.cost == evaluated.base_cost + (fine_coefficient[0] * time_violation + fine_coefficient[1] * weight_violation)
+
+    finally:
+        vrpdfd.VRPDFDSolution.fine_coefficient = original
+
+
+def test_serialization_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    population = list(vrpdfd.VRPDFDIndividual.initial(solution_cls=vrpdfd.VRPDFDSolution, size=20, verbose=False))
+    solutions = [individual.decode() for individual in population]
+
+    data = vrpdfd.dumps(individuals=population, solutions=solutions)
+    individuals, restored = vrpdfd.loads(data)
+    for individual, original in itertools.chain(zip(individuals, population), (zip(map(pickle.loads, map(pickle.dumps, population)), population))):
+        assert individual == original
+        assert (individual.base_cost, individual.violation) == (original.base_cost, original.violation)
+
+    for solution, expected in zip(restored, solutions, strict=True):
+        assert (solution.truck_paths, solution.drone_paths) == (expected.truck_paths, expected.drone_paths)
+        assert (solution.truck_distances, solution.drone_distances) == (expected.truck_distances, expected.drone_distances)
+        assert solution.cost == expected.cost
+
+    assert len(individuals) == len(population)
+    try:
+        vrpdfd.loads(data[:-1])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Truncated data must be rejected")
+
+
+def test_genetic_algorithm_iter_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    config.reset_after = 5
+    config.stuck_penalty_increase_rate = 1.0
+    config.local_search_batch = 5
+    config.local_search_queue = 5
+
+    events: List[GeneticAlgorithmEvent[vrpdfd.VRPDFDIndividual]] = []
+    for event in vrpdfd.VRPDFDIndividual.genetic_algorithm_iter(
+        generations_count=100,
+        population_size=20,
+        population_expansion_limit=40,
+        solution_cls=vrpdfd.VRPDFDSolution,
+        verbose=False,
+    ):
+        events.append(event)
+        if event.result.feasible():
+            check_solution(event.result.decode())
+            assert event.solution.cost == event.result.decode().cost
+            if event.generation > 10:
+                break  # good enough
+
+    try:
+        assert events[0].generation == 0
+        assert all(event.improved for event in events)
+        assert all(first.generation < second.generation and first.elapsed < second.elapsed for first, second in itertools.pairwise(events))
+        feasible = [event.result.cost for event in events if event.result.feasible()]
+        assert feasible == sorted(feasible, reverse=True)
+
+        # Stopping early still stops the background local search
+        assert not any(thread.name.startswith("ThreadPoolExecutor") for thread in threading.enumerate())
+
+    finally:
+        config.reset_after = config.stuck_penalty_increase_rate = None
+        config.local_search_batch = config.local_search_queue = None
+
+
+def test_genetic_algorithm_interrupt_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    config.reset_after = 5
+    config.stuck_penalty_increase_rate = 1.0
+    config.local_search_batch = 5
+    kwargs: Dict[str, Any] = {"population_size": 20, "population_expansion_limit": 40, "solution_cls": vrpdfd.VRPDFDSolution, "verbose": False}
+    try:
+        best = vrpdfd.VRPDFDIndividual.genetic_algorithm(generations_count=30, **kwargs)
+    finally:
+        config.reset_after = config.stuck_penalty_increase_rate = config.local_search_batch = None
+
+    assert best.feasible()
+    original = vrpdfd.VRPDFDIndividual.after_generation_hook
+    expected: List[vrpdfd.VRPDFDIndividual] = []
+
+    def after_generation_hook(**hook_kwargs: Any) -> None:
+        original(**hook_kwargs)
+        if hook_kwargs["generation"] == 2:
+            # An improvement reported during the interrupted generation is kept
+            hook_kwargs["updater"](best)
+            expected.append(min(hook_kwargs["result"], best))
+            raise KeyboardInterrupt
+
+    interrupted: List[vrpdfd.VRPDFDIndividual] = []
+
+    def on_interrupt(individual: vrpdfd.VRPDFDIndividual) -> vrpdfd.VRPDFDIndividual:
+        interrupted.append(individual)
+        return individual
+
+    hook = vars(vrpdfd.VRPDFDIndividual)["after_generation_hook"]
+    setattr(vrpdfd.VRPDFDIndividual, "after_generation_hook", after_generation_hook)
+    try:
+        result = vrpdfd.VRPDFDIndividual.genetic_algorithm(generations_count=100, on_interrupt=on_interrupt, **kwargs)
+    finally:
+        setattr(vrpdfd.VRPDFDIndividual, "after_generation_hook", hook)
+
+    assert result is expected[0]
+    assert interrupted == [result]
+
+
+def test_native_evaluation_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    fine_coefficient = (1000.0, 500.0)
+    original, vrpdfd.VRPDFDSolution.fine_coefficient = vrpdfd.VRPDFDSolution.fine_coefficient, fine_coefficient
+    try:
+        population = vrpdfd.VRPDFDIndividual.initial(solution_cls=vrpdfd.VRPDFDSolution, size=20, verbose=False)
+        for individual in population:
+            cost, violation = vrpdfd.utils.evaluate(individual.truck_paths, individual.drone_paths, fine_coefficient=fine_coefficient)
+
+            # Decode from scratch, cached individuals may hold the solution of an equivalent genome
+            solution = vrpdfd.VRPDFDIndividual(
+                solution_cls=vrpdfd.VRPDFDSolution,
+                truck_paths=individual.truck_paths,
+                drone_paths=individual.drone_paths,
+            ).decode()
+            assert utils.isclose(cost, solution.cost)
+            assert utils.isclose(violation, solution.violation)
+
+            feasible, any = vrpdfd.utils.local_search(individual, lambda _: None, fine_coefficient=fine_coefficient)
+            assert feasible is None or feasible.feasible()
+            assert any.cost <= individual.cost or utils.isclose(any.cost, individual.cost)
+
+    finally:
+        vrpdfd.VRPDFDSolution.fine_coefficient = original
+
+
+def test_parallel_local_search_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    config.reset_after = 10
+    config.stuck_penalty_increase_rate = 10.0
+    config.local_search_batch = 8
+    config.local_search_workers = 4
+    name = "_VRPDFDIndividual__two_layer_local_search"
+    original = vars(vrpdfd.VRPDFDIndividual)[name]
+    searched: Dict[vrpdfd.VRPDFDIndividual, List[vrpdfd.VRPDFDIndividual]] = {}
+
+    def two_layer_local_search(individual: vrpdfd.VRPDFDIndividual, **kwargs: Any) -> Tuple[List[vrpdfd.VRPDFDIndividual], List[vrpdfd.VRPDFDIndividual]]:
+        results, updates = original.__func__(individual, **kwargs)
+        searched[individual] = results
+        return results, updates
+
+    setattr(vrpdfd.VRPDFDIndividual, name, staticmethod(two_layer_local_search))
+    try:
+        population = vrpdfd.VRPDFDIndividual.initial(solution_cls=vrpdfd.VRPDFDSolution, size=20, verbose=False)
+        size = len(population)
+        result = min(population)
+        before = set(population)
+
+        updates: List[vrpdfd.VRPDFDIndividual] = []
+        vrpdfd.VRPDFDIndividual.after_generation_hook(
+            generation=config.reset_after,
+            last_improved=0,
+            result=result,
+            population=population,
+            verbose=False,
+            updater=updates.append,
+        )
+
+        # The searched individuals are replaced by their results in the population set. Results
+        # that coincide with each other or with the remaining individuals are merged, so the
+        # population only shrinks when there are fewer distinct genomes than places.
+        assert len(searched) == config.local_search_batch
+        candidates = [*(before - searched.keys()), *itertools.chain.from_iterable(searched.values())]
+        duplicates = len(candidates) - len({(i.truck_paths, i.drone_paths) for i in candidates})
+        assert len(population) == min(size, len(candidates) - duplicates)
+        assert population <= set(candidates)
+        assert all(individual.feasible() for individual in updates)
+
+    finally:
+        setattr(vrpdfd.VRPDFDIndividual, name, original)
+        config.reset_after = config.stuck_penalty_increase_rate = None
+        config.local_search_batch = config.local_search_workers = None
+
+
+def test_background_local_search_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    config.reset_after = 3
+    config.stuck_penalty_increase_rate = 10.0
+    config.local_search_batch = 4
+    config.local_search_queue = 4
+    config.local_search_workers = 1
+    jobs: Dict[vrpdfd.VRPDFDIndividual, Any] = getattr(vrpdfd.VRPDFDIndividual, "_VRPDFDIndividual__local_search_jobs")
+    population = vrpdfd.VRPDFDIndividual.initial(solution_cls=vrpdfd.VRPDFDSolution, size=20, verbose=False)
+    try:
+        size = len(population)
+        updates: List[vrpdfd.VRPDFDIndividual] = []
+
+        def after_generation(generation: int) -> None:
+            vrpdfd.VRPDFDIndividual.after_generation_hook(
+                generation=generation,
+                last_improved=0,
+                result=min(population),
+                population=population,
+                verbose=False,
+                updater=updates.append,
+            )
+
+        # The sources stay in the population until their results are injected
+        after_generation(3)
+        sources = set(jobs)
+        assert 0 < len(sources) <= 4
+        assert sources <= population
+
+        deadline = time.monotonic() + 60.0
+        while len(jobs) > 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+            after_generation(4)
+
+        assert len(jobs) == 0
+        assert len(population) <= size  # injections never oversize the population
+        # Injections may truncate away the sources of pending jobs, which are then cancelled
+        searched = [source for source in sources if source.local_searched]
+        assert len(searched) > 0
+        assert all(source not in population for source in sources.difference(searched))
+
+        results = set()
+        for source in searched:
+            for first, second in itertools.product((True, False), repeat=2):
+                results.add(source.local_search(prioritize_feasible=first, updater=lambda _: None).local_search(prioritize_feasible=second, updater=lambda _: None))
+
+        # Searches reaching a feasible candidate reported it, the updates were replayed on injection
+        assert len(results & population) > 0
+        assert all(individual.feasible() for individual in updates)
+        assert len(updates) > 0 or not any(individual.feasible() for individual in results)
+
+        # Eliminating the sources cancels pending jobs and stops running ones, without memoizing partial results
+        after_generation(6)
+        sources = set(jobs)
+        assert len(sources) > 0
+        population.difference_update(sources)
+        after_generation(7)
+        assert len(jobs) == 0
+
+        vrpdfd.VRPDFDIndividual.after_algorithm_hook(result=min(population), population=population, verbose=False)
+        assert not any(source.local_searched for source in sources)
+
+        stop = vrpdfd.utils.StopToken()
+        stop.stop()
+        with uncached_local_search():
+            before = vrpdfd.local_search_info()
+            individual = next(iter(population))
+            _, best = vrpdfd.utils.local_search(individual, updates.append, fine_coefficient=vrpdfd.VRPDFDSolution.fine_coefficient, stop=stop)
+            after = vrpdfd.local_search_info()
+
+        assert after["stopped"] == before["stopped"] + 1
+        assert after["evaluations"] - before["evaluations"] <= 1
+        assert best is individual
+
+    finally:
+        vrpdfd.VRPDFDIndividual.after_algorithm_hook(result=min(population), population=population, verbose=False)
+        config.reset_after = config.stuck_penalty_increase_rate = None
+        config.local_search_batch = config.local_search_queue = config.local_search_workers = None
+
+
+def test_background_local_search_shutdown_100_20_1() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("100.20.1")
+    config.mutation_rate = 0.1
+    config.reset_after = 1
+    config.stuck_penalty_increase_rate = 10.0
+    config.local_search_batch = 1
+    config.local_search_queue = 1
+    config.local_search_workers = 1
+    population = vrpdfd.VRPDFDIndividual.initial(solution_cls=vrpdfd.VRPDFDSolution, size=10, verbose=False)
+    try:
+        vrpdfd.VRPDFDIndividual.after_generation_hook(
+            generation=1,
+            last_improved=0,
+            result=min(population),
+            population=population,
+            verbose=False,
+            updater=lambda _: None,
+        )
+        time.sleep(0.1)
+
+        # Without a budget, a search on this problem runs for seconds
+        before = vrpdfd.local_search_info()
+        start = time.perf_counter()
+        vrpdfd.VRPDFDIndividual.after_algorithm_hook(result=min(population), population=population, verbose=False)
+        assert time.perf_counter() - start < 1.0
+        assert vrpdfd.local_search_info()["stopped"] > before["stopped"]
+
+    finally:
+        vrpdfd.VRPDFDIndividual.after_algorithm_hook(result=min(population), population=population, verbose=False)
+        config.reset_after = config.stuck_penalty_increase_rate = None
+        config.local_search_batch = config.local_search_queue = config.local_search_workers = None
+
+
+def test_budgeted_local_search_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    fine_coefficient = vrpdfd.VRPDFDSolution.fine_coefficient
+
+    population = vrpdfd.VRPDFDIndividual.initial(solution_cls=vrpdfd.VRPDFDSolution, size=10, verbose=False)
+    with uncached_local_search():
+        for individual in population:
+            before = vrpdfd.local_search_info()
+            _, any = vrpdfd.utils.local_search(individual, lambda _: None, fine_coefficient=fine_coefficient, max_evaluations=5)
+            after = vrpdfd.local_search_info()
+
+            assert after["calls"] == before["calls"] + 1
+            assert after["evaluations"] - before["evaluations"] <= 5
+            assert any.cost <= individual.cost or utils.isclose(any.cost, individual.cost)
+
+            _, any = vrpdfd.utils.local_search(individual, lambda _: None, fine_coefficient=fine_coefficient, time_limit=0.0)
+            assert vrpdfd.local_search_info()["exhausted"] > after["exhausted"]
+
+
+def test_local_search_cache_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    fine_coefficient = vrpdfd.VRPDFDSolution.fine_coefficient
+    capacity = vrpdfd.local_search_cache_info()["capacity"]
+    vrpdfd.setup_local_search_cache(100)
+    try:
+        first, second = itertools.islice(vrpdfd.VRPDFDIndividual.initial(solution_cls=vrpdfd.VRPDFDSolution, size=5, verbose=False), 2)
+
+        def search(individual: vrpdfd.VRPDFDIndividual, **kwargs: Any) -> Tuple[Optional[vrpdfd.VRPDFDIndividual], vrpdfd.VRPDFDIndividual, int]:
+            before = vrpdfd.local_search_info()
+            feasible, any = vrpdfd.utils.local_search(individual, lambda _: None, fine_coefficient=fine_coefficient, **kwargs)
+            return feasible, any, vrpdfd.local_search_info()["evaluations"] - before["evaluations"]
+
+        # A repeated search costs a single lookup
+        feasible, any, evaluations = search(first)
+        assert evaluations > 0
+        assert search(first) == (feasible, any, 0)
+        assert vrpdfd.local_search_cache_info()["hit"] == 1
+
+        # Searches stopped by their budget are not cached
+        search(second, max_evaluations=1)
+        assert vrpdfd.local_search_cache_info()["cached"] == 1
+
+        # Changing the setup invalidates the cached outcomes
+        config.setup_trade_limits(4, 4)
+        assert search(first)[2] == evaluations
+
+    finally:
+        vrpdfd.setup_local_search_cache(capacity)
+
+
+def test_deterministic_local_search_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    fine_coefficient = vrpdfd.VRPDFDSolution.fine_coefficient
+
+    def search(individual: vrpdfd.VRPDFDIndividual) -> Tuple[Optional[float], float, int]:
+        before = vrpdfd.local_search_info()
+        feasible, any = vrpdfd.utils.local_search(individual, lambda _: None, fine_coefficient=fine_coefficient)
+        return None if feasible is None else feasible.cost, any.cost, vrpdfd.local_search_info()["evaluations"] - before["evaluations"]
+
+    # The neighborhood order must not depend on the searches run in between
+    population = list(vrpdfd.VRPDFDIndividual.initial(solution_cls=vrpdfd.VRPDFDSolution, size=5, verbose=False))
+    with uncached_local_search():
+        expected = [search(individual) for individual in population]
+        assert [search(individual) for individual in reversed(population)] == expected[::-1]
+
+
+def test_trade_limits_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    try:
+        config.setup_trade_limits(16, 15)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Trade limits above 30 customers should be rejected")
+
+    assert (config.truck_trade_limit, config.drone_trade_limit) == (4, 4)
+
+    config.mutation_rate = 0.1
+    config.setup_trade_limits(6, 2)
+    try:
+        fine_coefficient = vrpdfd.VRPDFDSolution.fine_coefficient
+        for individual in vrpdfd.VRPDFDIndividual.initial(solution_cls=vrpdfd.VRPDFDSolution, size=5, verbose=False):
+            _, any = vrpdfd.utils.local_search(individual, lambda _: None, fine_coefficient=fine_coefficient)
+            assert any.cost <= individual.cost or utils.isclose(any.cost, individual.cost)
+
+    finally:
+        config.setup_trade_limits(4, 4)
+
+
+def test_granular_feasibility_20_20_3() -> None:
+    config = vrpdfd.ProblemConfig.quick_setup("20.20.3")
+    config.mutation_rate = 0.1
+    config.reset_after = 3
+    config.stuck_penalty_increase_rate = 10.0
+    config.local_search_batch = 10
+    config.setup_neighbors(5)
+    try:
+        result = vrpdfd.VRPDFDIndividual.genetic_algorithm(
+            generations_count=40,
+            population_size=50,
+            population_expansion_limit=100,
+            solution_cls=vrpdfd.VRPDFDSolution,
+            verbose=False,
+        )
+        check_solution(result.decode())
+
+    finally:
+        config.reset_after = config.stuck_penalty_increase_rate = config.local_search_batch = None
+        config.setup_neighbors(0)
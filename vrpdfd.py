@@ -3,14 +3,13 @@ import code
 import json
 import pickle
 import random
-import sys
 import time
 import traceback
 from pathlib import Path
-from typing import List, Optional, TYPE_CHECKING
+from typing import List, Literal, Optional, TYPE_CHECKING
 
 from ga import utils
-from ga.vrpdfd import InfeasibleSolution, ProblemConfig, VRPDFDIndividual, VRPDFDSolution, SolutionJSON, path_cache_info, setup_path_cache
+from ga.vrpdfd import InfeasibleSolution, ProblemConfig, VRPDFDIndividual, VRPDFDSolution, SolutionJSON, dumps, local_search_cache_info, local_search_info, path_cache_info, trace_path_cache
 
 
 class Namespace(argparse.Namespace):
@@ -22,12 +21,27 @@ class Namespace(argparse.Namespace):
         reset_after: int
         stuck_penalty_increase_rate: float
         local_search_batch: int
+        local_search_time_limit: Optional[float]
+        local_search_evaluations: Optional[int]
+        local_search_queue: int
+        local_search_workers: int
+        sortie_limit: int
+        neighbors_limit: int
+        truck_trade_limit: int
+        drone_trade_limit: int
+        distance_storage: Literal["double", "float", "lazy"]
         verbose: bool
         cache_limit: int
+        cold_cache_limit: int
+        cache_memory: Optional[int]
+        cache_policy: utils.CachePolicy
+        cache_trace: Optional[str]
         fake_tsp_solver: bool
         dump: List[str]
         extra: Optional[str]
         log: Optional[str]
+        log_format: utils.LogFormat
+        telemetry: Optional[str]
         interactive: bool
 
 
@@ -39,12 +53,27 @@ parser.add_argument("--mutation-rate", default=0.1, type=float, help="the mutati
 parser.add_argument("--reset-after", default=10, type=int, help="the number of non-improving generations before applying stuck penalty and local search")
 parser.add_argument("--stuck-penalty-increase-rate", default=0, type=float, help="the stuck penalty increase rate")
 parser.add_argument("--local-search-batch", default=50, type=int, help="the batch size for local search")
+parser.add_argument("--local-search-time-limit", type=float, help="the wall-clock seconds allowed for the local search of each individual (default: unlimited)")
+parser.add_argument("--local-search-evaluations", type=int, help="the maximum number of candidates evaluated by each local search call (default: unlimited)")
+parser.add_argument("--local-search-queue", default=0, type=int, help="run the reset-phase local search in the background with at most this many pending jobs (0 to block the algorithm instead)")
+parser.add_argument("--local-search-workers", default=1, type=int, help="the number of threads running a local search batch in parallel")
+parser.add_argument("--sortie-limit", default=0, type=int, help="precompute all feasible drone sorties serving up to this number of customers (0 to disable)")
+parser.add_argument("--neighbors-limit", default=0, type=int, help="restrict mutation and local search to this number of nearest customers (0 to consider all customers)")
+parser.add_argument("--truck-trade-limit", default=4, type=int, help="the number of truck-only customers that local search may move to drones")
+parser.add_argument("--drone-trade-limit", default=4, type=int, help="the number of drone-only customers that local search may move to trucks")
+parser.add_argument("--distance-storage", default="double", choices=["double", "float", "lazy"], type=str, help="storage of the distance matrix, \"lazy\" computes distances on demand for very large problems")
 parser.add_argument("-v", "--verbose", action="store_true", help="turn on verbose mode")
-parser.add_argument("--cache-limit", default=100000, type=int, help="set limit for individuals and TSP cache")
+parser.add_argument("--cache-limit", default=100000, type=int, help="set limit for individuals, TSP and local search cache")
+parser.add_argument("--cold-cache-limit", default=0, type=int, help="keep up to this many individuals evicted from the cache in a packed form, so that they are not decoded again")
+parser.add_argument("--cache-memory", type=utils.parse_size, help="share a byte budget (e.g. 512M, 4G) between the individuals, TSP and local search cache, on top of --cache-limit (default: unlimited)")
+parser.add_argument("--cache-policy", default="lru", choices=["lru", "clock", "slru", "tinylfu"], type=str, help="the eviction policy of the individuals, TSP and local search cache")
+parser.add_argument("--cache-trace", type=str, help="log the requests to the individuals and TSP cache to individual.trace and tsp.trace in this directory, see scripts/cache-simulator.py")
 parser.add_argument("--fake-tsp-solver", action="store_true", help="use fake TSP solver")
-parser.add_argument("--dump", nargs="*", default=[], type=str, help="dump the solution to a file(s), supports *.json, *.pkl and *.png")
+parser.add_argument("--dump", nargs="*", default=[], type=str, help="dump the solution to a file(s), supports *.json, *.pkl, *.bin (see ga.vrpdfd.loads) and *.png")
 parser.add_argument("--extra", type=str, help="extra data dump to file specified by --dump")
 parser.add_argument("--log", type=str, help="log each generation to a file")
+parser.add_argument("--log-format", default="csv", choices=["csv", "jsonl", "binary"], type=str, help="the format of --log, \"binary\" logs can be read with ga.utils.read_log")
+parser.add_argument("--telemetry", type=str, help="publish an event per generation as JSON lines to the clients of this local socket, \"unix:<path>\" or \"[host:]port\", see scripts/vrpdfd-telemetry.py")
 parser.add_argument("--interactive", action="store_true", help="open interactive shell after running the algorithm")
 
 
@@ -58,38 +87,40 @@ if namespace.fake_tsp_solver:
     print(f"Using fake TSP solver {utils.tsp_solver!r}")
 
 
+ProblemConfig.distance_storage = namespace.distance_storage
 config = ProblemConfig.get_config(namespace.problem)
 ProblemConfig.context = namespace.problem
 config.mutation_rate = namespace.mutation_rate
 config.reset_after = namespace.reset_after
 config.stuck_penalty_increase_rate = namespace.stuck_penalty_increase_rate
 config.local_search_batch = namespace.local_search_batch
-
-VRPDFDIndividual.cache.capacity = namespace.cache_limit
-setup_path_cache(namespace.cache_limit)
+config.local_search_time_limit = namespace.local_search_time_limit
+config.local_search_evaluations = namespace.local_search_evaluations
+config.local_search_queue = namespace.local_search_queue
+config.local_search_workers = namespace.local_search_workers
+config.setup_neighbors(namespace.neighbors_limit)
+config.setup_sorties(namespace.sortie_limit)
+config.setup_trade_limits(namespace.truck_trade_limit, namespace.drone_trade_limit)
+
+VRPDFDIndividual.setup_cache(namespace.cache_limit, policy=namespace.cache_policy, cold_capacity=namespace.cold_cache_limit)
+if namespace.cache_memory is not None:
+    VRPDFDIndividual.setup_cache_memory(namespace.cache_memory)
+
+if namespace.cache_trace is not None:
+    trace_directory = Path(namespace.cache_trace)
+    trace_directory.mkdir(parents=True, exist_ok=True)
+    VRPDFDIndividual.cache.trace(str(trace_directory / "individual.trace"))
+    trace_path_cache(str(trace_directory / "tsp.trace"))
 
 if namespace.log is not None:
     log_path = Path(namespace.log)
     log_path.parent.mkdir(parents=True, exist_ok=True)
 
-    config.logger = log_path.open("w", encoding="utf-8")
-    config.logger.write(
-        ",".join(
-            (
-                "Generation",
-                "Current result",
-                "Population best",
-                "Population worst",
-                "Population average",
-                "Feasible count",
-                "Time violation coefficient",
-                "Weight violation coefficient",
-                "Average time violation",
-                "Average weight violation",
-            ),
-        ),
-    )
-    config.logger.write("\n")
+    config.logger = utils.LogSink(str(log_path), format=namespace.log_format)
+
+if namespace.telemetry is not None:
+    config.telemetry = utils.TelemetryServer(namespace.telemetry)
+    print(f"Publishing telemetry on {config.telemetry.address}")
 
 
 def on_interrupt(result: VRPDFDIndividual) -> VRPDFDIndividual:
@@ -114,6 +145,8 @@ try:
 
 finally:
     total_time = time.perf_counter() - start
+    VRPDFDIndividual.cache.trace(None)
+    trace_path_cache(None)
 
     try:
         solution = individual.decode()  # type: ignore  # pyright is so dumb
@@ -148,6 +181,8 @@ finally:
                     "reset_after": namespace.reset_after,
                     "stuck_penalty_increase_rate": namespace.stuck_penalty_increase_rate,
                     "local_search_batch": namespace.local_search_batch,
+                    "local_search_time_limit": namespace.local_search_time_limit,
+                    "local_search_evaluations": namespace.local_search_evaluations,
                     "solution": solution.to_json(),
                     "time": total_time,
                     "fake_tsp_solver": namespace.fake_tsp_solver,
@@ -155,25 +190,29 @@ finally:
                     "extra": namespace.extra,
                     "cache_info": {
                         "limit": namespace.cache_limit,
+                        "cold_limit": namespace.cold_cache_limit,
+                        "memory": namespace.cache_memory,
+                        "policy": namespace.cache_policy,
                         "individual": VRPDFDIndividual.cache.to_json(),
+                        "cold_individual": VRPDFDIndividual.cold_cache.to_json(),
                         "tsp": path_cache_info(),
+                        "local_search": local_search_cache_info(),
                     },
+                    "local_search_info": local_search_info(),
                 }
                 json.dump(data, json_file)
 
             print(f"Saved solution as JSON to {dump_path}")
 
         elif path.endswith(".pkl"):
-            sys.setrecursionlimit(100000)
-            try:
-                with dump_path.open("wb") as pickle_file:
-                    pickle.dump(solution.encode(), pickle_file)
+            with dump_path.open("wb") as pickle_file:
+                pickle.dump(solution.encode(), pickle_file)
 
-            except RecursionError:
-                traceback.print_exc()
+            print(f"Pickled solution to {dump_path}")
 
-            else:
-                print(f"Pickled solution to {dump_path}")
+        elif path.endswith(".bin"):
+            dump_path.write_bytes(dumps(individuals=[solution.encode()], solutions=[solution]))
+            print(f"Serialized solution to {dump_path}")
 
         elif path.endswith(".png"):
             solution.plot(path)
@@ -186,6 +225,9 @@ finally:
         config.logger.close()
         print(f"Saved log to {namespace.log}")
 
+    if config.telemetry is not None:
+        config.telemetry.close()
+
 
 if namespace.interactive:
     code.interact(local=locals())